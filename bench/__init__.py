@@ -0,0 +1,42 @@
+"""
+Benchmarks and the offline simulator.
+
+Most of them reset, truncate or rebuild the database they run against,
+so they run against BENCH_POSTGRES_URI, the way the tests run against
+TEST_POSTGRES_URI, and never against the shop's own POSTGRES_URI.
+Importing the package points POSTGRES_URI at BENCH_POSTGRES_URI before
+src.database builds its engines, and every script that writes to the
+database calls require_bench_database() first.
+"""
+import os
+import sys
+
+import dotenv
+import sqlalchemy
+
+dotenv.load_dotenv()
+BENCH_POSTGRES_URI = os.environ.get("BENCH_POSTGRES_URI")
+SHOP_POSTGRES_URI = os.environ.get("POSTGRES_URI")
+
+
+def same_database(first, second):
+    """Whether two connection URIs name the same database, whatever the driver or password."""
+    if not first or not second:
+        return False
+    first, second = sqlalchemy.engine.make_url(first), sqlalchemy.engine.make_url(second)
+    return (first.host, first.port, first.database, first.query.get("host")) == \
+        (second.host, second.port, second.database, second.query.get("host"))
+
+
+if BENCH_POSTGRES_URI and not same_database(BENCH_POSTGRES_URI, SHOP_POSTGRES_URI):
+    os.environ["POSTGRES_URI"] = BENCH_POSTGRES_URI
+
+
+def require_bench_database():
+    """Exit unless BENCH_POSTGRES_URI names a database other than the shop's POSTGRES_URI."""
+    if not BENCH_POSTGRES_URI:
+        sys.exit("BENCH_POSTGRES_URI is not set. It must name a disposable database: "
+                 "the benchmarks and the simulator reset it.")
+    if same_database(BENCH_POSTGRES_URI, SHOP_POSTGRES_URI):
+        sys.exit("BENCH_POSTGRES_URI names the shop's POSTGRES_URI database. "
+                 "The benchmarks and the simulator reset it, so point it at a disposable one.")
@@ -0,0 +1,173 @@
+"""
+Wholesale barrel planning: knapsack planner against the old heuristic.
+
+Times barrel_optimizer on catalogs of growing size, with the usual
+barrel sizes and with odd ones (gcd 1), then runs both planners
+through the same simulated days: a random slice of the wholesale
+catalog is offered each morning, each shop buys with 90% of its gold
+and sells through a fixed hidden color mix during the day, earning 50
+gold per 100 ml sold. The new planner sees the previous day's sales
+the way /barrels/plan reads them from potion_ledger; the
+old heuristic is the SKU-threshold, one-SKU-per-color planner it
+replaced. Nothing connects to the database, but the simulator's
+catalog is imported from bench.simulate, which needs POSTGRES_URI set.
+
+    POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim python -m bench.barrel_plan --days 60 --seeds 20
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+
+from bench.simulate import WHOLESALE_CATALOG, percentile
+from src.api import barrel_optimizer
+
+Barrel = namedtuple("Barrel", ["sku", "ml_per_barrel", "potion_type", "price", "quantity"])
+
+DISPOSABLE_GOLD = 0.9
+GOLD_PER_ML = 0.5
+# Hidden share of daily demand per color and the ml customers want a day.
+DEMAND_MIX = [0.35, 0.2, 0.15, 0.3]
+DAILY_DEMAND_ML = 4000
+# Barrel sizes timed: the usual ones, and odd ones whose gcd of 1 makes
+# the planner coarsen its ml unit.
+BARREL_SIZES = {
+    "round": [200, 500, 1000, 2500, 10000],
+    "odd": [199, 503, 1001, 2503, 10007],
+}
+
+
+def old_plan(catalog, gold, ml_capacity, available_ml, current_ml):
+    """The pre-knapsack /barrels/plan, with the per-type ml read from current_ml."""
+    plan = {}
+    catalog = sorted(enumerate(catalog), key=lambda item: item[1].ml_per_barrel / item[1].price, reverse=True)
+    dark_present = any(barrel.potion_type[3] == 1 for _, barrel in catalog)
+    colors_bought = set()
+    for index, barrel in catalog:
+        if "SMALL" in barrel.sku:
+            ml_threshold = int(ml_capacity * 0.2) if ml_capacity < 20000 else int(ml_capacity * 0.1)
+        elif "MEDIUM" in barrel.sku:
+            ml_threshold = int(ml_capacity / 3) if ml_capacity < 40000 else int(ml_capacity / 6)
+        elif "LARGE" in barrel.sku:
+            ml_threshold = ml_capacity / 3
+        else:
+            ml_threshold = 0
+        if dark_present:
+            ml_threshold = int(ml_threshold * 3 / 4)
+        color = barrel.potion_type.index(1)
+        if color not in colors_bought:
+            quantity = int(min(gold // barrel.price, available_ml // barrel.ml_per_barrel,
+                               (ml_threshold - current_ml[color]) // barrel.ml_per_barrel, barrel.quantity))
+            if quantity > 0:
+                plan[index] = quantity
+                gold -= barrel.price * quantity
+                available_ml -= barrel.ml_per_barrel * quantity
+                colors_bought.add(color)
+    return plan
+
+
+def new_plan(catalog, gold, ml_capacity, available_ml, current_ml, color_demand):
+    offered_colors = {barrel.potion_type.index(1) for barrel in catalog}
+    needs = barrel_optimizer.color_needs(ml_capacity, available_ml, current_ml, color_demand, offered_colors)
+    return barrel_optimizer.plan_purchase(catalog, needs, gold)
+
+
+def offered_catalog(rng):
+    """A random slice of the wholesale catalog with jittered prices and stock."""
+    catalog = []
+    for barrel in WHOLESALE_CATALOG:
+        if rng.random() < 0.7:
+            catalog.append(Barrel(barrel["sku"], barrel["ml_per_barrel"], barrel["potion_type"],
+                                  max(1, int(barrel["price"] * rng.uniform(0.8, 1.2))), rng.randint(1, 10)))
+    return catalog
+
+
+class Shop:
+    def __init__(self, gold, ml_capacity):
+        self.gold = gold
+        self.ml_capacity = ml_capacity
+        self.ml = [0, 0, 0, 0]
+        self.sold = [0, 0, 0, 0]
+        self.ml_bought = 0
+        self.gold_spent = 0
+        self.ml_sold = 0
+
+    def buy(self, catalog, plan):
+        for index, quantity in plan.items():
+            barrel = catalog[index]
+            self.ml[barrel.potion_type.index(1)] += barrel.ml_per_barrel * quantity
+            self.ml_bought += barrel.ml_per_barrel * quantity
+            self.gold -= barrel.price * quantity
+            self.gold_spent += barrel.price * quantity
+        assert self.gold >= 0 and sum(self.ml) <= self.ml_capacity
+
+    def sell(self, demand):
+        self.sold = [min(self.ml[c], demand[c]) for c in range(4)]
+        for c in range(4):
+            self.ml[c] -= self.sold[c]
+        self.ml_sold += sum(self.sold)
+        self.gold += int(sum(self.sold) * GOLD_PER_ML)
+
+
+def simulate(seed, days, ml_capacity):
+    rng = random.Random(seed)
+    old, new = Shop(100, ml_capacity), Shop(100, ml_capacity)
+    for _ in range(days):
+        catalog = offered_catalog(rng)
+        demand = [int(DAILY_DEMAND_ML * share * rng.uniform(0.5, 1.5)) for share in DEMAND_MIX]
+        for shop, planner in [(old, "old"), (new, "new")]:
+            budget = int(shop.gold * DISPOSABLE_GOLD)
+            available_ml = shop.ml_capacity - sum(shop.ml)
+            if planner == "old":
+                plan = old_plan(catalog, budget, shop.ml_capacity, available_ml, shop.ml)
+            else:
+                plan = new_plan(catalog, budget, shop.ml_capacity, available_ml, shop.ml, shop.sold)
+            shop.buy(catalog, plan)
+            shop.sell(demand)
+    return old, new
+
+
+def time_planner(skus, repeats, sizes):
+    rng = random.Random(skus)
+    samples = []
+    for _ in range(repeats):
+        catalog = [Barrel(f"BARREL_{i}", rng.choice(sizes),
+                          rng.choice([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]),
+                          rng.randint(40, 600), rng.randint(1, 20)) for i in range(skus)]
+        start = time.perf_counter()
+        new_plan(catalog, rng.randint(500, 20000), 100000, 100000, [0, 0, 0, 0], [0, 0, 0, 0])
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--skus", default="16,100,400,1000", help="comma separated catalog sizes to time")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--ml-capacity", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'sizes':>6}{'skus':>6}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, sizes in BARREL_SIZES.items():
+        for skus in [int(count) for count in args.skus.split(",")]:
+            samples = time_planner(skus, args.repeats, sizes)
+            print(f"{name:>6}{skus:>6}{percentile(samples, 50) * 1000:>10.2f}{percentile(samples, 99) * 1000:>10.2f}")
+
+    totals = {"old": Shop(0, 0), "new": Shop(0, 0)}
+    for seed in range(args.seeds):
+        for name, shop in zip(["old", "new"], simulate(seed, args.days, args.ml_capacity)):
+            totals[name].ml_bought += shop.ml_bought
+            totals[name].gold_spent += shop.gold_spent
+            totals[name].ml_sold += shop.ml_sold
+            totals[name].gold += shop.gold
+    print()
+    print(f"{'planner':>8}{'ml bought':>12}{'gold spent':>12}{'ml/gold':>9}{'ml sold':>10}{'end gold':>10}")
+    for name, shop in totals.items():
+        print(f"{name:>8}{shop.ml_bought:>12}{shop.gold_spent:>12}{shop.ml_bought / max(shop.gold_spent, 1):>9.2f}"
+              f"{shop.ml_sold:>10}{shop.gold // args.seeds:>10}")
+
+
+if __name__ == "__main__":
+    main()
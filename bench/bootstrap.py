@@ -0,0 +1,62 @@
+"""
+Build a disposable shop database from a clean checkout.
+
+Drops and recreates the public schema of the database in
+BENCH_POSTGRES_URI (never the shop's POSTGRES_URI), runs schema.sql
+(the starting tables and every migration after them) and stocks the
+potion catalog, so the simulator, the other benchmarks and the tests
+can run against it. Everything already in that schema is lost.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim \\
+        python -m bench.bootstrap
+"""
+import argparse
+import pathlib
+
+import sqlalchemy
+
+from bench import require_bench_database
+from src import database as db
+from src.api import generations
+
+SCHEMA_PATH = pathlib.Path(__file__).resolve().parent.parent / "schema.sql"
+POTIONS = [
+    ("RED_POTION", "red potion", 50, [100, 0, 0, 0]),
+    ("GREEN_POTION", "green potion", 50, [0, 100, 0, 0]),
+    ("BLUE_POTION", "blue potion", 55, [0, 0, 100, 0]),
+    ("DARK_POTION", "dark potion", 70, [0, 0, 0, 100]),
+    ("PURPLE_POTION", "purple potion", 60, [50, 0, 50, 0]),
+    ("TEAL_POTION", "teal potion", 60, [0, 50, 50, 0]),
+    ("YELLOW_POTION", "yellow potion", 60, [50, 50, 0, 0]),
+]
+
+
+def bootstrap(engine):
+    """Recreate the public schema from schema.sql and stock the catalog."""
+    catalog_sql = "INSERT INTO potion_catalog_items (sku, name, price, potion_type) VALUES (:sku, :name, :price, :potion_type)"
+    generations_sql = "SELECT nspname FROM pg_namespace WHERE nspname = :spare OR nspname LIKE :retired"
+    with engine.begin() as connection:
+        # Spare and retired game state generations from earlier runs go too.
+        for schema in connection.execute(sqlalchemy.text(generations_sql),
+                                         [{"spare": generations.SPARE_SCHEMA,
+                                           "retired": generations.RETIRED_PREFIX + "%"}]).scalars().all():
+            connection.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        connection.exec_driver_sql("DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public")
+        # schema.sql is many statements with % format strings in its
+        # functions, so it goes to the driver as one unparameterized string.
+        connection.connection.cursor().execute(SCHEMA_PATH.read_text())
+        connection.execute(sqlalchemy.text(catalog_sql),
+                           [{"sku": sku, "name": name, "price": price, "potion_type": potion_type}
+                            for sku, name, price, potion_type in POTIONS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.parse_args()
+    require_bench_database()
+    bootstrap(db.engine)
+    print(f"bootstrapped {db.engine.url.render_as_string(hide_password=True)} from {SCHEMA_PATH.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Bottling plans: vectorized planner against the old random planner.
+
+Builds random shop states (ml on hand, stock, potion capacity, today's
+visitors and their classes' purchase history) over the bootstrap
+recipes topped up with random mixes to each --recipes count, and plans
+each with bottle_optimizer.plan_bottling and with the old planner it
+replaced, which bottled one preferred recipe per sampled class and then
+random recipes in turn. Reports the share of ml on hand each bottles,
+the potions bottled, how much of the visitors' expected demand the
+stock then covers, and planning time. Nothing connects to the
+database, but the catalog and classes are imported from bench modules
+that need POSTGRES_URI set.
+
+    POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim python -m bench.bottle_plan --recipes 7,50,300
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from bench.bootstrap import POTIONS
+from bench.simulate import CLASSES, percentile
+from src.api import bottle_optimizer
+
+Potion = namedtuple("Potion", ["potion_type", "quantity"])
+
+
+def floor_division(ml_inventory, potion_type):
+    return min(ml_inventory[i] // potion_type[i] for i in range(4) if potion_type[i] > 0)
+
+
+def old_plan(rng, visits, preference_matrix, potions, ml_inventory, available_potions,
+             trained_threshold, threshold):
+    """The pre-vectorized /bottler/plan, returning {potion_type: quantity}."""
+    potions = list(potions)
+    plan = {}
+    weights = [(visit["character_class"], visit["total_characters"]) for visit in visits]
+    i = 0
+    while i <= 5 and len(weights) > 0:
+        selected_class = rng.choices([choice[0] for choice in weights], weights=[choice[1] for choice in weights])[0]
+        weights.pop([choice[0] for choice in weights].index(selected_class))
+        class_preferences = preference_matrix.get(selected_class, [])
+        if len(class_preferences) == 0:
+            continue
+        selected_potion = rng.choices([pref["potion_type"] for pref in class_preferences],
+                                      weights=[pref["amount_bought"] for pref in class_preferences])[0]
+        for potion in potions:
+            if potion.potion_type == selected_potion:
+                quantity = min(floor_division(ml_inventory, potion.potion_type),
+                               trained_threshold - potion.quantity, available_potions)
+                if quantity > 0:
+                    plan[tuple(potion.potion_type)] = quantity
+                    ml_inventory = [ml_inventory[c] - quantity * potion.potion_type[c] for c in range(4)]
+                    available_potions -= quantity
+                    i += 1
+                    potions.remove(potion)
+                    break
+    rng.shuffle(potions)
+    while available_potions > 0 and len(potions) > 0:
+        potion = potions.pop()
+        quantity = min(floor_division(ml_inventory, potion.potion_type), threshold - potion.quantity, available_potions)
+        if quantity > 0:
+            plan[tuple(potion.potion_type)] = plan.get(tuple(potion.potion_type), 0) + quantity
+            ml_inventory = [ml_inventory[c] - quantity * potion.potion_type[c] for c in range(4)]
+            available_potions -= quantity
+    return plan
+
+
+def recipe_book(rng, count):
+    """The bootstrap recipes followed by distinct random four-color mixes in steps of 5 (up to 976), with prices."""
+    recipes = {tuple(potion_type): price for _, _, price, potion_type in POTIONS}
+    while len(recipes) < count:
+        cuts = sorted(rng.sample(range(1, 20), 3))
+        potion_type = tuple(5 * (b - a) for a, b in zip([0] + cuts, cuts + [20]))
+        recipes.setdefault(potion_type, rng.randint(40, 80))
+    return [list(potion_type) for potion_type in recipes], list(recipes.values())
+
+
+def shop_state(rng, recipes):
+    potion_capacity = rng.randint(1, 4)
+    max_potion = potion_capacity * 50
+    threshold, trained_threshold = max_potion // 20, max_potion // 10
+    stock = [rng.randint(0, threshold) if rng.random() < 0.3 else 0 for _ in recipes]
+    while sum(stock) > max_potion // 2:
+        stock[rng.randrange(len(stock))] = 0
+    visits = [{"character_class": character_class, "total_characters": rng.randint(1, 20)}
+              for character_class in rng.sample(CLASSES, rng.randint(1, len(CLASSES)))]
+    preference_matrix = {character_class: [{"potion_type": potion_type, "amount_bought": rng.randint(1, 10)}
+                                           for potion_type in rng.sample(recipes, min(len(recipes), rng.randint(1, 4)))]
+                         for character_class in CLASSES if rng.random() < 0.8}
+    ml_inventory = [rng.randint(0, 5000) for _ in range(4)]
+    return {"stock": stock, "visits": visits, "preference_matrix": preference_matrix, "ml_inventory": ml_inventory,
+            "available_potions": max_potion - sum(stock), "threshold": threshold,
+            "trained_threshold": trained_threshold}
+
+
+def new_plan(recipes, prices, state):
+    demand = bottle_optimizer.expected_demand(recipes, state["visits"], state["preference_matrix"])
+    quantities = bottle_optimizer.plan_bottling(recipes, state["stock"], prices, demand, state["ml_inventory"],
+                                                state["available_potions"], state["trained_threshold"],
+                                                state["threshold"])
+    return {tuple(recipe): int(quantity) for recipe, quantity in zip(recipes, quantities) if quantity > 0}
+
+
+def score(recipes, state, plan):
+    """(ml bottled, potions bottled, expected demand covered by stock after bottling)."""
+    ml = sum(quantity * sum(potion_type) for potion_type, quantity in plan.items())
+    demand = bottle_optimizer.expected_demand(recipes, state["visits"], state["preference_matrix"])
+    stocked = np.array([stock + plan.get(tuple(recipe), 0) for recipe, stock in zip(recipes, state["stock"])])
+    return ml, sum(plan.values()), float(np.minimum(stocked, demand).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--recipes", default="7,50,300", help="comma separated recipe counts")
+    parser.add_argument("--states", type=int, default=200, help="random shop states per recipe count")
+    args = parser.parse_args()
+
+    print(f"{'recipes':>8}{'planner':>9}{'ml used':>9}{'potions':>9}{'demand met':>12}{'p50 ms':>9}{'p99 ms':>9}")
+    for count in [int(count) for count in args.recipes.split(",")]:
+        rng = random.Random(count)
+        recipes, prices = recipe_book(rng, count)
+        totals = {"old": [0, 0, 0.0, []], "new": [0, 0, 0.0, []]}
+        ml_on_hand = demand_total = 0
+        for _ in range(args.states):
+            state = shop_state(rng, recipes)
+            ml_on_hand += sum(state["ml_inventory"])
+            demand_total += bottle_optimizer.expected_demand(recipes, state["visits"], state["preference_matrix"]).sum()
+            for name in totals:
+                start = time.perf_counter()
+                if name == "old":
+                    potions = [Potion(recipe, stock) for recipe, stock in zip(recipes, state["stock"])]
+                    plan = old_plan(random.Random(rng.random()), state["visits"], state["preference_matrix"], potions,
+                                    state["ml_inventory"], state["available_potions"], state["trained_threshold"],
+                                    state["threshold"])
+                else:
+                    plan = new_plan(recipes, prices, state)
+                totals[name][3].append(time.perf_counter() - start)
+                ml, bottled, covered = score(recipes, state, plan)
+                totals[name][0] += ml
+                totals[name][1] += bottled
+                totals[name][2] += covered
+        for name, (ml, bottled, covered, samples) in totals.items():
+            samples.sort()
+            print(f"{count:>8}{name:>9}{ml / ml_on_hand:>9.1%}{bottled:>9}{covered / demand_total:>12.1%}"
+                  f"{percentile(samples, 50) * 1000:>9.2f}{percentile(samples, 99) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
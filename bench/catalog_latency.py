@@ -0,0 +1,136 @@
+"""
+GET /catalog/ latency as the potion ledger and recipe catalog grow.
+
+Seeds a disposable database (BENCH_POSTGRES_URI, reset through
+/admin/reset) with synthetic recipes, a potion ledger of the requested
+sizes and a day of visits with class preferences, then times uncached
+catalog builds at each size. The catalog reads the potion_balances
+materialization rather than aggregating potion_ledger, so latency should
+stay flat in the ledger size and grow only with the number of stocked
+recipes. Seeded tables are vacuumed before each size is timed; otherwise
+autovacuum working through the freshly appended ledger can land inside
+the samples and read as ledger-dependent latency.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.catalog_latency --recipes 10,100,1000 --ledger-rows 10000,1000000
+"""
+import argparse
+import os
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.simulate import CLASSES, percentile
+from src import database as db
+from src.api import planning_cache
+from src.api.server import app
+
+# Distinct two-to-three colour recipes that do not collide with the
+# default catalog; n indexes them.
+RECIPES_SQL = """
+    SELECT n, ARRAY[n % 51, (n / 51) % 51, 100 - n % 51 - (n / 51) % 51, 0] AS potion_type
+    FROM generate_series(1, 2600) AS n
+    WHERE n % 51 + (n / 51) % 51 < 100 AND (n % 51 > 0 OR (n / 51) % 51 > 0)
+"""
+
+
+def seed_recipes(connection, count):
+    connection.execute(sqlalchemy.text("DELETE FROM potion_catalog_items WHERE sku LIKE 'BENCH_%'"))
+    connection.execute(sqlalchemy.text(f"""
+        INSERT INTO potion_catalog_items (sku, name, price, potion_type)
+        SELECT 'BENCH_' || n, 'bench ' || n, 40 + n % 30, potion_type
+        FROM ({RECIPES_SQL}) AS recipes
+        ORDER BY n
+        LIMIT :count
+    """), {"count": count})
+
+
+def seed_ledger(connection, rows):
+    """Appends potion_ledger rows over the bench recipes and rebuilds potion_balances from them."""
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potion_ledger (potion_type, quantity)
+        SELECT recipes.potion_type, CASE WHEN i % 3 = 0 THEN -1 ELSE 1 END
+        FROM generate_series(1, :rows) AS i
+        JOIN (SELECT potion_type, row_number() OVER () - 1 AS slot,
+                     count(*) OVER () AS recipe_count
+              FROM potion_catalog_items WHERE sku LIKE 'BENCH_%') AS recipes
+          ON recipes.slot = i % recipes.recipe_count
+    """), {"rows": rows})
+    connection.execute(sqlalchemy.text("TRUNCATE potion_balances"))
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potion_balances (potion_type, quantity)
+        SELECT potion_type, SUM(quantity) FROM potion_ledger GROUP BY potion_type
+    """))
+
+
+def seed_demand(connection):
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO visits (customer_name, character_class, level, day)
+        SELECT 'bench_' || i, (:classes)[1 + i % cardinality(:classes)], 1 + i % 20, global_time.day
+        FROM generate_series(1, 200) AS i, global_time
+    """), {"classes": CLASSES})
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO class_preference_counts (character_class, potion_type, amount_bought)
+        SELECT character_class, potion_type, 1 + length(character_class) * n % 7
+        FROM unnest(CAST(:classes AS text[])) AS character_class,
+             (SELECT n, potion_type FROM potion_catalog_items
+              JOIN generate_series(1, 20) AS n ON sku = 'BENCH_' || n) AS recipes
+        ON CONFLICT (character_class, potion_type) DO NOTHING
+    """), {"classes": CLASSES})
+
+
+def settle():
+    """Vacuums and analyzes the seeded tables so autovacuum is not catching up on them while builds are timed."""
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sqlalchemy.text("VACUUM ANALYZE potion_ledger, potion_balances, potion_catalog_items"))
+
+
+def time_catalog(client, builds):
+    # One untimed build first, so the first size is not charged for warming
+    # connections and caches.
+    planning_cache.invalidate()
+    client.get("/catalog/").raise_for_status()
+    samples = []
+    for _ in range(builds):
+        planning_cache.invalidate()
+        start = time.perf_counter()
+        response = client.get("/catalog/")
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--recipes", default="10,100,1000", help="comma separated recipe counts")
+    parser.add_argument("--ledger-rows", default="10000,100000,1000000", help="comma separated ledger sizes")
+    parser.add_argument("--builds", type=int, default=50, help="uncached catalog builds per size")
+    args = parser.parse_args()
+    require_bench_database()
+    recipe_counts = [int(count) for count in args.recipes.split(",")]
+    ledger_sizes = sorted(int(rows) for rows in args.ledger_rows.split(","))
+
+    print(f"{'recipes':>8}{'ledger rows':>13}{'p50 ms':>10}{'p95 ms':>10}")
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        for recipe_count in recipe_counts:
+            client.post("/admin/reset").raise_for_status()
+            with db.engine.begin() as connection:
+                seed_recipes(connection, recipe_count)
+                seed_demand(connection)
+            seeded = 0
+            for rows in ledger_sizes:
+                with db.engine.begin() as connection:
+                    seed_ledger(connection, rows - seeded)
+                seeded = rows
+                settle()
+                samples = time_catalog(client, args.builds)
+                print(f"{recipe_count:>8}{rows:>13}"
+                      f"{percentile(samples, 50) * 1000:>10.2f}"
+                      f"{percentile(samples, 95) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+DB round trips and latency per checkout as carts grow.
+
+Seeds a disposable database (BENCH_POSTGRES_URI, reset through
+/admin/reset) with synthetic recipes, stocks them, and lists all of them
+in one price snapshot so carts can hold more lines than the six-item
+catalog shows. Carts of each size are then filled through the API and
+checked out, counting statements on both engines with the simulator's
+recorder. The checkout resolves and writes every line set-based, so
+round trips should stay flat in the number of lines.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.checkout_round_trips --lines 1,5,25,100
+"""
+import argparse
+import os
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.catalog_latency import seed_recipes
+from bench.simulate import Recorder, percentile
+from src import database as db
+from src.api.server import app
+
+LISTED_SQL = """
+    WITH snapshot AS (
+        INSERT INTO price_snapshots DEFAULT VALUES RETURNING id
+    )
+    INSERT INTO locked_prices (snapshot_id, sku, price)
+    SELECT snapshot.id, sku, price FROM snapshot, potion_catalog_items WHERE sku LIKE 'BENCH_%'
+"""
+
+
+def seed_shop(client, count, stock):
+    """Stock count bench recipes and list them all in a fresh price snapshot. Returns their skus."""
+    with db.engine.begin() as connection:
+        seed_recipes(connection, count)
+        recipes = connection.execute(sqlalchemy.text(
+            "SELECT sku, potion_type FROM potion_catalog_items WHERE sku LIKE 'BENCH_%' ORDER BY sku")).fetchall()
+    client.post("/bottler/deliver/1", json=[{"potion_type": recipe.potion_type, "quantity": stock}
+                                            for recipe in recipes]).raise_for_status()
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text(LISTED_SQL))
+    return [recipe.sku for recipe in recipes]
+
+
+def checkout(client, recorder, skus, lines):
+    cart_id = client.post("/carts/", json={"customer_name": "bench", "character_class": "Bard",
+                                           "level": 1}).json()["cart_id"]
+    for sku in skus[:lines]:
+        client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": 1}).raise_for_status()
+    result = recorder.call(client, "POST", "checkout", f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+    assert result["total_potions_bought"] == lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", default="1,5,25,100", help="comma separated cart sizes")
+    parser.add_argument("--carts", type=int, default=20, help="checkouts per cart size")
+    args = parser.parse_args()
+    require_bench_database()
+    sizes = [int(lines) for lines in args.lines.split(",")]
+
+    recorder = Recorder()
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", recorder.count_statement)
+    sqlalchemy.event.listen(db.async_engine.sync_engine, "before_cursor_execute", recorder.count_statement)
+    print(f"{'lines':>6}{'db/checkout':>13}{'p50 ms':>10}{'p95 ms':>10}")
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        skus = seed_shop(client, max(sizes), args.carts * len(sizes))
+        for lines in sizes:
+            recorder.latencies.clear()
+            recorder.round_trips.clear()
+            for _ in range(args.carts):
+                checkout(client, recorder, skus, lines)
+            samples = sorted(recorder.latencies["checkout"])
+            round_trips = sorted(recorder.round_trips["checkout"])
+            print(f"{lines:>6}{percentile(round_trips, 50):>13}"
+                  f"{percentile(samples, 50) * 1000:>10.2f}{percentile(samples, 95) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Throughput of customer traffic from many concurrent clients.
+
+Starts the shop under uvicorn against a disposable database
+(BENCH_POSTGRES_URI, reset through /admin/reset) and stocks every
+catalog potion, then has --clients concurrent customers loop for
+--duration seconds over what a customer does: search orders, open a
+cart, hold a listed potion, check out, and every --visit-every rounds
+post a visit batch. Reports requests per second overall and per route,
+latency percentiles, failed requests and the most connections the
+database saw from the server while it ran, so pool settings can be
+checked against a connection limit.
+
+Each customer keeps one HTTP/1.1 connection and writes its requests by
+hand: a general purpose client costs several times the server's CPU per
+request, and on a small machine the numbers would measure the client.
+
+--server-dir runs the server from another checkout instead, to compare
+two versions of these routes under the same load. Point
+BENCH_POSTGRES_URI at a database built from that checkout's schema.sql.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.concurrent_load --clients 200 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import sqlalchemy
+
+from bench import require_bench_database
+from bench.simulate import CLASSES, percentile
+from src import database as db
+
+POTION_TYPES_SQL = "SELECT DISTINCT potion_type FROM potion_catalog_items"
+CONNECTIONS_SQL = """
+    SELECT COUNT(*) FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid() AND application_name <> 'bench'
+"""
+
+
+def start_server(server_dir, port):
+    # Otherwise a server left over from an earlier run would answer instead.
+    try:
+        httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+        sys.exit(f"port {port} is already in use")
+    except httpx.TransportError:
+        pass
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(port),
+                               "--log-level", "warning"], cwd=server_dir,
+                              stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+def stock(base_url, headers, quantity):
+    """Bottles quantity of every catalog potion through the API, which older checkouts share."""
+    with db.engine.begin() as connection:
+        potion_types = connection.execute(sqlalchemy.text(POTION_TYPES_SQL)).scalars().all()
+    httpx.post(f"{base_url}/bottler/deliver/1", headers=headers, timeout=60,
+               json=[{"potion_type": potion_type, "quantity": quantity} for potion_type in potion_types]).raise_for_status()
+
+
+def watch_connections(stop, peak):
+    """Samples the server's database connections until stop is set."""
+    engine = sqlalchemy.create_engine(db.database_connection_url(), connect_args={"application_name": "bench"})
+    with engine.connect() as connection:
+        while not stop.is_set():
+            peak[0] = max(peak[0], connection.execute(sqlalchemy.text(CONNECTIONS_SQL)).scalar_one())
+            connection.rollback()
+            time.sleep(0.05)
+    engine.dispose()
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection to the server."""
+
+    def __init__(self, port):
+        self.port = port
+        self.streams = None
+
+    async def request(self, method, path, body=None):
+        if self.streams is None:
+            self.streams = await asyncio.open_connection("127.0.0.1", self.port)
+        reader, writer = self.streams
+        content = b"" if body is None else json.dumps(body).encode()
+        writer.write(f"{method} {path} HTTP/1.1\r\nhost: bench\r\naccess_token: {os.environ.get('API_KEY', '')}\r\n"
+                     f"content-type: application/json\r\ncontent-length: {len(content)}\r\n\r\n".encode() + content)
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = dict(line.lower().split(": ", 1) for line in lines[1:] if line)
+        response = await reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection") == "close":
+            writer.close()
+            self.streams = None
+        return int(lines[0].split(" ")[1]), response
+
+
+async def customer(port, number, deadline, skus, visit_ids, visit_every, latencies, failures):
+    connection = Connection(port)
+
+    async def call(route, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, response = await connection.request(method, path, body)
+        except (OSError, asyncio.IncompleteReadError):
+            connection.streams = None
+            failures[route] += 1
+            return None
+        latencies[route].append(time.perf_counter() - start)
+        if status != 200:
+            failures[route] += 1
+            return None
+        return json.loads(response)
+
+    name = f"load_{number}"
+    for round_number in itertools.count(1):
+        if time.monotonic() >= deadline:
+            break
+        await call("search", "GET", f"/carts/search/?customer_name={name}")
+        cart = await call("create cart", "POST", "/carts/",
+                          {"customer_name": name, "character_class": CLASSES[number % len(CLASSES)], "level": 1})
+        if cart is not None:
+            cart_id = cart["cart_id"]
+            await call("hold", "POST", f"/carts/{cart_id}/items/{skus[(number + round_number) % len(skus)]}", {"quantity": 1})
+            await call("checkout", "POST", f"/carts/{cart_id}/checkout", {"payment": "gold"})
+        if round_number % visit_every == 0:
+            await call("visits", "POST", f"/carts/visits/{next(visit_ids)}",
+                       [{"customer_name": f"{name}_{i}", "character_class": CLASSES[i % len(CLASSES)], "level": 1}
+                        for i in range(10)])
+    if connection.streams is not None:
+        connection.streams[1].close()
+
+
+async def load(port, clients, duration, skus, visit_every):
+    latencies, failures = defaultdict(list), Counter()
+    visit_ids = itertools.count(1)
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*[customer(port, number, deadline, skus, visit_ids, visit_every, latencies, failures)
+                           for number in range(clients)])
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--visit-every", type=int, default=4, help="rounds between a customer's visit batches")
+    parser.add_argument("--stock", type=int, default=1_000_000, help="units of each catalog potion")
+    parser.add_argument("--server-dir", default=".", help="checkout to run the server from")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    require_bench_database()
+
+    server = start_server(args.server_dir, args.port)
+    try:
+        headers = {"access_token": os.environ.get("API_KEY", "")}
+        base_url = f"http://127.0.0.1:{args.port}"
+        httpx.post(f"{base_url}/admin/reset", headers=headers, timeout=60).raise_for_status()
+        stock(base_url, headers, args.stock)
+        skus = [item["sku"] for item in httpx.get(f"{base_url}/catalog/", headers=headers, timeout=60).json()]
+        if len(skus) == 0:
+            sys.exit("the catalog is empty after stocking it")
+        stop, peak = threading.Event(), [0]
+        watcher = threading.Thread(target=watch_connections, args=(stop, peak))
+        watcher.start()
+        start = time.monotonic()
+        latencies, failures = asyncio.run(load(args.port, args.clients, args.duration, skus, args.visit_every))
+        elapsed = time.monotonic() - start
+        stop.set()
+        watcher.join()
+    finally:
+        server.terminate()
+        server.wait()
+    everything = sorted(latency for samples in latencies.values() for latency in samples)
+    print(f"{'route':>12}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}")
+    for route, samples in [*latencies.items(), ("all", everything)]:
+        samples = sorted(samples)
+        failed = sum(failures.values()) if route == "all" else failures[route]
+        print(f"{route:>12}{len(samples) / elapsed:>9.0f}{percentile(samples, 50) * 1000:>9.1f}"
+              f"{percentile(samples, 99) * 1000:>9.1f}{failed:>8}")
+    print(f"{args.clients} clients, peak db connections: {peak[0]}")
+
+
+if __name__ == "__main__":
+    main()
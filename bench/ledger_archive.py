@@ -0,0 +1,89 @@
+"""
+Reconcile and reset cost on a long ledger history, before and after archiving.
+
+Seeds a disposable database (BENCH_POSTGRES_URI, reset through
+/admin/reset) with --rows rows in each of gold_ledger, barrel_ledger and
+potion_ledger spread over the past --days days, with balances to match.
+It then times /admin/reconcile, runs /admin/archive keeping only today,
+and times reconcile again, followed by /admin/reset. Reconcile must
+report the balances consistent both before and after archiving.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.ledger_archive --rows 1000000 --days 30
+"""
+import argparse
+import datetime
+import os
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from src import database as db
+from src.api import archive
+from src.api.server import app
+
+SEED_SQL = [
+    """INSERT INTO gold_ledger (created_at, gold)
+       SELECT NOW() - (1 + i % :days) * INTERVAL '1 day', CASE WHEN i % 2 = 0 THEN 60 ELSE -50 END
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO barrel_ledger (created_at, barrel_type, potion_ml)
+       SELECT NOW() - (1 + i % :days) * INTERVAL '1 day',
+              (ARRAY[ARRAY[1,0,0,0], ARRAY[0,1,0,0], ARRAY[0,0,1,0], ARRAY[0,0,0,1]])[1 + i % 4:1 + i % 4][1:4],
+              CASE WHEN i % 3 = 0 THEN -100 ELSE 100 END
+       FROM generate_series(1, :rows) AS i""",
+    """INSERT INTO potion_ledger (created_at, potion_type, quantity)
+       SELECT NOW() - (1 + i % :days) * INTERVAL '1 day', potion_catalog_items.potion_type,
+              CASE WHEN i % 3 = 0 THEN -1 ELSE 1 END
+       FROM generate_series(1, :rows) AS i
+       JOIN (SELECT potion_type, row_number() OVER () - 1 AS slot, count(*) OVER () AS recipes
+             FROM potion_catalog_items) AS potion_catalog_items
+         ON potion_catalog_items.slot = i % potion_catalog_items.recipes""",
+]
+BALANCES_SQL = [
+    "TRUNCATE barrel_balances, potion_balances, gold_deltas",
+    "INSERT INTO barrel_balances (barrel_type, potion_ml) SELECT barrel_type, SUM(potion_ml) FROM barrel_ledger GROUP BY barrel_type",
+    "INSERT INTO potion_balances (potion_type, quantity) SELECT potion_type, SUM(quantity) FROM potion_ledger GROUP BY potion_type",
+    "UPDATE shop_balance SET gold = (SELECT SUM(gold) FROM gold_ledger) WHERE id = 1",
+]
+
+
+def timed(client, method, path, **kwargs):
+    start = time.perf_counter()
+    response = client.request(method, path, **kwargs)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return elapsed, response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="rows seeded into each ledger")
+    parser.add_argument("--days", type=int, default=30, help="days of history to spread them over")
+    args = parser.parse_args()
+    require_bench_database()
+
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        start = time.perf_counter()
+        with db.engine.begin() as connection:
+            archive.create_partitions(connection, archive.today() - datetime.timedelta(days=args.days),
+                                      archive.today())
+            for sql in SEED_SQL + BALANCES_SQL:
+                connection.execute(sqlalchemy.text(sql), {"rows": args.rows, "days": args.days})
+        print(f"seeded {3 * args.rows} ledger rows over {args.days} days in {time.perf_counter() - start:.1f}s")
+
+        elapsed, before = timed(client, "GET", "/admin/reconcile")
+        print(f"reconcile before archiving: {elapsed * 1000:>9.1f} ms  consistent={before['consistent']}")
+        elapsed, archived = timed(client, "POST", "/admin/archive", params={"keep_days": 1})
+        print(f"archive {len(archived['archived_days'])} days:        {elapsed * 1000:>9.1f} ms")
+        elapsed, after = timed(client, "GET", "/admin/reconcile")
+        print(f"reconcile after archiving:  {elapsed * 1000:>9.1f} ms  consistent={after['consistent']}")
+        elapsed, _ = timed(client, "POST", "/admin/reset")
+        print(f"reset after archiving:      {elapsed * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
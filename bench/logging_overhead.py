@@ -0,0 +1,45 @@
+"""
+Per-call cost of logging a catalog-sized payload from a handler.
+
+Compares a synchronous print of the payload against the queue-backed
+logger from src.logs at INFO (formatted on the listener thread) and at
+a level that filters the record out. Run with stdout redirected to the
+sink you care about, e.g. `python -m bench.logging_overhead > /dev/null`;
+the report goes to stderr.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from src import logs
+
+PAYLOAD = [{"sku": f"POTION_{i}", "name": f"potion {i}", "quantity": i, "price": 50,
+            "potion_type": [100 - i, i, 0, 0]} for i in range(6)]
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    logs.configure()
+    logger = logging.getLogger("bench.logging_overhead")
+    results = {
+        "print": per_call(lambda: print(f"catalog: {PAYLOAD}"), args.calls),
+        "logger.info (queued)": per_call(lambda: logger.info("catalog: %s", PAYLOAD), args.calls),
+        "logger.debug (filtered)": per_call(lambda: logger.debug("catalog: %s", PAYLOAD), args.calls),
+    }
+    for name, micros in results.items():
+        print(f"{name:<26}{micros:>8.2f} us/call", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Lock waits between concurrent catalog builds and checkouts.
+
+Stocks every catalog potion in a disposable database
+(BENCH_POSTGRES_URI, reset through /admin/reset), then runs catalog
+threads that rebuild the catalog uncached in a loop alongside buyer
+threads that create a cart, add a listed potion and check out. A monitor
+samples pg_stat_activity for backends waiting on a heavyweight lock and
+classifies the waiter and its blockers by the statement they last ran.
+With versioned price snapshots there should be no catalog/checkout
+pairs; checkouts can still queue behind each other on shared balance
+rows.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.price_snapshot_locks --seconds 10
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from src import database as db
+from src.api import balances, planning_cache
+from src.api.server import app
+
+# Checked in order: the checkout statement also mentions locked_prices
+# and class_preference_counts, so it has to be recognised first.
+STATEMENT_KINDS = [
+    ("checkout", "processed_entry"),
+    ("catalog", "price_snapshots DEFAULT VALUES"),
+    ("catalog", "locked_prices"),
+    ("catalog", "FROM potion_balances JOIN potion_catalog_items"),
+    ("catalog", "total_characters"),
+    ("catalog", "potion_capacity from inventory"),
+    ("catalog", "FROM class_preference_counts"),
+    ("cart", "INSERT INTO carts"),
+    ("cart", "INSERT INTO cart_items"),
+]
+
+WAITS_SQL = """
+    SELECT waiting.query AS waiter_query, blocking.query AS blocker_query
+    FROM pg_stat_activity AS waiting
+    JOIN pg_stat_activity AS blocking ON blocking.pid = ANY (pg_blocking_pids(waiting.pid))
+    WHERE waiting.wait_event_type = 'Lock' AND waiting.datname = current_database()
+"""
+
+
+def statement_kind(query):
+    for kind, marker in STATEMENT_KINDS:
+        if marker in query:
+            return kind
+    return "other"
+
+
+def stock_catalog(connection, quantity):
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potion_ledger (potion_type, quantity)
+        SELECT DISTINCT potion_type, :quantity FROM potion_catalog_items
+    """), {"quantity": quantity})
+    connection.execute(sqlalchemy.text("TRUNCATE potion_balances"))
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO potion_balances (potion_type, quantity)
+        SELECT potion_type, SUM(quantity) FROM potion_ledger GROUP BY potion_type
+    """))
+    connection.execute(sqlalchemy.text("INSERT INTO global_plan (potion_capacity_units, ml_capacity_units) VALUES (:units, 0)"),
+                       {"units": quantity // 50})
+    balances.record_shop(connection, potion_capacity_units=quantity // 50)
+
+
+def catalog_loop(client, stop, counts, listed):
+    while not stop.is_set():
+        planning_cache.invalidate()
+        catalog = client.get("/catalog/").json()
+        if len(catalog) > 0:
+            listed[:] = catalog
+        counts["catalog"] += 1
+
+
+def buyer_loop(client, stop, counts, listed, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        if len(listed) == 0:
+            time.sleep(0.01)
+            continue
+        item = rng.choice(listed)
+        cart = client.post("/carts/", json={"customer_name": f"buyer_{seed}", "character_class": "Bard",
+                                            "level": 1}).json()
+        client.post(f"/carts/{cart['cart_id']}/items/{item['sku']}", json={"quantity": 1})
+        client.post(f"/carts/{cart['cart_id']}/checkout", json={"payment": "gold"})
+        counts["checkout"] += 1
+
+
+def monitor_loop(stop, waits, interval):
+    with db.engine.connect() as connection:
+        while not stop.is_set():
+            for row in connection.execute(sqlalchemy.text(WAITS_SQL)):
+                waits[(statement_kind(row.waiter_query), statement_kind(row.blocker_query))] += 1
+            connection.commit()
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--catalog-threads", type=int, default=4)
+    parser.add_argument("--buyer-threads", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.002, help="seconds between pg_stat_activity samples")
+    args = parser.parse_args()
+    require_bench_database()
+
+    counts = Counter()
+    waits = Counter()
+    listed = []
+    stop = threading.Event()
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        with db.engine.begin() as connection:
+            stock_catalog(connection, 10 ** 6)
+        threads = [threading.Thread(target=monitor_loop, args=(stop, waits, args.interval))]
+        threads += [threading.Thread(target=catalog_loop, args=(client, stop, counts, listed))
+                    for _ in range(args.catalog_threads)]
+        threads += [threading.Thread(target=buyer_loop, args=(client, stop, counts, listed, seed))
+                    for seed in range(args.buyer_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(f"catalog builds: {counts['catalog']}, checkouts: {counts['checkout']}")
+    print(f"{'waiter':<10}{'blocker':<10}{'samples':>9}")
+    for (waiter, blocker), samples in sorted(waits.items()):
+        print(f"{waiter:<10}{blocker:<10}{samples:>9}")
+    catalog_checkout = sum(samples for (waiter, blocker), samples in waits.items()
+                           if {waiter, blocker} == {"catalog", "checkout"})
+    print(f"catalog/checkout lock waits: {catalog_checkout}")
+
+
+if __name__ == "__main__":
+    main()
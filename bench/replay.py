@@ -0,0 +1,137 @@
+"""
+Replay a request capture against a running shop.
+
+Reads the JSONL written by the server when REQUEST_CAPTURE_PATH is set
+and sends each request to --target, either on the recorded schedule
+(optionally sped up with --speed) or back to back with --max. Every
+response is diffed against the recorded one and a per-route latency
+report is printed at the end.
+
+    python -m bench.replay capture.jsonl --target http://localhost:3000 --speed 10
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from bench.simulate import percentile
+
+
+def route_of(path):
+    path = re.sub(r"/items/[^/]+$", "/items/{item_sku}", path)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+
+def load_capture(path):
+    with open(path) as capture:
+        return [json.loads(line) for line in capture if line.strip()]
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.mismatches = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, entry, response, latency):
+        route = route_of(entry["path"])
+        with self.lock:
+            self.latencies[route].append(latency)
+            if response is None:
+                self.errors[route] += 1
+                return
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+            if response.status_code != entry["status"] or body != entry["response"]:
+                self.mismatches[route].append((entry, response.status_code, body))
+
+    def report(self, show_diffs):
+        print(f"{'route':<36}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'diffs':>7}{'errors':>8}")
+        for route in sorted(self.latencies):
+            samples = sorted(self.latencies[route])
+            print(f"{route:<36}{len(samples):>7}"
+                  f"{percentile(samples, 50) * 1000:>10.2f}"
+                  f"{percentile(samples, 95) * 1000:>10.2f}"
+                  f"{percentile(samples, 99) * 1000:>10.2f}"
+                  f"{statistics.mean(samples) * 1000:>10.2f}"
+                  f"{len(self.mismatches[route]):>7}{self.errors[route]:>8}")
+        if show_diffs:
+            for route, mismatches in sorted(self.mismatches.items()):
+                for entry, status, body in mismatches[:show_diffs]:
+                    print(f"\n{entry['method']} {entry['path']}?{entry['query']}")
+                    print(f"  recorded {entry['status']}: {entry['response']}")
+                    print(f"  replayed {status}: {body}")
+
+
+class CartIds:
+    """Maps recorded cart ids to the ids the target handed out on replay."""
+
+    def __init__(self):
+        self.ids = {}
+
+    def rewrite(self, path):
+        return re.sub(r"^/carts/(\d+)/", lambda m: f"/carts/{self.ids.get(m.group(1), m.group(1))}/", path)
+
+    def learn(self, entry, response):
+        if entry["method"] == "POST" and entry["path"] == "/carts/" and response.status_code == 200:
+            if isinstance(entry["response"], dict) and "cart_id" in entry["response"]:
+                self.ids[str(entry["response"]["cart_id"])] = str(response.json()["cart_id"])
+
+
+def send(client, entry, results, cart_ids):
+    path = cart_ids.rewrite(entry["path"])
+    url = path + (f"?{entry['query']}" if entry["query"] else "")
+    start = time.perf_counter()
+    try:
+        response = client.request(entry["method"], url, json=entry["body"])
+        cart_ids.learn(entry, response)
+    except httpx.HTTPError as e:
+        print(f"{entry['method']} {url} failed: {e}")
+        response = None
+    results.add(entry, response, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("capture")
+    parser.add_argument("--target", default="http://localhost:3000")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded pace")
+    parser.add_argument("--max", action="store_true", help="send back to back, ignoring recorded timing")
+    parser.add_argument("--workers", type=int, default=32, help="concurrent requests when replaying on schedule")
+    parser.add_argument("--show-diffs", type=int, default=0, metavar="N", help="print up to N diffs per route")
+    args = parser.parse_args()
+
+    entries = sorted(load_capture(args.capture), key=lambda entry: entry["timestamp"])
+    results = Results()
+    cart_ids = CartIds()
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    started = time.perf_counter()
+    with httpx.Client(base_url=args.target, headers=headers, timeout=30) as client:
+        if args.max:
+            for entry in entries:
+                send(client, entry, results, cart_ids)
+        elif len(entries) > 0:
+            first = entries[0]["timestamp"]
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                for entry in entries:
+                    delay = (entry["timestamp"] - first) / args.speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(send, client, entry, results, cart_ids)
+    elapsed = time.perf_counter() - started
+    results.report(args.show_diffs)
+    print(f"\nreplayed {len(entries)} requests in {elapsed:.2f}s ({len(entries) / max(elapsed, 1e-9):.1f} req/s)")
+
+
+if __name__ == "__main__":
+    main()
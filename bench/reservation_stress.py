@@ -0,0 +1,106 @@
+"""
+Concurrent buyers against a small stock, checking nothing is oversold.
+
+Stocks every catalog potion with a few units in a disposable database
+(BENCH_POSTGRES_URI, reset through /admin/reset), then runs buyer
+threads that read the catalog, add one or two listed potions and either
+check out or abandon the cart, while a ticker advances the game clock so
+abandoned holds expire. At the end it checks that no potion balance went
+negative, that no potion type sold more than it was stocked with, that
+no request failed, and that the balances reconcile.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.reservation_stress --buyers 16 --stock 40
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.price_snapshot_locks import stock_catalog
+from bench.simulate import CLASSES, DAYS, HOURS
+from src import database as db
+from src.api.server import app
+
+SOLD_SQL = """
+    SELECT potion_type::text AS potion_type, -SUM(quantity) AS sold
+    FROM potion_ledger WHERE quantity < 0 GROUP BY potion_type
+"""
+
+
+def buyer_loop(client, stop, statuses, seed, abandon_rate):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        catalog = client.get("/catalog/").json()
+        if len(catalog) == 0:
+            time.sleep(0.01)
+            continue
+        cart = client.post("/carts/", json={"customer_name": f"buyer_{seed}", "character_class": rng.choice(CLASSES),
+                                            "level": 1}).json()
+        for item in rng.sample(catalog, k=min(len(catalog), rng.randint(1, 2))):
+            response = client.post(f"/carts/{cart['cart_id']}/items/{item['sku']}",
+                                   json={"quantity": rng.randint(1, 5)})
+            statuses[f"items {response.status_code}"] += 1
+        if rng.random() < abandon_rate:
+            statuses["abandoned"] += 1
+            continue
+        response = client.post(f"/carts/{cart['cart_id']}/checkout", json={"payment": "gold"})
+        statuses[f"checkout {response.status_code}"] += 1
+
+
+def ticker_loop(client, stop, interval):
+    tick = 0
+    while not stop.wait(interval):
+        tick += 1
+        client.post("/info/current_time", json={"day": DAYS[tick // len(HOURS) % len(DAYS)],
+                                                "hour": HOURS[tick % len(HOURS)]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--buyers", type=int, default=16)
+    parser.add_argument("--stock", type=int, default=40, help="units of each catalog potion")
+    parser.add_argument("--abandon-rate", type=float, default=0.3)
+    parser.add_argument("--tick-interval", type=float, default=0.5, help="seconds between game clock ticks")
+    args = parser.parse_args()
+    require_bench_database()
+
+    statuses = Counter()
+    stop = threading.Event()
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        with db.engine.begin() as connection:
+            stock_catalog(connection, args.stock)
+        threads = [threading.Thread(target=ticker_loop, args=(client, stop, args.tick_interval))]
+        threads += [threading.Thread(target=buyer_loop, args=(client, stop, statuses, seed, args.abandon_rate))
+                    for seed in range(args.buyers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        reconcile = client.get("/admin/reconcile").json()
+
+    with db.engine.begin() as connection:
+        min_quantity = connection.execute(sqlalchemy.text("SELECT MIN(quantity) FROM potion_balances")).scalar_one()
+        sold = connection.execute(sqlalchemy.text(SOLD_SQL)).fetchall()
+    for status, count in sorted(statuses.items()):
+        print(f"{status:<16}{count:>8}")
+    oversold = [row.potion_type for row in sold if row.sold > args.stock]
+    failed = sum(count for status, count in statuses.items() if status.endswith(("500", "502", "503")))
+    print(f"potions sold: {sum(row.sold for row in sold)}, lowest balance: {min_quantity}")
+    print(f"oversold potion types: {oversold or 'none'}, failed requests: {failed}, "
+          f"reconciled: {reconcile['consistent']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+/admin/reset latency on a long history, and traffic served across it.
+
+Seeds a disposable database (BENCH_POSTGRES_URI) with --rows rows in
+each ledger, as bench.ledger_archive does. Client threads then read the
+catalog and the inventory and create carts continuously while the shop
+is reset. It reports the reset latency, the slowest client request
+around the reset, how soon after the reset a client request completed,
+and any failed request. The audit must show the starting state
+afterwards.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.reset_latency --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import threading
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.ledger_archive import BALANCES_SQL, SEED_SQL
+from src import database as db
+from src.api import archive, generations
+from src.api.server import app
+
+CLIENT_REQUESTS = [
+    ("GET", "/catalog/", {}),
+    ("GET", "/inventory/audit", {}),
+    ("POST", "/carts/", {"json": {"customer_name": "bench", "character_class": "Bard", "level": 1}}),
+]
+
+
+def client_loop(client, stop, samples, failures):
+    while not stop.is_set():
+        for method, path, kwargs in CLIENT_REQUESTS:
+            start = time.perf_counter()
+            response = client.request(method, path, **kwargs)
+            end = time.perf_counter()
+            samples.append((start, end))
+            if response.status_code != 200:
+                failures.append((path, response.status_code))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="rows seeded into each ledger")
+    parser.add_argument("--days", type=int, default=30, help="days of history to spread them over")
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args()
+    require_bench_database()
+
+    samples = []
+    failures = []
+    stop = threading.Event()
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        with db.engine.begin() as connection:
+            archive.create_partitions(connection, archive.today() - datetime.timedelta(days=args.days),
+                                      archive.today())
+            for sql in SEED_SQL + BALANCES_SQL:
+                connection.execute(sqlalchemy.text(sql), {"rows": args.rows, "days": args.days})
+        # Let the spare generation from the setup reset finish building.
+        generations.prepare()
+        print(f"seeded {3 * args.rows} ledger rows over {args.days} days")
+
+        threads = [threading.Thread(target=client_loop, args=(client, stop, samples, failures))
+                   for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        reset_start = time.perf_counter()
+        client.post("/admin/reset").raise_for_status()
+        reset_end = time.perf_counter()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        audit = client.get("/inventory/audit").json()
+
+    around = [end - start for start, end in samples if end >= reset_start - 0.1 and start <= reset_end + 0.1]
+    after = [end for start, end in samples if start >= reset_end]
+    print(f"reset:                          {(reset_end - reset_start) * 1000:>8.1f} ms")
+    print(f"slowest request around reset:   {max(around, default=0) * 1000:>8.1f} ms")
+    print(f"first request done after reset: {(min(after) - reset_end) * 1000:>8.1f} ms")
+    print(f"requests: {len(samples)}, failed: {len(failures)} {failures[:5]}")
+    print(f"audit after reset: {audit}")
+
+
+if __name__ == "__main__":
+    main()
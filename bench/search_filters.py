@@ -0,0 +1,63 @@
+"""
+/carts/search/ latency by filter kind over a large cart history.
+
+Seeds a disposable database (BENCH_POSTGRES_URI, reset through
+/admin/reset) with the cart history from bench.search_latency, then
+times the endpoint with no filter, prefix and infix customer name
+filters (common and rare matches) and an infix sku filter. The infix
+filters are served by the trigram indexes in schema.sql.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.search_filters --carts 100000
+"""
+import argparse
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.search_latency import seed_history
+from bench.simulate import percentile
+from src import database as db
+from src.api.server import app
+
+FILTERS = {
+    "empty": {},
+    "name prefix": {"customer_name": "Scar"},
+    "name infix": {"customer_name": "amou"},
+    "name infix, rare": {"customer_name": "e_4242"},
+    "sku infix": {"potion_sku": "EEN_PO"},
+}
+
+
+def time_search(client, params, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/carts/search/", params=params)
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return sorted(samples), len(response.json()["results"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--carts", type=int, default=100000, help="carts of history to seed, three lines each")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    require_bench_database()
+
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        with db.engine.begin() as connection:
+            seed_history(connection, args.carts)
+        print(f"{'filter':<20}{'rows':>6}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, params in FILTERS.items():
+            samples, rows = time_search(client, params, args.requests)
+            print(f"{name:<20}{rows:>6}{percentile(samples, 50) * 1000:>10.2f}{percentile(samples, 99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+/carts/search/ per-request cost with and without per-request reflection.
+
+Seeds a disposable database (BENCH_POSTGRES_URI, reset through
+/admin/reset) with a cart history, then times the same search three
+ways: reflecting carts, cart_items and potion_catalog_items into a fresh
+MetaData and building the select on every request as the old handler
+did, executing the cached statement from carts.search_statement, and the
+endpoint end to end through the test client.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.search_latency --carts 100000
+"""
+import argparse
+import os
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.simulate import CLASSES, percentile
+from src import database as db
+from src.api import carts
+from src.api.server import app
+
+NAMES = ["Scaramouche", "Aether", "Lumine", "Diluc", "Kaeya", "Venti", "Zhongli", "Klee"]
+
+
+def seed_history(connection, count):
+    """Appends count carts, each with three lines of different catalog potions spread over the last 30 days."""
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO carts (customer_name, character_class, level)
+        SELECT (:names)[1 + i % cardinality(:names)] || '_' || i, (:classes)[1 + i % cardinality(:classes)], 1 + i % 20
+        FROM generate_series(1, :count) AS i
+    """), {"names": NAMES, "classes": CLASSES, "count": count})
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO cart_items (cart_id, item_sku, quantity, created_at)
+        SELECT carts.id, potions.sku, 1 + (carts.id + n) % 5,
+               NOW() - (carts.id % 43200) * INTERVAL '1 minute'
+        FROM carts
+        CROSS JOIN generate_series(0, 2) AS n
+        JOIN (SELECT sku, row_number() OVER (ORDER BY sku) - 1 AS slot, COUNT(*) OVER () AS potion_count
+              FROM potion_catalog_items) AS potions
+          ON potions.slot = (carts.id + n * 3) % potions.potion_count
+        WHERE NOT EXISTS (SELECT 1 FROM cart_items WHERE cart_items.cart_id = carts.id)
+    """))
+    connection.execute(sqlalchemy.text("ANALYZE carts"))
+    connection.execute(sqlalchemy.text("ANALYZE cart_items"))
+
+
+def reflected_search(sort_order):
+    """The old handler's table setup: reflect per request, then build and run the timestamp-sorted select."""
+    metadata = sqlalchemy.MetaData()
+    cart_table = sqlalchemy.Table("carts", metadata, autoload_with=db.engine)
+    cart_items = sqlalchemy.Table("cart_items", metadata, autoload_with=db.engine)
+    potion_catalog_items = sqlalchemy.Table("potion_catalog_items", metadata, autoload_with=db.engine)
+    direction = sqlalchemy.asc if sort_order == carts.search_sort_order.asc else sqlalchemy.desc
+    stmt = sqlalchemy.select(
+        cart_items.c.id, cart_items.c.item_sku, cart_table.c.customer_name,
+        (potion_catalog_items.c.price * cart_items.c.quantity).label("line_item_total"),
+        cart_items.c.created_at.label("timestamp")
+        ).select_from(
+            cart_items.join(cart_table, cart_items.c.cart_id == cart_table.c.id)
+            .join(potion_catalog_items, cart_items.c.item_sku == potion_catalog_items.c.sku)
+        ).order_by(direction(cart_items.c.created_at), direction(cart_items.c.id)).limit(carts.PAGE_SIZE + 1)
+    with db.engine.begin() as connection:
+        return connection.execute(stmt).fetchall()
+
+
+def cached_search(sort_col, sort_order):
+    stmt = carts.search_statement(sort_col, sort_order)
+    with db.engine.begin() as connection:
+        return connection.execute(stmt).fetchall()
+
+
+def time_calls(fn, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--carts", type=int, default=100000, help="carts of history to seed, three lines each")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    require_bench_database()
+    sort_col, sort_order = carts.search_sort_options.timestamp, carts.search_sort_order.desc
+
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        with db.engine.begin() as connection:
+            seed_history(connection, args.carts)
+        results = {
+            "reflect per request (old)": time_calls(lambda: reflected_search(sort_order), args.requests),
+            "cached statement": time_calls(lambda: cached_search(sort_col, sort_order), args.requests),
+            "GET /carts/search/": time_calls(lambda: client.get("/carts/search/").raise_for_status(), args.requests),
+        }
+    print(f"{'':<28}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, samples in results.items():
+        print(f"{name:<28}{percentile(samples, 50) * 1000:>10.2f}{percentile(samples, 99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
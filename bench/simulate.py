@@ -0,0 +1,140 @@
+"""
+Offline day/tick simulation of the shop.
+
+Drives the real FastAPI app through the test client against the
+database in BENCH_POSTGRES_URI, which must be a disposable database
+built by bench/bootstrap.py -- the run starts with /admin/reset. Each tick
+posts the time, customer visits, catalog reads, carts and checkouts;
+the first tick of each day also runs the barrel, bottler and capacity
+plan/deliver cycle. At the end it prints per-endpoint latency
+percentiles, DB round trips per request and the final audit.
+
+    export BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim
+    python -m bench.bootstrap
+    python -m bench.simulate --days 3 --seed 1
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from src import database as db
+from src.api.server import app
+
+DAYS = ["Edgeday", "Bloomday", "Arcanaday", "Hearthday", "Crownday", "Blesseday", "Soulday"]
+HOURS = range(0, 24, 2)
+CLASSES = ["Warrior", "Wizard", "Rogue", "Cleric", "Druid", "Ranger", "Paladin", "Monk", "Bard"]
+WHOLESALE_CATALOG = [
+    {"sku": f"{size}_{color}_BARREL", "ml_per_barrel": ml, "potion_type": potion_type, "price": price, "quantity": 10}
+    for color, potion_type in [("RED", [1, 0, 0, 0]), ("GREEN", [0, 1, 0, 0]),
+                               ("BLUE", [0, 0, 1, 0]), ("DARK", [0, 0, 0, 1])]
+    for size, ml, price in [("MINI", 200, 60), ("SMALL", 500, 100), ("MEDIUM", 2500, 250), ("LARGE", 10000, 500)]
+]
+
+
+class Recorder:
+    """Per-endpoint latency samples and DB statement counts."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.round_trips = defaultdict(list)
+        self.statements = 0
+
+    def count_statement(self, *args):
+        self.statements += 1
+
+    def call(self, client, method, route, path, allow_conflict=False, **kwargs):
+        self.statements = 0
+        start = time.perf_counter()
+        response = client.request(method, path, **kwargs)
+        self.latencies[route].append(time.perf_counter() - start)
+        self.round_trips[route].append(self.statements)
+        if allow_conflict and response.status_code == 409:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def report(self):
+        print(f"{'endpoint':<36}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db/req':>9}")
+        for route in sorted(self.latencies):
+            samples = sorted(self.latencies[route])
+            print(f"{route:<36}{len(samples):>7}"
+                  f"{percentile(samples, 50) * 1000:>10.2f}"
+                  f"{percentile(samples, 95) * 1000:>10.2f}"
+                  f"{percentile(samples, 99) * 1000:>10.2f}"
+                  f"{statistics.mean(self.round_trips[route]):>9.1f}")
+
+
+def percentile(samples, pct):
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def simulate_tick(client, recorder, rng, day, hour, order_ids, customers_per_tick):
+    recorder.call(client, "POST", "/info/current_time", "/info/current_time", json={"day": day, "hour": hour})
+    if hour == 0:
+        barrel_plan = recorder.call(client, "POST", "/barrels/plan", "/barrels/plan", json=WHOLESALE_CATALOG)
+        by_sku = {barrel["sku"]: barrel for barrel in WHOLESALE_CATALOG}
+        delivered = [dict(by_sku[item["sku"]], quantity=item["quantity"]) for item in barrel_plan]
+        if len(delivered) > 0:
+            recorder.call(client, "POST", "/barrels/deliver/{order_id}", f"/barrels/deliver/{next(order_ids)}", json=delivered)
+        capacity = recorder.call(client, "POST", "/inventory/plan", "/inventory/plan")
+        if capacity["potion_capacity"] + capacity["ml_capacity"] > 0:
+            recorder.call(client, "POST", "/inventory/deliver/{order_id}", f"/inventory/deliver/{next(order_ids)}", json=capacity)
+    bottle_plan = recorder.call(client, "POST", "/bottler/plan", "/bottler/plan")
+    if len(bottle_plan) > 0:
+        recorder.call(client, "POST", "/bottler/deliver/{order_id}", f"/bottler/deliver/{next(order_ids)}", json=bottle_plan)
+
+    customers = [{"customer_name": f"customer_{rng.randrange(10000)}",
+                  "character_class": rng.choice(CLASSES),
+                  "level": rng.randint(1, 20)} for _ in range(customers_per_tick)]
+    recorder.call(client, "POST", "/carts/visits/{visit_id}", f"/carts/visits/{next(order_ids)}", json=customers)
+    for customer in customers:
+        catalog = recorder.call(client, "GET", "/catalog/", "/catalog/")
+        if len(catalog) == 0 or rng.random() < 0.4:
+            continue
+        cart = recorder.call(client, "POST", "/carts/", "/carts/", json=customer)
+        for item in rng.sample(catalog, k=rng.randint(1, min(2, len(catalog)))):
+            recorder.call(client, "POST", "/carts/{cart_id}/items/{item_sku}",
+                          f"/carts/{cart['cart_id']}/items/{item['sku']}",
+                          json={"quantity": rng.randint(1, min(3, item["quantity"]))},
+                          allow_conflict=True)
+        recorder.call(client, "POST", "/carts/{cart_id}/checkout", f"/carts/{cart['cart_id']}/checkout",
+                      json={"payment": "gold"})
+    recorder.call(client, "GET", "/carts/search/", "/carts/search/", params={"customer_name": "customer_1"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--customers", type=int, default=8, help="customers per tick")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    require_bench_database()
+
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", recorder.count_statement)
+    sqlalchemy.event.listen(db.async_engine.sync_engine, "before_cursor_execute", recorder.count_statement)
+    order_ids = iter(range(1, 10 ** 9))
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    with TestClient(app) as client:
+        client.headers.update(headers)
+        recorder.call(client, "POST", "/admin/reset", "/admin/reset")
+        for day_number in range(args.days):
+            for hour in HOURS:
+                simulate_tick(client, recorder, rng, DAYS[day_number % len(DAYS)], hour,
+                              order_ids, args.customers)
+        audit = recorder.call(client, "GET", "/inventory/audit", "/inventory/audit")
+    recorder.report()
+    print(f"final audit: {audit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Customers per second ingested by /carts/visits/ as batches grow.
+
+Resets a disposable database (BENCH_POSTGRES_URI, through /admin/reset)
+and posts --batches visit batches of each --customers size through the
+test client, reporting customers ingested per second and per-batch
+latency. For comparison it also times the old handler's per-customer
+INSERTs on the same batches, sent straight to the database, so they do
+not pay the HTTP and planning cache costs the endpoint does. Every
+batch is then posted again under its visit_id, which must add no rows.
+
+    BENCH_POSTGRES_URI=postgresql+psycopg2://localhost/pnw_sim API_KEY=sim \\
+        python -m bench.visit_ingest --customers 10,100,500 --batches 20
+"""
+import argparse
+import itertools
+import os
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from bench import require_bench_database
+from bench.simulate import CLASSES, percentile
+from src import database as db
+from src.api.server import app
+
+VISITS_SQL = "SELECT COUNT(*) FROM visits"
+
+
+def batch(visit_id, customers):
+    return [{"customer_name": f"visitor_{visit_id}_{i}", "character_class": CLASSES[i % len(CLASSES)],
+             "level": 1 + i % 20} for i in range(customers)]
+
+
+def old_ingest(customers):
+    """The pre-batch post_visits: read the day, then one INSERT per customer."""
+    get_day_sql = "SELECT day FROM global_time"
+    visits_entry_sql = "INSERT INTO visits (customer_name, character_class, level, day) VALUES (:customer_name, :character_class, :level, :day)"
+    with db.engine.begin() as connection:
+        day = connection.execute(sqlalchemy.text(get_day_sql)).scalar_one()
+        for customer in customers:
+            connection.execute(sqlalchemy.text(visits_entry_sql), [{**customer, "day": day}])
+
+
+def visit_count():
+    with db.engine.begin() as connection:
+        return connection.execute(sqlalchemy.text(VISITS_SQL)).scalar_one()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--customers", default="10,100,500", help="comma separated batch sizes")
+    parser.add_argument("--batches", type=int, default=20, help="batches per size")
+    args = parser.parse_args()
+    require_bench_database()
+    sizes = [int(customers) for customers in args.customers.split(",")]
+    visit_ids = itertools.count(1)
+
+    print(f"{'customers':>10}{'handler':>13}{'customers/s':>13}{'p50 ms':>10}{'p99 ms':>10}{'resent rows':>13}")
+    with TestClient(app) as client:
+        client.headers.update({"access_token": os.environ.get("API_KEY", "")})
+        client.post("/admin/reset").raise_for_status()
+        # Untimed, so the first size is not charged for warming up.
+        client.post(f"/carts/visits/{next(visit_ids)}", json=batch(0, 1)).raise_for_status()
+        old_ingest(batch(0, 1))
+        for customers in sizes:
+            posted = {visit_id: batch(visit_id, customers)
+                      for visit_id in itertools.islice(visit_ids, args.batches)}
+            samples = []
+            for visit_id, body in posted.items():
+                start = time.perf_counter()
+                client.post(f"/carts/visits/{visit_id}", json=body).raise_for_status()
+                samples.append(time.perf_counter() - start)
+            before = visit_count()
+            for visit_id, body in posted.items():
+                client.post(f"/carts/visits/{visit_id}", json=body).raise_for_status()
+            resent = visit_count() - before
+
+            old_samples = []
+            for body in posted.values():
+                start = time.perf_counter()
+                old_ingest(body)
+                old_samples.append(time.perf_counter() - start)
+            for name, timings, extra in [("endpoint", sorted(samples), resent),
+                                         ("old inserts", sorted(old_samples), "")]:
+                print(f"{customers:>10}{name:>13}{customers * len(timings) / sum(timings):>13.0f}"
+                      f"{percentile(timings, 50) * 1000:>10.2f}{percentile(timings, 99) * 1000:>10.2f}{extra:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,445 @@
+-- Shop schema. The tables below are the state the shop started from;
+-- every section after them is a migration, applied in order. Running the
+-- whole file against an empty database (see bench/bootstrap.py) builds
+-- the current schema.
+
 create table global_time (
-  id bigint not null primary key,
+  id bigint generated by default as identity primary key,
   created_at timestamp default now() not null,
   day text,
   hour smallint
 );
 
-create table global_plan (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
-  potion_capacity_units integer,
-  ml_capacity_units integer,
-  order_id integer
-);
+insert into global_time (day, hour) values ('Edgeday', 0);
 
-create table barrels (
-  id bigint not null primary key,
+create table global_inventory (
+  id bigint generated by default as identity primary key,
   created_at timestamp default now() not null,
-  potion_ml integer,
-  barrel_type integer[],
-  order_id integer
+  barrels_disposable_gold real not null default 1,
+  capacity_disposable_gold real not null default 0.5
 );
 
-create table carts (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
-  customer_name text,
-  character_class text,
-  "level" smallint
-);
+insert into global_inventory (barrels_disposable_gold, capacity_disposable_gold) values (0.9, 0.5);
 
-create table global_inventory (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
-  ml_threshold integer,
-  potion_capacity_plan integer,
-  ml_capacity_plan integer,
-  potion_threshold integer
+create table processed (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  order_id integer,
+  type text
 );
 
 create table gold_ledger (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
-  order_id integer,
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  processed_id bigint references processed (id) on delete cascade,
   gold integer
 );
 
-create table potions (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
-  order_id integer,
+create table barrel_ledger (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  processed_id bigint references processed (id) on delete cascade,
+  barrel_type integer[],
+  potion_ml integer
+);
+
+create table potion_ledger (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  processed_id bigint references processed (id) on delete cascade,
   potion_type integer[],
   quantity integer
 );
 
+create table global_plan (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  processed_id bigint references processed (id) on delete cascade,
+  potion_capacity_units integer,
+  ml_capacity_units integer
+);
+
+create view inventory as
+select (select coalesce(sum(gold), 0) from gold_ledger) as gold,
+  (select coalesce(sum(potion_ml), 0) from barrel_ledger) as ml,
+  (select coalesce(sum(quantity), 0) from potion_ledger) as potions,
+  (select coalesce(sum(ml_capacity_units), 0) from global_plan) as ml_capacity,
+  (select coalesce(sum(potion_capacity_units), 0) from global_plan) as potion_capacity;
+
 create table potion_catalog_items (
-  id bigint not null primary key,
+  id bigint generated by default as identity primary key,
   created_at timestamp default now() not null,
-  sku text,
+  sku text unique,
   name text,
-  price smallint,
-  potion_type smallint[],
-  tick_id smallint,
-  shop_id smallint
+  price integer,
+  potion_type integer[],
+  last_selected timestamp with time zone
 );
 
-create table processed (
-  id bigint not null primary key,
+create table locked_prices (
+  id bigint generated by default as identity primary key,
+  sku text,
+  price integer
+);
+
+create table carts (
+  id bigint generated by default as identity primary key,
   created_at timestamp default now() not null,
-  order_id integer,
-  order_type text
+  customer_name text,
+  character_class text,
+  "level" smallint
 );
 
 create table cart_items (
-  id bigint not null primary key,
-  created_at timestamp default now() not null,
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
   item_sku text,
-  cart_id integer,
+  cart_id bigint references carts (id) on delete cascade,
   quantity integer
 );
 
+create table class_preferences (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  character_class text,
+  potion_type integer[]
+);
+
+create table visits (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  customer_name text,
+  character_class text,
+  "level" smallint,
+  day text
+);
+
+create table inventory_log (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null,
+  gold integer,
+  ml integer,
+  potions integer
+);
+
+
+-- Running balances maintained in the same transaction as each ledger insert.
+-- Planning reads go through these instead of summing the ledgers.
+create table barrel_balances (
+  barrel_type integer[] not null primary key,
+  potion_ml integer not null default 0
+);
+
+create table potion_balances (
+  potion_type integer[] not null primary key,
+  quantity integer not null default 0
+);
+
+create table shop_balance (
+  id smallint not null primary key check (id = 1),
+  gold integer not null default 0,
+  potion_capacity_units integer not null default 0,
+  ml_capacity_units integer not null default 0
+);
+
+insert into barrel_balances (barrel_type, potion_ml)
+select barrel_type, sum(potion_ml) from barrel_ledger group by barrel_type;
+
+insert into potion_balances (potion_type, quantity)
+select potion_type, sum(quantity) from potion_ledger group by potion_type;
+
+insert into shop_balance (id, gold, potion_capacity_units, ml_capacity_units)
+select 1,
+  (select coalesce(sum(gold), 0) from gold_ledger),
+  (select coalesce(sum(potion_capacity_units), 0) from global_plan),
+  (select coalesce(sum(ml_capacity_units), 0) from global_plan);
+
+drop view if exists inventory;
+create view inventory as
+select shop_balance.gold,
+  (select coalesce(sum(potion_ml), 0) from barrel_balances) as ml,
+  (select coalesce(sum(quantity), 0) from potion_balances) as potions,
+  shop_balance.ml_capacity_units as ml_capacity,
+  shop_balance.potion_capacity_units as potion_capacity
+from shop_balance
+where shop_balance.id = 1;
+
+-- Keyset pagination for /carts/search/. Each index matches one sort mode's
+-- (sort key, line item id) seek; line_item_total is computed across two
+-- tables and cannot be indexed directly.
+create index if not exists cart_items_created_at_id_idx on cart_items (created_at, id);
+create index if not exists cart_items_item_sku_id_idx on cart_items (item_sku, id);
+create index if not exists cart_items_cart_id_idx on cart_items (cart_id);
+create index if not exists carts_customer_name_id_idx on carts (customer_name, id);
+
+-- Substring search for /carts/search/. Trigram GIN indexes serve
+-- ILIKE '%term%' filters on both the customer name and the item sku.
+create extension if not exists pg_trgm;
+create index if not exists carts_customer_name_trgm_idx on carts using gin (customer_name gin_trgm_ops);
+create index if not exists cart_items_item_sku_trgm_idx on cart_items using gin (item_sku gin_trgm_ops);
+
+-- Barrel deliveries used to write one barrel_ledger row per physical barrel.
+-- Fold those into one row per delivered barrel type; ml totals are unchanged.
+with compacted as (
+  delete from barrel_ledger
+  using processed
+  where barrel_ledger.processed_id = processed.id and processed.type = 'barrels'
+  returning barrel_ledger.processed_id, barrel_ledger.barrel_type, barrel_ledger.potion_ml
+)
+insert into barrel_ledger (processed_id, barrel_type, potion_ml)
+select processed_id, barrel_type, sum(potion_ml)
+from compacted
+group by processed_id, barrel_type;
+
+-- Replay-safe deliveries and checkouts. Existing duplicate (order_id, type)
+-- rows must be resolved before the constraint can be added; list them with
+--   select order_id, type, count(*) from processed group by 1, 2 having count(*) > 1;
+alter table processed add constraint processed_order_id_type_key unique (order_id, type);
+create index if not exists gold_ledger_processed_id_idx on gold_ledger (processed_id);
+create index if not exists potion_ledger_processed_id_idx on potion_ledger (processed_id);
+
+-- Purchase counts per (class, potion type), maintained by checkout so
+-- planners read preferences without counting class_preferences.
+create table class_preference_counts (
+  character_class text not null,
+  potion_type integer[] not null,
+  amount_bought integer not null default 0,
+  primary key (character_class, potion_type)
+);
+
+insert into class_preference_counts (character_class, potion_type, amount_bought)
+select character_class, potion_type, count(*)
+from class_preferences
+group by character_class, potion_type;
+
+-- Visit batches are written in one statement and deduplicated on the
+-- game server's visit_id and each customer's position in the batch.
+alter table visits add column visit_id integer;
+alter table visits add column position integer;
+create unique index if not exists visits_visit_id_position_key on visits (visit_id, position);
+
+-- One line per sku per cart. The old handlers added a line per request
+-- and checkout sold every line, so earlier duplicate lines are merged into
+-- the newest one with their quantities summed: checked-out orders keep
+-- the quantities their ledger rows record, and open carts what checkout
+-- would have sold. The unique index also serves checkout's lookup by
+-- cart_id, replacing cart_items_cart_id_idx.
+update cart_items
+set quantity = duplicates.quantity
+from (select max(id) as id, sum(quantity) as quantity
+      from cart_items
+      group by cart_id, item_sku
+      having count(*) > 1) as duplicates
+where cart_items.id = duplicates.id;
+delete from cart_items
+using cart_items as newer
+where cart_items.cart_id = newer.cart_id
+  and cart_items.item_sku = newer.item_sku
+  and cart_items.id < newer.id;
+alter table cart_items add constraint cart_items_cart_id_item_sku_key unique (cart_id, item_sku);
+drop index if exists cart_items_cart_id_idx;
+
+-- Additional API keys, stored as SHA-256 hex digests. Revoked keys stop
+-- being accepted within API_KEY_TTL_SECONDS.
+create table api_keys (
+  key_hash text not null primary key,
+  name text,
+  created_at timestamp default now() not null,
+  revoked_at timestamp
+);
+
+-- Each catalog build writes its prices under a new snapshot instead of
+-- truncating locked_prices, and a cart records the snapshot it was created
+-- against. Existing prices and carts are carried over as snapshot one.
+create table price_snapshots (
+  id bigint generated by default as identity primary key,
+  created_at timestamp with time zone default now() not null
+);
+
+insert into price_snapshots (id) values (1);
+select setval(pg_get_serial_sequence('price_snapshots', 'id'), 1);
+
+alter table locked_prices add column snapshot_id bigint references price_snapshots (id) on delete cascade;
+update locked_prices set snapshot_id = 1;
+alter table locked_prices alter column snapshot_id set not null;
+create unique index if not exists locked_prices_snapshot_id_sku_key on locked_prices (snapshot_id, sku);
+
+alter table carts add column price_snapshot_id bigint;
+update carts set price_snapshot_id = 1;
+
+-- Stock held by open carts. Each hold is stamped with the tick it was
+-- placed in, and potion_balances.reserved is the running total of holds
+-- per potion type, so unreserved stock is quantity - reserved.
+alter table global_time add column tick bigint not null default 0;
+
+alter table potion_balances add column reserved integer not null default 0;
+alter table potion_balances add constraint potion_balances_reserved_check check (reserved >= 0);
+
+create table potion_reservations (
+  cart_id bigint not null references carts (id) on delete cascade,
+  item_sku text not null,
+  potion_type integer[] not null,
+  quantity integer not null check (quantity >= 0),
+  tick bigint not null,
+  primary key (cart_id, item_sku)
+);
+
+create index if not exists potion_reservations_tick_idx on potion_reservations (tick);
+
+-- The ledgers and append-only logs are partitioned by the UTC day of
+-- created_at, one partition per day plus a default partition as a safety
+-- net. Partitions are created ahead of time by the app (see
+-- src/api/archive.py); old ledger days are folded into archived_totals and
+-- dropped. processed and visits stay unpartitioned because a unique key on
+-- a partitioned table must include the partition key, and (order_id, type)
+-- and (visit_id, position) have to stay globally unique.
+create or replace function create_day_partition(parent text, day date) returns text
+language plpgsql as $$
+declare
+  partition text := format('%s_%s', parent, to_char(day, 'YYYYMMDD'));
+begin
+  perform pg_advisory_xact_lock(hashtext(partition));
+  if to_regclass(partition) is null then
+    execute format('create table %I partition of %I for values from (%L) to (%L)',
+                   partition, parent, day || ' 00:00:00+00', day + 1 || ' 00:00:00+00');
+  end if;
+  return partition;
+end $$;
+
+do $$
+declare
+  ledger text;
+  day date;
+begin
+  perform set_config('TimeZone', 'UTC', true);
+  foreach ledger in array array['gold_ledger', 'barrel_ledger', 'potion_ledger', 'global_plan',
+                                'class_preferences', 'inventory_log'] loop
+    execute format('alter table %I rename to %I', ledger, ledger || '_unpartitioned');
+    execute format('create table %I (like %I including defaults including identity) partition by range (created_at)',
+                   ledger, ledger || '_unpartitioned');
+    execute format('create table %I partition of %I default', ledger || '_default', ledger);
+    for day in execute format('select distinct created_at::date from %I', ledger || '_unpartitioned') loop
+      perform create_day_partition(ledger, day);
+    end loop;
+    for day in select generate_series(current_date, current_date + 7, interval '1 day') loop
+      perform create_day_partition(ledger, day);
+    end loop;
+    execute format('insert into %I select * from %I', ledger, ledger || '_unpartitioned');
+    execute format('select setval(pg_get_serial_sequence(%L, ''id''), coalesce(max(id), 0) + 1, false) from %I',
+                   ledger, ledger);
+    execute format('drop table %I', ledger || '_unpartitioned');
+    execute format('alter table %I add primary key (id, created_at)', ledger);
+  end loop;
+end $$;
+
+alter table gold_ledger add foreign key (processed_id) references processed (id) on delete cascade;
+alter table barrel_ledger add foreign key (processed_id) references processed (id) on delete cascade;
+alter table potion_ledger add foreign key (processed_id) references processed (id) on delete cascade;
+alter table global_plan add foreign key (processed_id) references processed (id) on delete cascade;
+create index if not exists gold_ledger_processed_id_idx on gold_ledger (processed_id);
+create index if not exists barrel_ledger_processed_id_idx on barrel_ledger (processed_id);
+create index if not exists potion_ledger_processed_id_idx on potion_ledger (processed_id);
+create index if not exists global_plan_processed_id_idx on global_plan (processed_id);
+create index if not exists processed_created_at_idx on processed (created_at);
+create index if not exists visits_created_at_idx on visits (created_at);
+
+-- Ledger totals of archived days, keyed like the balances they feed:
+-- 'gold', 'potion_capacity_units' and 'ml_capacity_units' with an empty
+-- key, 'barrel_ml' by barrel type and 'potions' by potion type.
+create table archived_totals (
+  day date not null,
+  balance text not null,
+  key integer[] not null default '{}',
+  total bigint not null,
+  primary key (day, balance, key)
+);
+
+-- /admin/reset swaps in a prebuilt generation of the game state tables
+-- built in a spare schema (see src/api/generations.py), so day partitions
+-- are now created next to their parent rather than in the first schema
+-- on the search path.
+create or replace function create_day_partition(parent text, day date) returns text
+language plpgsql as $$
+declare
+  parent_schema text := (select nspname from pg_class join pg_namespace on pg_namespace.oid = pg_class.relnamespace
+                         where pg_class.oid = parent::regclass);
+  partition text := format('%s_%s', parent, to_char(day, 'YYYYMMDD'));
+begin
+  perform pg_advisory_xact_lock(hashtext(parent_schema || '.' || partition));
+  if to_regclass(format('%I.%I', parent_schema, partition)) is null then
+    execute format('create table %I.%I partition of %s for values from (%L) to (%L)',
+                   parent_schema, partition, parent::regclass, day || ' 00:00:00+00', day + 1 || ' 00:00:00+00');
+  end if;
+  return partition;
+end $$;
+
+-- Planner results are cached per process under (global_time.tick,
+-- planning_version); writers advance the sequence after every change a
+-- plan depends on, retiring the cached plans of every process.
+create sequence if not exists planning_version;
+
+-- Checkouts append the gold they take to gold_deltas instead of updating
+-- the single shop_balance row, so concurrent checkouts never queue on its
+-- row lock. Every tick folds the pending deltas into shop_balance.gold
+-- (see src/api/balances.py); until then readers add them in.
+create table gold_deltas (
+  id bigint generated always as identity primary key,
+  gold integer not null
+);
+
+drop view if exists inventory;
+create view inventory as
+select shop_balance.gold + (select coalesce(sum(gold), 0) from gold_deltas) as gold,
+  (select coalesce(sum(potion_ml), 0) from barrel_balances) as ml,
+  (select coalesce(sum(quantity), 0) from potion_balances) as potions,
+  shop_balance.ml_capacity_units as ml_capacity,
+  shop_balance.potion_capacity_units as potion_capacity
+from shop_balance
+where shop_balance.id = 1;
+
+-- Cart lines are priced from the newest snapshot listing their sku when
+-- they are added, rather than the cart from the newest snapshot when it
+-- is created, which need not be the catalog the customer was shown.
+-- Lines from before keep the cart's snapshot.
+alter table cart_items add column price_snapshot_id bigint;
+create index if not exists locked_prices_sku_snapshot_id_idx on locked_prices (sku, snapshot_id);
+
+-- A day partition can be created after rows for that day have already
+-- gone to the default partition (no tick arrived before the partitions
+-- ran out). Attaching it would then fail, so those rows are moved out of
+-- the default partition into the new one first, with inserts into the
+-- default partition held off until it is attached.
+create or replace function create_day_partition(parent text, day date) returns text
+language plpgsql as $$
+declare
+  parent_schema text := (select nspname from pg_class join pg_namespace on pg_namespace.oid = pg_class.relnamespace
+                         where pg_class.oid = parent::regclass);
+  partition text := format('%s_%s', parent, to_char(day, 'YYYYMMDD'));
+  qualified text := format('%I.%I', parent_schema, partition);
+  low text := day || ' 00:00:00+00';
+  high text := day + 1 || ' 00:00:00+00';
+  default_partition regclass := (select nullif(partdefid, 0)::regclass from pg_partitioned_table
+                                 where partrelid = parent::regclass);
+  stranded boolean := false;
+begin
+  perform pg_advisory_xact_lock(hashtext(parent_schema || '.' || partition));
+  if to_regclass(qualified) is not null then
+    return partition;
+  end if;
+  if default_partition is not null then
+    execute format('lock table %s in exclusive mode', default_partition);
+    execute format('select exists (select 1 from %s where created_at >= %L and created_at < %L)',
+                   default_partition, low, high) into stranded;
+  end if;
+  if stranded then
+    execute format('create table %s (like %s including defaults)', qualified, parent::regclass);
+    execute format('with moved as (delete from %s where created_at >= %L and created_at < %L returning *) '
+                   'insert into %s select * from moved', default_partition, low, high, qualified);
+    execute format('alter table %s attach partition %s for values from (%L) to (%L)',
+                   parent::regclass, qualified, low, high);
+  else
+    execute format('create table %s partition of %s for values from (%L) to (%L)',
+                   qualified, parent::regclass, low, high);
+  end if;
+  return partition;
+end $$;
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, Request
+import logging
+from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from src.api import auth
-import sqlalchemy
+from src.api import archive, auth, balances, generations, planning_cache, metrics
+import datetime
+from typing import Optional
 from src import database as db
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/admin",
     tags=["admin"],
@@ -16,16 +21,44 @@ def reset():
     Reset the game state. Gold goes to 100, all potions are removed from
     inventory, and all barrels are removed from inventory. Carts are all reset.
     """
-    processed_reset_sql = "TRUNCATE processed RESTART IDENTITY CASCADE; INSERT INTO processed (order_id, type) VALUES (-1, 'reset') RETURNING id"
-    carts_sql = "TRUNCATE carts RESTART IDENTITY CASCADE;"
-    starting_gold_sql = "INSERT INTO gold_ledger (processed_id, gold) VALUES (:processed_id, 100)"
-    starting_capacity_sql = "INSERT INTO global_plan (processed_id, potion_capacity_units, ml_capacity_units) VALUES (:processed_id, 1, 1)"
-    with db.engine.begin() as connection:
-        processed_id = connection.execute(sqlalchemy.text(processed_reset_sql)).scalar_one()
-        connection.execute(sqlalchemy.text(carts_sql))
-        connection.execute(sqlalchemy.text(starting_gold_sql),
-                           [{"processed_id": processed_id}])
-        connection.execute(sqlalchemy.text(starting_capacity_sql),
-                           [{"processed_id": processed_id}])
+    # The live state is swapped for a prebuilt empty generation rather than
+    # truncated, so the reset does not grow with the history it discards.
+    retired = generations.reset(db.engine)
+    planning_cache.invalidate()
+    generations.prepare_in_background()
+    logger.info("reset: previous state kept in %s", retired)
     return "OK"
 
+@router.post("/archive")
+def archive_ledgers(keep_days: Optional[int] = None):
+    """
+    Fold ledger partitions older than keep_days (default
+    ARCHIVE_AFTER_DAYS) into per-day archived totals and drop them, along
+    with the old log partitions, processed rows and visits.
+    """
+    if keep_days is None:
+        keep_days = archive.ARCHIVE_AFTER_DAYS
+    if keep_days < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="keep_days must be at least 1")
+    before = archive.today() - datetime.timedelta(days=keep_days)
+    archived_days = archive.archive(db.engine, before)
+    return {"archived_days": [day.isoformat() for day in archived_days]}
+
+@router.get("/reconcile")
+def reconcile():
+    """
+    Check the running inventory balances against the ledgers. Returns
+    every balance that disagrees with its ledger sum.
+    """
+    with db.engine.begin() as connection:
+        discrepancies = balances.reconcile(connection)
+    logger.info("reconcile discrepancies: %s", discrepancies)
+    return {"consistent": len(discrepancies) == 0, "discrepancies": discrepancies}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Per-route request, SQL statement, row and DB time counters in
+    Prometheus text format.
+    """
+    return metrics.registry.render()
@@ -0,0 +1,129 @@
+import datetime
+import logging
+import os
+import threading
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+# The ledgers and logs below are range partitioned by the UTC day of
+# created_at (see schema.sql). Partitions for the coming days are created
+# ahead of time, and once a day is older than ARCHIVE_AFTER_DAYS its ledger
+# partitions are folded into per-day rows of archived_totals and dropped,
+# so reset, reconcile and other whole-history reads only ever touch recent
+# days. Logs that no balance depends on are dropped without folding, and
+# processed and visits rows from archived days are deleted.
+
+LEDGER_TOTALS = {
+    "gold_ledger": "SELECT 'gold', CAST('{{}}' AS integer[]), SUM(gold) FROM {partition}",
+    "barrel_ledger": "SELECT 'barrel_ml', barrel_type, SUM(potion_ml) FROM {partition} GROUP BY barrel_type",
+    "potion_ledger": "SELECT 'potions', potion_type, SUM(quantity) FROM {partition} GROUP BY potion_type",
+    "global_plan": """SELECT balance, CAST('{{}}' AS integer[]), total FROM (
+                          SELECT 'potion_capacity_units' AS balance, SUM(potion_capacity_units) AS total FROM {partition}
+                          UNION ALL
+                          SELECT 'ml_capacity_units', SUM(ml_capacity_units) FROM {partition}
+                      ) AS totals""",
+}
+LOGS = ["class_preferences", "inventory_log"]
+
+PARTITION_DAYS_AHEAD = int(os.environ.get("PARTITION_DAYS_AHEAD", 7))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 30))
+
+_lock = threading.Lock()
+_checked_on = None
+
+
+def today():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def create_partitions(connection, first_day: datetime.date, last_day: datetime.date):
+    """Create the daily partitions of every partitioned table from first_day through last_day."""
+    create_sql = "SELECT create_day_partition(:parent, CAST(:day AS date))"
+    days = [first_day + datetime.timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+    connection.execute(sqlalchemy.text(create_sql),
+                       [{"parent": parent, "day": day} for parent in [*LEDGER_TOTALS, *LOGS] for day in days])
+
+
+def ensure_partitions(engine):
+    """
+    Keep PARTITION_DAYS_AHEAD days of partitions ahead of today, in a
+    transaction of its own. Only touches the database once per day per
+    process; a failure is logged and retried on the next call, since the
+    default partitions take any rows meanwhile.
+    """
+    global _checked_on
+    with _lock:
+        if _checked_on == today():
+            return
+        last_day = today() + datetime.timedelta(days=PARTITION_DAYS_AHEAD)
+        try:
+            with engine.begin() as connection:
+                create_partitions(connection, today(), last_day)
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.warning("could not create partitions through %s, retrying on the next call: %s", last_day, e)
+            return
+        _checked_on = today()
+    logger.info("partitions created through %s", last_day)
+
+
+def partitions(connection, parent: str):
+    """Names of every partition of parent, including the default partition."""
+    partitions_sql = """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST(:parent AS regclass)
+    """
+    return connection.execute(sqlalchemy.text(partitions_sql), [{"parent": parent}]).scalars().all()
+
+
+def day_partitions(connection, parent: str):
+    """Returns [(day, partition name)] for the daily partitions of parent, oldest first."""
+    day_partitions = []
+    for name in partitions(connection, parent):
+        suffix = name[len(parent) + 1:]
+        if suffix.isdigit():
+            day_partitions.append((datetime.datetime.strptime(suffix, "%Y%m%d").date(), name))
+    return sorted(day_partitions)
+
+
+def archive(engine, before: datetime.date):
+    """
+    Fold and drop every daily partition older than before, one partition
+    per transaction, then delete the processed and visits rows from those
+    days. Returns the archived days.
+    """
+    fold_sql = """
+        INSERT INTO archived_totals (day, balance, key, total)
+        SELECT :day, totals.* FROM ({totals}) AS totals (balance, key, total)
+        WHERE totals.total IS NOT NULL
+        ON CONFLICT (day, balance, key) DO UPDATE SET total = archived_totals.total + EXCLUDED.total
+    """
+    detach_sql = "ALTER TABLE {parent} DETACH PARTITION {partition}; DROP TABLE {partition}"
+    # A ledger row shares its processed row's transaction timestamp, so the
+    # processed rows of archived days are normally unreferenced by now; any
+    # whose ledger rows are still held (e.g. in a default partition) are kept.
+    prune_sql = """
+        DELETE FROM processed WHERE created_at < :before
+          AND NOT EXISTS (SELECT 1 FROM gold_ledger WHERE gold_ledger.processed_id = processed.id)
+          AND NOT EXISTS (SELECT 1 FROM barrel_ledger WHERE barrel_ledger.processed_id = processed.id)
+          AND NOT EXISTS (SELECT 1 FROM potion_ledger WHERE potion_ledger.processed_id = processed.id)
+          AND NOT EXISTS (SELECT 1 FROM global_plan WHERE global_plan.processed_id = processed.id);
+        DELETE FROM visits WHERE created_at < :before
+    """
+    archived = set()
+    with engine.begin() as connection:
+        partitions = [(parent, day, partition) for parent in [*LEDGER_TOTALS, *LOGS]
+                      for day, partition in day_partitions(connection, parent) if day < before]
+    for parent, day, partition in partitions:
+        with engine.begin() as connection:
+            if parent in LEDGER_TOTALS:
+                totals = LEDGER_TOTALS[parent].format(partition=partition)
+                connection.execute(sqlalchemy.text(fold_sql.format(totals=totals)), [{"day": day}])
+            connection.exec_driver_sql(detach_sql.format(parent=parent, partition=partition))
+        archived.add(day)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(prune_sql),
+                           [{"before": datetime.datetime.combine(before, datetime.time(), datetime.timezone.utc)}])
+    logger.info("archived days: %s", sorted(archived))
+    return sorted(archived)
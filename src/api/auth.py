@@ -1,20 +1,127 @@
 from fastapi import Security, HTTPException, status, Request
 from fastapi.security.api_key import APIKeyHeader
+from starlette.concurrency import run_in_threadpool
+import hashlib
+import hmac
+import logging
 import os
+import threading
+import time
 import dotenv
+import sqlalchemy
 
 dotenv.load_dotenv()
 
-api_keys = []  
+logger = logging.getLogger(__name__)
 
-api_keys.append(os.environ.get("API_KEY"))
 api_key_header = APIKeyHeader(name="access_token", auto_error=False)
 
 
+def hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class KeyStore:
+    """
+    SHA-256 hashes of every accepted API key. Keys come from API_KEY,
+    API_KEYS (comma separated), API_KEY_HASHES (comma separated hex
+    digests) and the api_keys table, and are reloaded every
+    API_KEY_TTL_SECONDS so keys can be added or revoked without a restart.
+    If the table cannot be read, its keys from the last successful load
+    are kept and the load is retried after API_KEY_RETRY_SECONDS.
+    """
+
+    def __init__(self, ttl: float, retry: float):
+        self.ttl = ttl
+        self.retry = retry
+        self.hashes = frozenset()
+        self.stored_hashes = frozenset()
+        self.refresh_at = None
+        self.lock = threading.Lock()
+
+    def env_hashes(self):
+        hashes = set()
+        keys = [os.environ.get("API_KEY", "")] + os.environ.get("API_KEYS", "").split(",")
+        hashes.update(hash_key(key.strip()) for key in keys if key.strip())
+        hashes.update(digest.strip().lower() for digest in os.environ.get("API_KEY_HASHES", "").split(",") if digest.strip())
+        return hashes
+
+    def db_hashes(self):
+        """The api_keys table's hashes, or None if it could not be read."""
+        from src import database as db
+        api_keys_sql = "SELECT key_hash FROM api_keys WHERE revoked_at IS NULL"
+        try:
+            with db.engine.begin() as connection:
+                return {row.key_hash.lower() for row in connection.execute(sqlalchemy.text(api_keys_sql))}
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.warning("could not load api_keys, keeping the last loaded keys and retrying in %gs: %s",
+                           self.retry, e)
+            return None
+
+    def refresh(self):
+        with self.lock:
+            if not self.expired():
+                return
+            db_hashes = self.db_hashes()
+            if db_hashes is None:
+                self.refresh_at = time.monotonic() + min(self.retry, self.ttl)
+            else:
+                self.stored_hashes = frozenset(db_hashes)
+                self.refresh_at = time.monotonic() + self.ttl
+            self.hashes = frozenset(self.env_hashes() | self.stored_hashes)
+
+    def expired(self):
+        return self.refresh_at is None or time.monotonic() >= self.refresh_at
+
+    def verify(self, api_key: str):
+        """Returns the key's hash if it is accepted, else None."""
+        digest = hash_key(api_key)
+        accepted = None
+        # Compare against every stored hash so the time taken does not
+        # depend on which key (if any) matched.
+        for stored in self.hashes:
+            if hmac.compare_digest(stored, digest):
+                accepted = stored
+        return accepted
+
+
+class RateLimiter:
+    """Token bucket per key: `rate` requests per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key_hash: str) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key_hash, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[key_hash] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+
+key_store = KeyStore(ttl=float(os.environ.get("API_KEY_TTL_SECONDS", 60)),
+                     retry=float(os.environ.get("API_KEY_RETRY_SECONDS", 5)))
+rate_limiter = RateLimiter(rate=float(os.environ.get("API_RATE_PER_SECOND", 0)),
+                           burst=float(os.environ.get("API_RATE_BURST", 100)))
+
+
 async def get_api_key(request: Request, api_key_header: str = Security(api_key_header)):
-    if api_key_header in api_keys:
-        return api_key_header
-    else:
+    if key_store.expired():
+        await run_in_threadpool(key_store.refresh)
+    key_hash = key_store.verify(api_key_header) if api_key_header else None
+    if key_hash is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Forbidden"
         )
+    if not rate_limiter.allow(key_hash):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded"
+        )
+    return api_key_header
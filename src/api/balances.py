@@ -0,0 +1,118 @@
+import sqlalchemy
+
+# Running balances maintained alongside the append-only ledgers. Every
+# handler that writes to gold_ledger, barrel_ledger, potion_ledger or
+# global_plan also applies the same delta here inside its transaction, so
+# planning reads never have to SUM the ledgers. The one exception is
+# checkout's gold, which is appended to gold_deltas rather than applied to
+# the single shop_balance row every checkout would otherwise queue on;
+# fold_gold moves it into shop_balance once a tick, and readers of the
+# gold balance add whatever is still pending.
+
+barrel_balance_sql = "INSERT INTO barrel_balances (barrel_type, potion_ml) VALUES (:barrel_type, :potion_ml) ON CONFLICT (barrel_type) DO UPDATE SET potion_ml = barrel_balances.potion_ml + EXCLUDED.potion_ml"
+potion_balance_sql = "INSERT INTO potion_balances (potion_type, quantity) VALUES (:potion_type, :quantity) ON CONFLICT (potion_type) DO UPDATE SET quantity = potion_balances.quantity + EXCLUDED.quantity"
+fold_gold_sql = """
+    WITH folded AS (
+        DELETE FROM gold_deltas RETURNING gold
+    )
+    UPDATE shop_balance SET gold = gold + (SELECT COALESCE(SUM(gold), 0) FROM folded) WHERE id = 1
+"""
+shop_balance_sql = "UPDATE shop_balance SET gold = gold + :gold, potion_capacity_units = potion_capacity_units + :potion_capacity_units, ml_capacity_units = ml_capacity_units + :ml_capacity_units WHERE id = 1"
+
+
+def record_barrel_ml(connection, ml_by_type: dict[str, int]):
+    """Apply ml deltas keyed by barrel type string, e.g. "{1,0,0,0}"."""
+    if len(ml_by_type) == 0:
+        return
+    connection.execute(sqlalchemy.text(barrel_balance_sql),
+                       [{"barrel_type": barrel_type, "potion_ml": potion_ml}
+                        for barrel_type, potion_ml in ml_by_type.items()])
+
+
+def record_potions(connection, quantity_by_type: dict[str, int]):
+    """Apply potion quantity deltas keyed by potion type string."""
+    if len(quantity_by_type) == 0:
+        return
+    connection.execute(sqlalchemy.text(potion_balance_sql),
+                       [{"potion_type": potion_type, "quantity": quantity}
+                        for potion_type, quantity in quantity_by_type.items()])
+
+
+def record_shop(connection, gold: int = 0, potion_capacity_units: int = 0, ml_capacity_units: int = 0):
+    connection.execute(sqlalchemy.text(shop_balance_sql),
+                       [{"gold": gold,
+                         "potion_capacity_units": potion_capacity_units,
+                         "ml_capacity_units": ml_capacity_units}])
+
+
+def fold_gold(connection):
+    """
+    Apply the pending checkout gold to shop_balance. Only committed deltas
+    are deleted, so a checkout still in flight is folded on a later call.
+    """
+    connection.execute(sqlalchemy.text(fold_gold_sql))
+
+
+def read_ml(connection):
+    """Per-color ml vector [r, g, b, d] from barrel_balances in one read."""
+    ml_sql = "SELECT barrel_type, potion_ml FROM barrel_balances"
+    ml_inventory = [0 for _ in range(4)]
+    for row in connection.execute(sqlalchemy.text(ml_sql)):
+        if sorted(row.barrel_type) == [0, 0, 0, 1]:
+            ml_inventory[row.barrel_type.index(1)] += row.potion_ml
+    return ml_inventory
+
+
+def reconcile(connection):
+    """
+    Compare the running balances against full sums over the ledgers plus
+    their archived totals, and reserved stock against the open
+    reservations, and return every row where they disagree. An empty list
+    means the balances are consistent.
+    """
+    barrel_diff_sql = """
+        SELECT 'barrel_ml' AS balance, ledger.barrel_type::text AS key,
+               COALESCE(ledger.total, 0) AS ledger, COALESCE(barrel_balances.potion_ml, 0) AS balance_value
+        FROM (SELECT barrel_type, SUM(potion_ml) AS total FROM (
+                  SELECT barrel_type, potion_ml FROM barrel_ledger
+                  UNION ALL
+                  SELECT key, total FROM archived_totals WHERE balance = 'barrel_ml'
+              ) AS entries (barrel_type, potion_ml) GROUP BY barrel_type) AS ledger
+        FULL OUTER JOIN barrel_balances ON barrel_balances.barrel_type = ledger.barrel_type
+        WHERE COALESCE(ledger.total, 0) <> COALESCE(barrel_balances.potion_ml, 0)
+    """
+    potion_diff_sql = """
+        SELECT 'potions' AS balance, ledger.potion_type::text AS key,
+               COALESCE(ledger.total, 0) AS ledger, COALESCE(potion_balances.quantity, 0) AS balance_value
+        FROM (SELECT potion_type, SUM(quantity) AS total FROM (
+                  SELECT potion_type, quantity FROM potion_ledger
+                  UNION ALL
+                  SELECT key, total FROM archived_totals WHERE balance = 'potions'
+              ) AS entries (potion_type, quantity) GROUP BY potion_type) AS ledger
+        FULL OUTER JOIN potion_balances ON potion_balances.potion_type = ledger.potion_type
+        WHERE COALESCE(ledger.total, 0) <> COALESCE(potion_balances.quantity, 0)
+    """
+    reserved_diff_sql = """
+        SELECT 'reserved_potions' AS balance, COALESCE(held.potion_type, potion_balances.potion_type)::text AS key,
+               COALESCE(held.total, 0) AS ledger, COALESCE(potion_balances.reserved, 0) AS balance_value
+        FROM (SELECT potion_type, SUM(quantity) AS total FROM potion_reservations GROUP BY potion_type) AS held
+        FULL OUTER JOIN potion_balances ON potion_balances.potion_type = held.potion_type
+        WHERE COALESCE(held.total, 0) <> COALESCE(potion_balances.reserved, 0)
+    """
+    shop_diff_sql = """
+        SELECT ledger.balance, NULL AS key, ledger.total + COALESCE(archived.total, 0) AS ledger, ledger.balance_value
+        FROM shop_balance, LATERAL (VALUES
+            ('gold', (SELECT COALESCE(SUM(gold), 0) FROM gold_ledger),
+             shop_balance.gold + (SELECT COALESCE(SUM(gold), 0) FROM gold_deltas)),
+            ('potion_capacity_units', (SELECT COALESCE(SUM(potion_capacity_units), 0) FROM global_plan), shop_balance.potion_capacity_units),
+            ('ml_capacity_units', (SELECT COALESCE(SUM(ml_capacity_units), 0) FROM global_plan), shop_balance.ml_capacity_units)
+        ) AS ledger (balance, total, balance_value)
+        LEFT JOIN (SELECT balance, SUM(total) AS total FROM archived_totals GROUP BY balance) AS archived
+          ON archived.balance = ledger.balance
+        WHERE shop_balance.id = 1 AND ledger.total + COALESCE(archived.total, 0) <> ledger.balance_value
+    """
+    discrepancies = []
+    for sql in (barrel_diff_sql, potion_diff_sql, reserved_diff_sql, shop_diff_sql):
+        result = connection.execute(sqlalchemy.text(sql))
+        discrepancies.extend(row._asdict() for row in result)
+    return discrepancies
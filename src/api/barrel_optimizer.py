@@ -0,0 +1,152 @@
+import math
+import numpy as np
+
+# Bounded-knapsack barrel purchasing. For each color a min-gold DP over
+# exact ml amounts (in units of the gcd of that color's barrel sizes)
+# says how much ml every gold budget can buy without overshooting the
+# color's target. The four per-color curves are then merged with a
+# max-plus convolution over the gold axis to split the budget between
+# colors, and the chosen amounts are traced back to SKU quantities.
+# SKUs of the same color mix freely.
+
+# Resolution of the gold axis. Budgets above this are bucketed, with
+# prices rounded up so the plan never exceeds the real budget.
+GOLD_STEPS = 2000
+
+# Resolution of the ml axis. When a color's need is more units of its
+# barrel-size gcd than this (odd sizes have a gcd of 1), the unit is
+# coarsened instead and barrel sizes are rounded up to it, so a plan
+# never overshoots the need and the table stays this size.
+ML_STEPS = 2000
+
+# Smallest share of ml capacity targeted for each color on offer, so a
+# color with no recent sales is still stocked and can start selling.
+MIN_COLOR_SHARE = 0.1
+
+
+def _color_curve(barrels, need, step, budget_steps):
+    """
+    Best ml for every scaled gold budget for one color (approximate when
+    the ml unit had to be coarsened). Returns the ml curve, the ml unit,
+    the exact-units reached at each budget, and what is needed to trace
+    units back to barrel quantities.
+    """
+    unit = 0
+    for _, barrel in barrels:
+        unit = math.gcd(unit, barrel.ml_per_barrel)
+    if unit > 0 and need // unit > ML_STEPS:
+        unit = math.ceil(need / ML_STEPS)
+    units = need // unit if unit > 0 else 0
+    best_units = np.zeros(budget_steps + 1, dtype=np.int64)
+    if units == 0:
+        return best_units * 0, unit, best_units, []
+    inf = np.iinfo(np.int64).max // 2
+    cost = np.full(units + 1, inf, dtype=np.int64)
+    cost[0] = 0
+    # Bounded quantities are split into power-of-two chunks so each chunk
+    # is a 0/1 item; took records where a chunk improved the cost.
+    chunks = []
+    for index, barrel in barrels:
+        weight = math.ceil(barrel.ml_per_barrel / unit)
+        price = math.ceil(barrel.price / step)
+        remaining = barrel.quantity
+        k = 1
+        while remaining > 0:
+            take = min(k, remaining)
+            remaining -= take
+            k *= 2
+            w = take * weight
+            if w > units:
+                continue
+            candidate = cost[:units + 1 - w] + take * price
+            took = np.zeros(units + 1, dtype=bool)
+            took[w:] = candidate < cost[w:]
+            cost[w:] = np.where(took[w:], candidate, cost[w:])
+            chunks.append((index, take, w, took))
+    reachable = np.nonzero(cost <= budget_steps)[0]
+    best_at_cost = np.full(budget_steps + 1, -1, dtype=np.int64)
+    np.maximum.at(best_at_cost, cost[reachable], reachable)
+    best_units = np.maximum.accumulate(best_at_cost)
+    return best_units * unit, unit, best_units, chunks
+
+
+def _trace(chunks, units):
+    quantities = {}
+    for index, take, w, took in reversed(chunks):
+        if units >= w and took[units]:
+            quantities[index] = quantities.get(index, 0) + take
+            units -= w
+    return quantities
+
+
+def plan_purchase(barrels, needs, budget):
+    """
+    Returns {barrel index: quantity} maximizing ml bought toward the four
+    per-color ml needs without exceeding any need or the gold budget.
+    Barrels that are not a single color are ignored.
+    """
+    if budget <= 0:
+        return {}
+    step = max(1, math.ceil(budget / GOLD_STEPS))
+    budget_steps = budget // step
+    by_color = [[] for _ in range(4)]
+    for index, barrel in enumerate(barrels):
+        if barrel.price <= 0 or barrel.ml_per_barrel <= 0 or barrel.quantity <= 0:
+            continue
+        if sorted(barrel.potion_type) != [0, 0, 0, 1]:
+            continue
+        by_color[barrel.potion_type.index(1)].append((index, barrel))
+
+    curves = [_color_curve(by_color[c], max(int(needs[c]), 0), step, budget_steps) for c in range(4)]
+    # Merge colors: combined[g] is the best total ml over the colors seen
+    # so far with g scaled gold, and splits[c][g] the gold given to color c.
+    combined = curves[0][0].copy()
+    splits = [np.arange(budget_steps + 1)]
+    for ml_curve, _, _, _ in curves[1:]:
+        merged = combined.copy()
+        split = np.zeros(budget_steps + 1, dtype=np.int64)
+        # Only budgets where this color's curve steps up can improve the merge.
+        for h in np.nonzero(np.diff(ml_curve, prepend=0) > 0)[0]:
+            candidate = combined[:budget_steps + 1 - h] + ml_curve[h]
+            better = candidate > merged[h:]
+            merged[h:] = np.where(better, candidate, merged[h:])
+            split[h:] = np.where(better, h, split[h:])
+        combined = merged
+        splits.append(split)
+
+    gold = int(np.argmax(combined))
+    quantities = {}
+    for c in range(3, -1, -1):
+        color_gold = int(splits[c][gold]) if c > 0 else gold
+        gold -= color_gold
+        _, _, best_units, chunks = curves[c]
+        if len(chunks) > 0:
+            quantities.update(_trace(chunks, int(best_units[color_gold])))
+    return quantities
+
+
+def color_needs(ml_capacity, available_ml, current_ml, color_demand, offered_colors):
+    """
+    Per-color ml to buy: capacity is split between the offered colors by
+    their share of recent potion demand among offered colors (evenly when
+    none of them has sold), with every offered color kept at
+    MIN_COLOR_SHARE or more so a color that was never stocked, and so
+    never sold, still gets bought. Less what is already stocked, scaled
+    down to the free ml.
+    """
+    if len(offered_colors) == 0:
+        return [0, 0, 0, 0]
+    floor = min(MIN_COLOR_SHARE, 1 / len(offered_colors))
+    offered_demand = sum(max(color_demand[c], 0) for c in offered_colors)
+    shares = [0, 0, 0, 0]
+    for c in offered_colors:
+        if offered_demand > 0:
+            demand_share = max(color_demand[c], 0) / offered_demand
+        else:
+            demand_share = 1 / len(offered_colors)
+        shares[c] = floor + (1 - floor * len(offered_colors)) * demand_share
+    needs = [max(int(ml_capacity * shares[c]) - current_ml[c], 0) for c in range(4)]
+    total_need = sum(needs)
+    if total_need > max(available_ml, 0):
+        needs = [need * max(available_ml, 0) // total_need for need in needs]
+    return needs
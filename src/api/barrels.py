@@ -1,9 +1,12 @@
+import logging
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from src.api import auth
+from src.api import auth, balances, processed, planning_cache, barrel_optimizer
 import sqlalchemy
 from src import database as db
 from src.api.helpers import potion_type_tostr
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/barrels",
     tags=["barrels"],
@@ -22,87 +25,76 @@ class Barrel(BaseModel):
 @router.post("/deliver/{order_id}")
 def post_deliver_barrels(barrels_delivered: list[Barrel], order_id: int):
     """ """
-    print(f"barrels delivered: {barrels_delivered} order_id: {order_id}")
-    processed_entry_sql = "INSERT INTO processed (order_id, type) VALUES (:order_id, 'barrels') RETURNING id"
-    barrel_insert_sql = "INSERT INTO barrel_ledger (processed_id, barrel_type, potion_ml) VALUES (:processed_id, :barrel_type, :potion_ml)"
-    gold_ledger_sql = "INSERT INTO gold_ledger (processed_id, gold) VALUES (:processed_id, :gold)"
+    logger.info("barrels delivered: %d lines order_id: %s", len(barrels_delivered), order_id)
+    logger.debug("barrels delivered: %s order_id: %s", barrels_delivered, order_id)
+    ml_by_type = {}
+    gold = 0
     with db.engine.begin() as connection:
-        processed_id = connection.execute(sqlalchemy.text(processed_entry_sql),
-                           [{"order_id": order_id}]).scalar_one()
+        processed_id = processed.claim(connection, order_id, "barrels")
+        if processed_id is None:
+            return "OK"
+        # One ledger row per barrel line, written as a single multi-row insert
+        barrel_entries = []
+        gold_entries = []
         for barrel in barrels_delivered:
-            for _ in range(barrel.quantity):
-                connection.execute(sqlalchemy.text(barrel_insert_sql), [{"processed_id": processed_id, 
-                                                                         "barrel_type": potion_type_tostr(barrel.potion_type), 
-                                                                         "potion_ml": barrel.ml_per_barrel}])
-            connection.execute(sqlalchemy.text(gold_ledger_sql), 
-                               [{"processed_id": processed_id, 
-                                 "gold": -barrel.price * barrel.quantity}])
+            barrel_type = potion_type_tostr(barrel.potion_type)
+            ml_by_type[barrel_type] = ml_by_type.get(barrel_type, 0) + barrel.ml_per_barrel * barrel.quantity
+            gold -= barrel.price * barrel.quantity
+            barrel_entries.append({"processed_id": processed_id,
+                                   "barrel_type": barrel.potion_type,
+                                   "potion_ml": barrel.ml_per_barrel * barrel.quantity})
+            gold_entries.append({"processed_id": processed_id,
+                                 "gold": -barrel.price * barrel.quantity})
+        if len(barrel_entries) > 0:
+            connection.execute(sqlalchemy.insert(db.table("barrel_ledger")).values(barrel_entries))
+            connection.execute(sqlalchemy.insert(db.table("gold_ledger")).values(gold_entries))
+        balances.record_barrel_ml(connection, ml_by_type)
+        balances.record_shop(connection, gold=gold)
+    planning_cache.invalidate()
     return "OK"
 
 # Gets called once a day
 @router.post("/plan")
 def get_wholesale_purchase_plan(wholesale_catalog: list[Barrel]):
     """ """
-    print(wholesale_catalog)
+    logger.debug("wholesale catalog: %s", wholesale_catalog)
+    plan_key = ("barrel_plan", tuple((barrel.sku, barrel.ml_per_barrel, tuple(barrel.potion_type), barrel.price, barrel.quantity)
+                                     for barrel in wholesale_catalog))
     inventory_sql = "SELECT ml, gold, ml_capacity from inventory"
     disposable_gold_sql = "SELECT barrels_disposable_gold FROM global_inventory"
-    barrel_ml_sql = "SELECT COALESCE(SUM(potion_ml), 0) FROM barrel_ledger WHERE barrel_type = :barrel_type"
+    recent_demand_sql = "SELECT potion_type, -SUM(quantity) AS sold FROM potion_ledger WHERE quantity < 0 AND created_at > NOW() - INTERVAL '1 day' GROUP BY potion_type"
 
     with db.engine.begin() as connection:
+        version = planning_cache.version(connection)
+        cached_plan = planning_cache.get(plan_key, version)
+        if cached_plan is not None:
+            return cached_plan
         # Initialize globals
         ml, running_total, max_ml = connection.execute(sqlalchemy.text(inventory_sql)).fetchone()
         disposable_gold_pct = connection.execute(sqlalchemy.text(disposable_gold_sql)).scalar_one()
         running_total = int(running_total * disposable_gold_pct)
         ml_capacity = (max_ml * 10000)
         available_ml = ml_capacity - ml
-        wholesale_catalog.sort(key=lambda x: x.ml_per_barrel/x.price, reverse=True)
-        # Initialize loop variables
-        barrel_plan = []
-        barrel_type_set = set()
-        dark_present = False
-        for barrel in wholesale_catalog:
-            if barrel.potion_type[3] == 1:
-                dark_present = True
-        for barrel in wholesale_catalog:
-            # Determine the threshold for the barrel
-            if barrel.sku.__contains__("SMALL"):
-                if ml_capacity < 20000:
-                    ml_threshold = int(ml_capacity * 0.2)
-                else:
-                    ml_threshold = int(ml_capacity * 0.1)
-            elif barrel.sku.__contains__("MEDIUM"):
-                if ml_capacity < 40000:
-                    ml_threshold = int(ml_capacity / 3)
-                else:
-                    ml_threshold = int(ml_capacity / 6)
-            elif barrel.sku.__contains__("LARGE"):
-                ml_threshold = ml_capacity / 3
-            elif barrel.sku.__contains__("MINI"):
-                ml_threshold = 0
-            else:
-                ml_threshold = 0
-                print(f"Unknown barrel type: {barrel.sku}")
-            if dark_present:
-                ml_threshold = int(ml_threshold * 3 / 4)
-            if potion_type_tostr(barrel.potion_type) not in barrel_type_set:
-                # Get the current ml for the barrel type
-                barrel_ml = connection.execute(sqlalchemy.text(barrel_ml_sql), 
-                                            [{"barrel_type": potion_type_tostr(barrel.potion_type)}]).scalar_one()
-                # Calculate the quantity of barrels to buy
-                max_buy_gold = running_total // barrel.price
-                max_buy_ml = available_ml // barrel.ml_per_barrel
-                max_buy_ml_threshold = (ml_threshold - barrel_ml) // barrel.ml_per_barrel
-                quantity = min(max_buy_gold, max_buy_ml, max_buy_ml_threshold, barrel.quantity)
-                if quantity > 0:
-                    barrel_plan.append(
-                        {
-                            "sku": barrel.sku,
-                            "quantity": quantity
-                        }
-                    )
-                    running_total -= barrel.price * quantity
-                    available_ml -= barrel.ml_per_barrel * quantity
-                    barrel_type_set.add(potion_type_tostr(barrel.potion_type))
+        current_ml = balances.read_ml(connection)
+        # Recent sales, converted into ml demand per color
+        color_demand = [0 for _ in range(4)]
+        for row in connection.execute(sqlalchemy.text(recent_demand_sql)):
+            for i in range(4):
+                color_demand[i] += row.sold * row.potion_type[i]
 
-        print(f"barrel purchase plan: {barrel_plan}, running_total: {running_total}")
-        return barrel_plan
\ No newline at end of file
+    offered_colors = {barrel.potion_type.index(1) for barrel in wholesale_catalog if 1 in barrel.potion_type}
+    needs = barrel_optimizer.color_needs(ml_capacity, available_ml, current_ml, color_demand, offered_colors)
+    quantities = barrel_optimizer.plan_purchase(wholesale_catalog, needs, running_total)
+    barrel_plan = []
+    for index, barrel in enumerate(wholesale_catalog):
+        if quantities.get(index, 0) > 0:
+            barrel_plan.append(
+                {
+                    "sku": barrel.sku,
+                    "quantity": quantities[index]
+                }
+            )
+            running_total -= barrel.price * quantities[index]
+    logger.info("barrel purchase plan: %s, ml needs: %s, running_total: %s", barrel_plan, needs, running_total)
+    planning_cache.put(plan_key, barrel_plan, version)
+    return barrel_plan
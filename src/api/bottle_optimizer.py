@@ -0,0 +1,78 @@
+import numpy as np
+
+# Greedy-with-bound bottling over every recipe at once. Each step bottles
+# the recipe with the best expected revenue per unit of scarce ml, taking
+# half of what is still feasible for it so later steps can rebalance
+# toward other recipes as colors run low. Feasibility (ml per color,
+# potion capacity, per-recipe threshold) is recomputed for all recipes as
+# one vectorized operation per step.
+
+# Share of expected revenue given to recipes no visiting class has bought
+# yet, so spare ml is still bottled instead of left stranded.
+UNREQUESTED_VALUE = 0.01
+
+
+def expected_demand(potion_types, visits, preference_matrix):
+    """
+    Expected purchases per recipe for today's visitors: each class's visit
+    count spread over the potion types in proportion to what that class
+    has bought before.
+    """
+    index = {tuple(potion_type): i for i, potion_type in enumerate(potion_types)}
+    demand = np.zeros(len(potion_types))
+    for visit in visits:
+        class_preferences = preference_matrix.get(visit["character_class"], [])
+        total_bought = sum(pref["amount_bought"] for pref in class_preferences)
+        if total_bought == 0:
+            continue
+        for pref in class_preferences:
+            i = index.get(tuple(pref["potion_type"]))
+            if i is not None:
+                demand[i] += visit["total_characters"] * pref["amount_bought"] / total_bought
+    return demand
+
+
+def plan_bottling(recipes, stock, prices, demand, ml_inventory, available_potions,
+                  trained_threshold, threshold, seed=None):
+    """
+    Returns the number of potions to bottle for each recipe row.
+
+    Recipes with any expected demand may be stocked up to trained_threshold,
+    the rest up to threshold. With a seed the recipe values are jittered by
+    up to 10% from a seeded generator, so the plan varies between seeds but
+    is reproducible for any one of them.
+    """
+    recipes = np.asarray(recipes, dtype=np.int64).reshape(-1, 4)
+    quantities = np.zeros(len(recipes), dtype=np.int64)
+    if len(recipes) == 0:
+        return quantities
+    ml = np.asarray(ml_inventory, dtype=np.int64).copy()
+    demand = np.asarray(demand, dtype=float)
+    caps = np.where(demand > 0, trained_threshold, threshold) - np.asarray(stock, dtype=np.int64)
+    uses = recipes > 0
+    # A recipe drawing on no ml would score as free and bottle without
+    # limit, so it is never bottled.
+    caps = np.where(uses.any(axis=1), np.maximum(caps, 0), 0)
+    total_demand = demand.sum()
+    share = demand / total_demand if total_demand > 0 else np.zeros(len(recipes))
+    value = np.asarray(prices, dtype=float) * (share + UNREQUESTED_VALUE)
+    if seed is not None:
+        value = value * np.random.default_rng(seed).uniform(0.9, 1.1, len(recipes))
+    divisors = np.where(uses, recipes, 1)
+    unbounded = np.iinfo(np.int64).max
+    available = int(available_potions)
+    while available > 0:
+        ml_max = np.where(uses, ml[np.newaxis, :] // divisors, unbounded).min(axis=1)
+        feasible = np.minimum(np.minimum(ml_max, caps - quantities), available)
+        if not (feasible > 0).any():
+            break
+        # Colors are priced by scarcity so recipes drawing on plentiful ml
+        # are preferred and no single color is drained first.
+        cost = recipes @ (1.0 / np.maximum(ml, 1))
+        score = np.where(feasible > 0, value / np.where(cost > 0, cost, 1), -np.inf)
+        best = int(np.argmax(score))
+        step = max(1, int(feasible[best]) // 2)
+        quantities[best] += step
+        ml -= recipes[best] * step
+        available -= step
+    return quantities
@@ -1,11 +1,17 @@
+import logging
 from random import randint
-from fastapi import APIRouter, Depends, Request
+from datetime import datetime
+import base64
+import json
+from fastapi import APIRouter, Depends, Request, HTTPException, status
 from pydantic import BaseModel
-from src.api import auth
+from src.api import auth, planning_cache, reservations
 from enum import Enum
 import sqlalchemy
 from src import database as db
-from src.api.helpers import potion_type_tostr
+from src.api.helpers import potion_type_tostr, contains_pattern
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/carts",
@@ -23,8 +29,89 @@ class search_sort_order(str, Enum):
     asc = "asc"
     desc = "desc"   
 
+PAGE_SIZE = 5
+
+# One prepared select per sort column/order/seek-direction combination,
+# built on first use from the shared table registry and reused for every
+# later request. Pages are fetched with a keyset seek on (sort key, line
+# item id) rather than an OFFSET, so deep pages cost the same as page one.
+_search_statements = {}
+
+def search_sort_column(sort_col: search_sort_options):
+    carts = db.table("carts")
+    cart_items = db.table("cart_items")
+    potion_catalog_items = db.table("potion_catalog_items")
+    if sort_col == search_sort_options.customer_name:
+        return carts.c.customer_name
+    elif sort_col == search_sort_options.item_sku:
+        return cart_items.c.item_sku
+    elif sort_col == search_sort_options.line_item_total:
+        return potion_catalog_items.c.price * cart_items.c.quantity
+    return cart_items.c.created_at
+
+def search_statement(sort_col: search_sort_options, sort_order: search_sort_order,
+                     seek: bool = False, backwards: bool = False):
+    key = (sort_col.value, sort_order.value, seek, backwards)
+    if key not in _search_statements:
+        carts = db.table("carts")
+        cart_items = db.table("cart_items")
+        potion_catalog_items = db.table("potion_catalog_items")
+        sort_column = search_sort_column(sort_col)
+        # Walking backwards flips the scan direction; the page is reversed
+        # again after it is fetched.
+        ascending = (sort_order == search_sort_order.asc) != backwards
+        direction = sqlalchemy.asc if ascending else sqlalchemy.desc
+        stmt = sqlalchemy.select(
+            cart_items.c.id.label("id"),
+            cart_items.c.item_sku,
+            carts.c.customer_name,
+            (potion_catalog_items.c.price * cart_items.c.quantity).label("line_item_total"),
+            cart_items.c.created_at.label("timestamp"),
+            sort_column.label("sort_key")
+            ).select_from(
+                cart_items.join(
+                    carts, cart_items.c.cart_id == carts.c.id
+                    ).join(
+                        potion_catalog_items, cart_items.c.item_sku == potion_catalog_items.c.sku
+                    )
+            ).limit(PAGE_SIZE + 1
+            ).order_by(direction(sort_column), direction(cart_items.c.id))
+        if seek:
+            row_key = sqlalchemy.tuple_(sort_column, cart_items.c.id)
+            cursor_key = sqlalchemy.tuple_(sqlalchemy.bindparam("sort_key", type_=sort_column.type),
+                                           sqlalchemy.bindparam("line_item_id", type_=cart_items.c.id.type))
+            stmt = stmt.where(row_key > cursor_key if ascending else row_key < cursor_key)
+            # The row comparison can only use an index on (sort key, line
+            # item id). customer_name's tiebreak lives in another table, so
+            # the implied bound on the sort key alone is what lets
+            # carts_customer_name_id_idx start the scan at the cursor.
+            sort_bound = sqlalchemy.bindparam("sort_key", type_=sort_column.type)
+            stmt = stmt.where(sort_column >= sort_bound if ascending else sort_column <= sort_bound)
+        _search_statements[key] = stmt
+    return _search_statements[key]
+
+def encode_search_cursor(sort_col: search_sort_options, row, backwards: bool):
+    sort_key = row.sort_key
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat()
+    cursor = {"c": sort_col.value, "k": sort_key, "i": row.id, "b": backwards}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def decode_search_cursor(sort_col: search_sort_options, search_page: str):
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(search_page.encode()))
+        if cursor["c"] != sort_col.value:
+            raise ValueError("cursor was issued for a different sort column")
+        sort_key = cursor["k"]
+        if sort_col == search_sort_options.timestamp:
+            sort_key = datetime.fromisoformat(sort_key)
+        return sort_key, int(cursor["i"]), bool(cursor["b"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Invalid search page: {e}")
+
 @router.get("/search/", tags=["search"])
-def search_orders(
+async def search_orders(
     customer_name: str = "",
     potion_sku: str = "",
     search_page: str = "",
@@ -55,70 +142,46 @@ def search_orders(
     Your results must be paginated, the max results you can return at any
     time is 5 total line items.
     """
-    offset = 0
-    if search_page != "":
-        offset = int(search_page) * 5
-    search_sql = "SELECT cart_items.id, cart_items.item_sku, carts.customer_name, potion_catalog_items.price * cart_items.quantity as line_item_total, cart_items.created_at as timestamp FROM cart_items JOIN carts ON cart_items.cart_id = carts.id JOIN potion_catalog_items ON cart_items.item_sku = potion_catalog_items.sku WHERE carts.customer_name ILIKE :customer_name AND cart_items.item_sku ILIKE :item_sku ORDER BY {} {} LIMIT 5 OFFSET :offset".format(sort_col, sort_order)
-    search_results = []
-    # Set up the tables
-    metadata = sqlalchemy.MetaData()
-    carts = sqlalchemy.Table("carts", metadata, autoload_with=db.engine)
-    cart_items = sqlalchemy.Table("cart_items", metadata, autoload_with=db.engine)
-    potion_catalog_items = sqlalchemy.Table("potion_catalog_items", metadata, autoload_with=db.engine)
-    # Set order by
-    if sort_col == "customer_name":
-        sort_col = carts.c.customer_name
-    elif sort_col == "item_sku":
-        sort_col = cart_items.c.item_sku
-    elif sort_col == "line_item_total":
-        sort_col = potion_catalog_items.c.price * cart_items.c.quantity
-    elif sort_col == "timestamp":
-        sort_col = cart_items.c.created_at
-    if sort_order == "asc":
-        sort_order = sqlalchemy.asc(sort_col)
-    elif sort_order == "desc":
-        sort_order = sqlalchemy.desc(sort_col)
-    print(f"sort_col: {sort_col} sort_order: {sort_order}, offset: {offset}")
-    # Initialize Statement
-    search_stmt = sqlalchemy.select(
-        cart_items.c.id.label("id"), 
-        cart_items.c.item_sku, 
-        carts.c.customer_name, 
-        (potion_catalog_items.c.price * cart_items.c.quantity).label("line_item_total"), 
-        cart_items.c.created_at.label("timestamp")
-        ).select_from(
-            cart_items.join(
-                carts, cart_items.c.cart_id == carts.c.id
-                ).join(
-                    potion_catalog_items, cart_items.c.item_sku == potion_catalog_items.c.sku
-                )
-        ).limit(5
-        ).offset(offset
-        ).order_by(sort_order)
+    seek = search_page != ""
+    sort_key, line_item_id, backwards = None, None, False
+    if seek:
+        sort_key, line_item_id, backwards = decode_search_cursor(sort_col, search_page)
+    search_stmt = search_statement(sort_col, sort_order, seek, backwards)
     if customer_name != "":
-        search_stmt = search_stmt.where(carts.c.customer_name.ilike(customer_name))
+        search_stmt = search_stmt.where(db.table("carts").c.customer_name.ilike(sqlalchemy.bindparam("customer_name"), escape="\\"))
     if potion_sku != "":
-        search_stmt = search_stmt.where(cart_items.c.item_sku.ilike(potion_sku))
-    print(f"search_stmt: {search_stmt}")
-    with db.engine.begin() as connection:
-        result = connection.execute(search_stmt)
-        results = [row._asdict() for row in result.fetchall()]
-        print(f"results: {results}")
-        for row in results:
-            search_results.append(
-                {
-                    "line_item_id": row["id"],
-                    "item_sku": row["item_sku"],
-                    "customer_name": row["customer_name"],
-                    "line_item_total": row["line_item_total"],
-                    "timestamp": row["timestamp"],
-                }
-            )
-    if search_page == "":
-        next = str(1)
+        search_stmt = search_stmt.where(db.table("cart_items").c.item_sku.ilike(sqlalchemy.bindparam("potion_sku"), escape="\\"))
+    async with db.async_engine.begin() as connection:
+        rows = (await connection.execute(search_stmt, {"sort_key": sort_key,
+                                                       "line_item_id": line_item_id,
+                                                       "customer_name": contains_pattern(customer_name),
+                                                       "potion_sku": contains_pattern(potion_sku)})).fetchall()
+    # One extra row is fetched to tell whether another page exists past
+    # this one in the direction we walked.
+    more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if backwards:
+        rows.reverse()
+        has_previous, has_next = more, True
     else:
-        next = str(int(search_page) + 1)
-    previous = search_page
+        has_previous, has_next = seek, more
+    previous = ""
+    next = ""
+    if len(rows) > 0:
+        if has_previous:
+            previous = encode_search_cursor(sort_col, rows[0], backwards=True)
+        if has_next:
+            next = encode_search_cursor(sort_col, rows[-1], backwards=False)
+    search_results = [
+        {
+            "line_item_id": row.id,
+            "item_sku": row.item_sku,
+            "customer_name": row.customer_name,
+            "line_item_total": row.line_item_total,
+            "timestamp": row.timestamp,
+        }
+        for row in rows
+    ]
     return {
         "previous": previous,
         "next": next,
@@ -147,47 +210,42 @@ class Customer(BaseModel):
     level: int
 
 @router.post("/visits/{visit_id}")
-def post_visits(visit_id: int, customers: list[Customer]):
+async def post_visits(visit_id: int, customers: list[Customer]):
     """
     Which customers visited the shop today?
     """
     # Log the visit_id and customers
-    print(f"visit_id: {visit_id} customers: {customers}")
-    # Set up the tables
-    metadata = sqlalchemy.MetaData()
-    visits = sqlalchemy.Table("visits", metadata, autoload_with=db.engine)
-    global_time = sqlalchemy.Table("global_time", metadata, autoload_with=db.engine)
-    get_day_sql = "SELECT day FROM global_time"
-    visits_entry_sql = "INSERT INTO visits (customer_name, character_class, level, day) VALUES (:customer_name, :character_class, :level, :day)"
-    with db.engine.begin() as connection:
-        day = connection.execute(sqlalchemy.text(get_day_sql)).scalar_one()
-        for customer in customers:
-            connection.execute(sqlalchemy.text(visits_entry_sql), 
-                               [{"customer_name": customer.customer_name, 
-                                 "character_class": customer.character_class, 
-                                 "level": customer.level,
-                                 "day": day}])
-        # # Get the current day
-        # day = connection.execute(sqlalchemy.select([global_time.c.day])).scalar_one()
-        # for customer in customers:
-        #     # Insert the visit
-        #     connection.execute(
-        #         sqlalchemy.insert(
-        #             visits
-        #             ).values(
-        #                 customer_name=customer.customer_name,
-        #                 character_class=customer.character_class,
-        #                 level=customer.level,
-        #                 day=day
-        #             )
-        #     )
+    logger.info("visit_id: %s customers: %d", visit_id, len(customers))
+    logger.debug("visit_id: %s customers: %s", visit_id, customers)
+    # The whole batch is one statement: customers are unnested from three
+    # parallel arrays, stamped with the current day, and numbered so a
+    # resent visit_id conflicts on (visit_id, position) and is skipped.
+    visits_entry_sql = """
+        INSERT INTO visits (visit_id, position, customer_name, character_class, level, day)
+        SELECT :visit_id, customers.position, customers.customer_name, customers.character_class,
+               customers.level, global_time.day
+        FROM unnest(CAST(:customer_names AS text[]), CAST(:character_classes AS text[]), CAST(:levels AS integer[]))
+             WITH ORDINALITY AS customers (customer_name, character_class, level, position)
+        CROSS JOIN global_time
+        ON CONFLICT (visit_id, position) DO NOTHING
+    """
+    if len(customers) == 0:
+        return "OK"
+    async with db.async_engine.connect() as connection:
+        async with connection.begin():
+            await connection.execute(sqlalchemy.text(visits_entry_sql),
+                                     [{"visit_id": visit_id,
+                                       "customer_names": [customer.customer_name for customer in customers],
+                                       "character_classes": [customer.character_class for customer in customers],
+                                       "levels": [customer.level for customer in customers]}])
+        # Today's visitors weight the catalog and the bottling plan.
+        await planning_cache.invalidate_async(connection)
     return "OK"
 
 
 @router.post("/")
-def create_cart(new_cart: Customer):
+async def create_cart(new_cart: Customer):
     """ """
-    metadata = sqlalchemy.MetaData()
     # carts = sqlalchemy.Table("carts", metadata, autoload_with=db.engine)
     # cart_insert_stmt = sqlalchemy.insert(
     #     carts
@@ -196,11 +254,13 @@ def create_cart(new_cart: Customer):
     #         character_class=new_cart.character_class,
     #         level=new_cart.level
     #     ).returning(carts.c.id)
-    with db.engine.begin() as connection:
+    async with db.async_engine.begin() as connection:
+        # Lines are priced as they are added (see reservations.hold), not
+        # against whichever snapshot is newest when the cart is created.
         cart_insert_stmt = "INSERT INTO carts (customer_name, character_class, level) VALUES (:customer_name, :character_class, :level) RETURNING id"
-        cart_id = connection.execute(sqlalchemy.text(cart_insert_stmt),
-                                     [{"customer_name": new_cart.customer_name, "character_class": new_cart.character_class, "level": new_cart.level}]).scalar_one()
-    print(f"cart_id: {cart_id} customer_name: {new_cart.customer_name} character_class: {new_cart.character_class} level: {new_cart.level}")
+        cart_id = (await connection.execute(sqlalchemy.text(cart_insert_stmt),
+                                            [{"customer_name": new_cart.customer_name, "character_class": new_cart.character_class, "level": new_cart.level}])).scalar_one()
+    logger.info("cart_id: %s customer_name: %s character_class: %s level: %s", cart_id, new_cart.customer_name, new_cart.character_class, new_cart.level)
     return {"cart_id": cart_id}
 
 
@@ -209,22 +269,27 @@ class CartItem(BaseModel):
 
 
 @router.post("/{cart_id}/items/{item_sku}")
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+async def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
     """ """
     # Log the cart_id, item_sku, and quantity
-    print(f"cart_id: {cart_id} item_sku: {item_sku} quantity: {cart_item.quantity}")
-    metadata = sqlalchemy.MetaData()
+    logger.info("cart_id: %s item_sku: %s quantity: %s", cart_id, item_sku, cart_item.quantity)
     # cart_items = sqlalchemy.Table("cart_items", metadata, autoload_with=db.engine)
     # cart_items_insert_stmt = sqlalchemy.insert(
     #     cart_id=cart_id,
     #     item_sku=item_sku,
     #     quantity=cart_item.quantity
     # )
-    sql_to_execute = "INSERT INTO cart_items (cart_id, item_sku, quantity) VALUES (:cart_id, :item_sku, :quantity)"
-    with db.engine.begin() as connection:
-        connection.execute(sqlalchemy.text(sql_to_execute),
-                           [{"cart_id": cart_id, "item_sku": item_sku, "quantity": cart_item.quantity}])
-        # connection.execute(cart_items_insert_stmt)
+    # Setting a quantity again replaces the line instead of adding another,
+    # so a cart never holds more than one line per sku. The line is only
+    # written if the stock to back it can be reserved.
+    async with db.async_engine.connect() as connection:
+        async with connection.begin():
+            held = await connection.run_sync(reservations.hold, cart_id, item_sku, cart_item.quantity)
+            # connection.execute(cart_items_insert_stmt)
+        if not held:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Not enough stock")
+        # The catalog lists unreserved stock.
+        await planning_cache.invalidate_async(connection)
     return "OK"
 
 
@@ -232,52 +297,95 @@ class CartCheckout(BaseModel):
     payment: str
 
 @router.post("/{cart_id}/checkout")
-def checkout(cart_id: int, cart_checkout: CartCheckout):
+async def checkout(cart_id: int, cart_checkout: CartCheckout):
     """ """
     # Log the cart_id and payment
-    print(f"cart_id: {cart_id} payment: {cart_checkout.payment}")
-    total_quantity = 0
-    total_gold = 0
-    cart_items_sql = "SELECT * FROM cart_items WHERE cart_id = :cart_id"
-    update_timestamp_sql = "UPDATE potion_catalog_items SET last_selected = NOW() WHERE sku = :sku"
-    processed_entry_sql = "INSERT INTO processed (order_id, type) VALUES (:order_id, 'checkout') RETURNING id"
-    potion_type_sql = "SELECT potion_type, price FROM potion_catalog_items WHERE sku = :sku"
-    potion_update_sql = "INSERT INTO potion_ledger (processed_id, potion_type, quantity) VALUES (:processed_id, :potion_type, :quantity)"
-    gold_sql = "INSERT INTO gold_ledger (processed_id, gold) VALUES (:processed_id, :gold)"
-    potion_price_sql = "SELECT price FROM locked_prices WHERE sku = :sku"
-    character_class_sql = "SELECT character_class FROM carts WHERE id = :cart_id"
-    preferences_insert_sql = "INSERT INTO class_preferences (character_class, potion_type) VALUES (:character_class, :potion_type)"
-    # metadata = sqlalchemy.MetaData()
-    # potions = sqlalchemy.Table("potion_ledger", metadata, autoload_with=db.engine)
-    # cart_items = sqlalchemy.Table("cart_items", metadata, autoload_with=db.engine)
-    # potion_catalog_items = sqlalchemy.Table("potion_catalog_items", metadata, autoload_with=db.engine)
+    logger.info("cart_id: %s payment: %s", cart_id, cart_checkout.payment)
+    # The cart's reservations are deleted and turned into lines in one
+    # statement, each priced from the snapshot the line was quoted against,
+    # and all ledger writes are set-based off of those lines, so a checkout
+    # is a single statement regardless of how many lines the cart has. Stock
+    # was already set aside when the items were added, so selling it cannot
+    # take a potion type below zero. The gold goes to gold_deltas rather
+    # than the shared shop_balance row, so checkouts of different potions
+    # never wait on each other. Lines whose hold lapsed are held again
+    # first; if any line cannot be held or priced, nothing is sold and the
+    # checkout fails naming those lines.
+    checkout_sql = """
+        WITH processed_entry AS (
+            INSERT INTO processed (order_id, type) VALUES (:cart_id, 'checkout')
+            ON CONFLICT (order_id, type) DO NOTHING RETURNING id
+        ), released AS (
+            DELETE FROM potion_reservations USING processed_entry
+            WHERE potion_reservations.cart_id = :cart_id
+            RETURNING potion_reservations.item_sku, potion_reservations.potion_type, potion_reservations.quantity
+        ), lines AS (
+            SELECT released.item_sku, released.quantity, carts.character_class,
+                   released.potion_type, locked_prices.price
+            FROM released
+            JOIN carts ON carts.id = :cart_id
+            JOIN cart_items ON cart_items.cart_id = :cart_id AND cart_items.item_sku = released.item_sku
+            JOIN locked_prices ON locked_prices.snapshot_id = COALESCE(cart_items.price_snapshot_id, carts.price_snapshot_id)
+                              AND locked_prices.sku = released.item_sku
+            WHERE released.quantity > 0
+        ), potion_entries AS (
+            INSERT INTO potion_ledger (processed_id, potion_type, quantity)
+            SELECT processed_entry.id, lines.potion_type, -lines.quantity FROM lines, processed_entry
+        ), gold_entries AS (
+            INSERT INTO gold_ledger (processed_id, gold)
+            SELECT processed_entry.id, lines.price * lines.quantity FROM lines, processed_entry
+        ), preference_entries AS (
+            INSERT INTO class_preferences (character_class, potion_type)
+            SELECT lines.character_class, lines.potion_type FROM lines
+        ), preference_count_updates AS (
+            INSERT INTO class_preference_counts (character_class, potion_type, amount_bought)
+            SELECT lines.character_class, lines.potion_type, COUNT(*) FROM lines
+            GROUP BY lines.character_class, lines.potion_type
+            ON CONFLICT (character_class, potion_type) DO UPDATE
+            SET amount_bought = class_preference_counts.amount_bought + EXCLUDED.amount_bought
+        ), potion_balance_updates AS (
+            UPDATE potion_balances
+            SET quantity = potion_balances.quantity - held.sold, reserved = potion_balances.reserved - held.quantity
+            FROM (SELECT released.potion_type, SUM(released.quantity) AS quantity,
+                         COALESCE(SUM(lines.quantity), 0) AS sold
+                  FROM released LEFT JOIN lines ON lines.item_sku = released.item_sku
+                  GROUP BY released.potion_type) AS held
+            WHERE potion_balances.potion_type = held.potion_type
+        ), gold_delta AS (
+            INSERT INTO gold_deltas (gold)
+            SELECT SUM(price * quantity) FROM lines HAVING COUNT(*) > 0
+        ), timestamp_updates AS (
+            UPDATE potion_catalog_items SET last_selected = NOW()
+            WHERE sku IN (SELECT item_sku FROM lines)
+        )
+        SELECT (SELECT id FROM processed_entry) AS processed_id,
+               COALESCE(SUM(quantity), 0) AS total_quantity,
+               COALESCE(SUM(price * quantity), 0) AS total_gold
+        FROM lines
+    """
+    # A retried checkout claims nothing above, so its totals are read back
+    # from the ledger rows the original checkout wrote.
+    replay_sql = """
+        SELECT (SELECT COALESCE(-SUM(potion_ledger.quantity), 0) FROM potion_ledger WHERE potion_ledger.processed_id = processed.id) AS total_quantity,
+               (SELECT COALESCE(SUM(gold_ledger.gold), 0) FROM gold_ledger WHERE gold_ledger.processed_id = processed.id) AS total_gold
+        FROM processed
+        WHERE processed.order_id = :cart_id AND processed.type = 'checkout'
+    """
 
-    with db.engine.begin() as connection:
-        character_class = connection.execute(sqlalchemy.text(character_class_sql), 
-                                             [{"cart_id": cart_id}]).scalar_one()
-        processed_id = connection.execute(sqlalchemy.text(processed_entry_sql),
-                                [{"order_id": cart_id}]).scalar_one()
-        result = connection.execute(sqlalchemy.text(cart_items_sql),
-                                    [{"cart_id": cart_id}])
-        cart_items = [row for row in result]
-        for cart_item in cart_items:   
-            potion_type = connection.execute(sqlalchemy.text(potion_type_sql), 
-                                             [{"sku": cart_item.item_sku}]).scalar_one()
-            connection.execute(sqlalchemy.text(update_timestamp_sql), 
-                               [{"sku": cart_item.item_sku}])
-            connection.execute(sqlalchemy.text(potion_update_sql), 
-                               [{"processed_id": processed_id, 
-                                 "potion_type": potion_type, 
-                                 "quantity": -cart_item.quantity}])
-            price = connection.execute(sqlalchemy.text(potion_price_sql),
-                                        [{"sku": cart_item.item_sku}]).scalar_one()
-            connection.execute(sqlalchemy.text(gold_sql), 
-                               [{"processed_id": processed_id, 
-                                 "gold": price * cart_item.quantity}])
-            connection.execute(sqlalchemy.text(preferences_insert_sql),
-                                 [{"character_class": character_class, 
-                                    "potion_type": potion_type}])
-            total_gold += price * cart_item.quantity
-            total_quantity += cart_item.quantity
+    async with db.async_engine.connect() as connection:
+        async with connection.begin():
+            await connection.run_sync(reservations.lock_cart, cart_id)
+            unsellable = await connection.run_sync(reservations.rehold_cart, cart_id)
+            if len(unsellable) > 0:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                    detail=f"Cannot sell cart lines: {', '.join(unsellable)}")
+            processed_id, total_quantity, total_gold = (await connection.execute(sqlalchemy.text(checkout_sql),
+                                                                                 [{"cart_id": cart_id}])).fetchone()
+            if processed_id is None:
+                logger.info("cart_id: %s already checked out, replaying result", cart_id)
+                total_quantity, total_gold = (await connection.execute(sqlalchemy.text(replay_sql),
+                                                                       [{"cart_id": cart_id}])).fetchone()
+        if total_quantity > 0:
+            await planning_cache.invalidate_async(connection)
     # Return the total quantity of potions bought and the total gold paid
     return {"total_potions_bought": total_quantity, "total_gold_paid": total_gold}
@@ -1,104 +1,107 @@
+import logging
 from fastapi import APIRouter
 import sqlalchemy
 from src import database as db
+from src.api import preferences, planning_cache
+import os
 import random
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Catalog builds whose prices stay available to checkouts of carts quoted
+# against them.
+PRICE_SNAPSHOT_RETENTION = int(os.environ.get("PRICE_SNAPSHOT_RETENTION", 1000))
+
+
+def listing(potion, fire_sale):
+    price = int(potion.price * 0.75) if fire_sale else potion.price
+    return {
+        "sku": potion.sku,
+        "name": potion.name,
+        "quantity": potion.quantity,
+        "price": price,
+        "potion_type": potion.potion_type
+    }
+
 
 @router.get("/catalog/", tags=["catalog"])
-def get_catalog():
+async def get_catalog():
     """
     Each unique item combination must have only a single price.
     """
-    potion_quantity_sql = "SELECT potion_catalog_items.sku as sku, potion_catalog_items.name as name, potion_ledger.potion_type as potion_type, SUM(potion_ledger.quantity) as quantity, potion_catalog_items.price FROM potion_ledger JOIN potion_catalog_items ON potion_ledger.potion_type = potion_catalog_items.potion_type GROUP BY potion_catalog_items.sku, potion_catalog_items.name, potion_ledger.potion_type, potion_catalog_items.price having SUM(potion_ledger.quantity) > 0"
+    potion_quantity_sql = "SELECT potion_catalog_items.sku as sku, potion_catalog_items.name as name, potion_balances.potion_type as potion_type, potion_balances.quantity - potion_balances.reserved as quantity, potion_catalog_items.price FROM potion_balances JOIN potion_catalog_items ON potion_balances.potion_type = potion_catalog_items.potion_type WHERE potion_balances.quantity - potion_balances.reserved > 0"
     visits_sql = "SELECT character_class, COUNT(character_class) as total_characters FROM visits JOIN global_time ON visits.day = global_time.day GROUP BY character_class"
-    class_preference_sql = "SELECT potion_type, COALESCE(COUNT(potion_type), 0) as amount_bought FROM class_preferences WHERE character_class = :character_class GROUP BY potion_type, character_class"
     total_potions_sql = "SELECT potions, potion_capacity from inventory"
-    locked_price_sql = "INSERT INTO locked_prices (sku, price) VALUES (:sku, :price)"
-    clear_locked_prices_sql = "TRUNCATE locked_prices RESTART IDENTITY"
-    with db.engine.begin() as connection:
-        connection.execute(sqlalchemy.text(clear_locked_prices_sql))
-        potions = connection.execute(sqlalchemy.text(potion_quantity_sql)).fetchall()
-        result = connection.execute(sqlalchemy.text(visits_sql)).fetchall()
+    # Listed prices are written as a new snapshot rather than replacing
+    # locked_prices in place, so checkouts pricing carts quoted against an
+    # earlier snapshot never wait on (or see a half-written) catalog build.
+    # Snapshots older than the retention window are dropped in the same
+    # statement; their prices go with them through the foreign key.
+    price_snapshot_sql = """
+        WITH snapshot AS (
+            INSERT INTO price_snapshots DEFAULT VALUES RETURNING id
+        ), prices AS (
+            INSERT INTO locked_prices (snapshot_id, sku, price)
+            SELECT snapshot.id, listed.sku, listed.price
+            FROM snapshot, unnest(CAST(:skus AS text[]), CAST(:prices AS integer[])) AS listed (sku, price)
+        ), pruned AS (
+            DELETE FROM price_snapshots WHERE id <= (SELECT id FROM snapshot) - :retained
+        )
+        SELECT id FROM snapshot
+    """
+    async with db.async_engine.begin() as connection:
+        version = await connection.run_sync(planning_cache.version)
+        cached_catalog = planning_cache.get("catalog", version)
+        if cached_catalog is not None:
+            return cached_catalog
+        potions = (await connection.execute(sqlalchemy.text(potion_quantity_sql))).fetchall()
+        result = (await connection.execute(sqlalchemy.text(visits_sql))).fetchall()
         visits = [row._asdict() for row in result]
-        total_potions, potion_capacity = connection.execute(sqlalchemy.text(total_potions_sql)).fetchone()
+        total_potions, potion_capacity = (await connection.execute(sqlalchemy.text(total_potions_sql))).fetchone()
         fire_sale = False
         if total_potions / (potion_capacity * 50) > 0.7:
-            print("FIRE SALE!!!")
+            logger.info("FIRE SALE!!!")
             fire_sale = True
             
         catalog = []
-        listed_items = 0
-        
+        # Sellable stock grouped by recipe, so each sampled preference is a
+        # single dict lookup rather than a scan of every stocked potion.
+        stock_by_type = {}
+        for potion in potions:
+            stock_by_type.setdefault(tuple(potion.potion_type), []).append(potion)
+
         if len(visits) == 0:
-            print("No recorded visits")
+            logger.info("No recorded visits")
         else:
-            weights = [(pref["character_class"], pref["total_characters"]) for pref in visits]
-            i = 0
-            while len(weights) > 0:
-                selected_class = random.choices(
-                    [choice[0] for choice in weights], 
-                    weights=[choice[1] for choice in weights],
+            class_weights = {pref["character_class"]: pref["total_characters"] for pref in visits}
+            preference_matrix = await connection.run_sync(preferences.load_matrix)
+            while len(class_weights) > 0 and len(stock_by_type) > 0 and len(catalog) < 6:
+                selected_class = random.choices(list(class_weights), weights=list(class_weights.values()), k=1)[0]
+                del class_weights[selected_class]
+                class_preference = preference_matrix.get(selected_class, [])
+                if len(class_preference) == 0:
+                    logger.debug("character_class: %s, class_preference: No preference yet", selected_class)
+                    continue
+                selected_potion = random.choices(
+                    [pref["potion_type"] for pref in class_preference],
+                    weights=[pref["amount_bought"] for pref in class_preference],
                     k=1
                 )[0]
-                weights.pop([choice[0] for choice in weights].index(selected_class))
-                class_preference = connection.execute(sqlalchemy.text(class_preference_sql), 
-                                                    [{"character_class": selected_class}]).fetchall()
-                class_preference = [row._asdict() for row in class_preference]
-                if len(class_preference) == 0:
-                    print(f"character_class: {selected_class}, class_preference: No preference yet")
-                else: 
-                    weighted_choices = [(pref['potion_type'], pref['amount_bought']) for pref in class_preference]
-                    selected_potion = random.choices(
-                        [choice[0] for choice in weighted_choices], 
-                        weights=[choice[1] for choice in weighted_choices],
-                        k=1
-                    )[0]
-                    print(f"character_class: {selected_class}, class_preference: {class_preference}, selected_potion: {selected_potion}")
-                    for potion in potions:
-                        if fire_sale:
-                            price = int(potion.price * 0.75)
-                        else:
-                            price = potion.price
-                        if potion.potion_type == selected_potion:
-                            catalog.append(
-                                {
-                                    "sku": potion.sku,
-                                    "name": potion.name,
-                                    "quantity": potion.quantity,
-                                    "price": price,
-                                    "potion_type": potion.potion_type
-                                }
-                            )
-                            connection.execute(sqlalchemy.text(locked_price_sql), 
-                                        [{"sku": potion.sku, "price": price}])
-                            listed_items += 1
-                            i += 1
-                            potions.remove(potion)
-                if len(potions) == 0:
-                    break
-                if listed_items >= 6:
-                    break
-        
+                logger.debug("character_class: %s, class_preference: %s, selected_potion: %s", selected_class, class_preference, selected_potion)
+                for potion in stock_by_type.pop(tuple(selected_potion), []):
+                    catalog.append(listing(potion, fire_sale))
+
+        potions = [potion for stocked in stock_by_type.values() for potion in stocked]
         random.shuffle(potions)
-        while len(potions) > 0 and listed_items < 6:
-            potion = potions.pop()
-            if fire_sale:
-                price = int(potion.price * 0.75)
-            else:
-                price = potion.price
-            catalog.append(
-                {
-                    "sku": potion.sku,
-                    "name": potion.name,
-                    "quantity": potion.quantity,
-                    "price": price,
-                    "potion_type": potion.potion_type
-                }
-            )
-            connection.execute(sqlalchemy.text(locked_price_sql), 
-                               [{"sku": potion.sku, "price": price}])
-            listed_items += 1
-        print(f"catalog: {catalog}, unlisted items: {potions}")
-        return catalog
\ No newline at end of file
+        while len(potions) > 0 and len(catalog) < 6:
+            catalog.append(listing(potions.pop(), fire_sale))
+        snapshot_id = (await connection.execute(sqlalchemy.text(price_snapshot_sql),
+                                                [{"skus": [item["sku"] for item in catalog],
+                                                  "prices": [item["price"] for item in catalog],
+                                                  "retained": PRICE_SNAPSHOT_RETENTION}])).scalar_one()
+        logger.info("catalog: price snapshot %d, %d items listed, %d unlisted", snapshot_id, len(catalog), len(potions))
+        logger.debug("catalog: %s, unlisted items: %s", catalog, potions)
+    planning_cache.put("catalog", catalog, version)
+    return catalog
\ No newline at end of file
@@ -0,0 +1,153 @@
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+import sqlalchemy
+from src import database as db
+from src.api import archive
+
+logger = logging.getLogger(__name__)
+
+# /admin/reset starts the game state over by swapping in a prebuilt
+# generation instead of truncating. The spare generation is a schema
+# holding empty copies of RESET_TABLES (with their partitions, keys and
+# foreign keys) already seeded with the starting state; a reset moves the
+# live tables into a retired schema and the spare's into public, which is a
+# fixed number of catalog updates however much history the live tables
+# hold. A background thread then builds the next spare and drops retired
+# generations beyond the newest RETIRED_GENERATIONS.
+
+# Referenced tables come before the tables whose foreign keys point at them.
+RESET_TABLES = ["processed", "carts", "gold_ledger", "barrel_ledger", "potion_ledger", "global_plan",
+                "cart_items", "potion_reservations", "barrel_balances", "potion_balances", "shop_balance",
+                "gold_deltas", "archived_totals"]
+SPARE_SCHEMA = "shop_spare"
+RETIRED_PREFIX = "shop_retired_"
+RETIRED_GENERATIONS = int(os.environ.get("RETIRED_GENERATIONS", 1))
+# The swap gives up on the table locks after RESET_LOCK_TIMEOUT_MS and
+# retries, so it never sits in a lock queue (or a deadlock) ahead of the
+# requests it is waiting on.
+RESET_LOCK_TIMEOUT_MS = int(os.environ.get("RESET_LOCK_TIMEOUT_MS", 50))
+RESET_ATTEMPTS = 20
+STARTING_GOLD = 100
+STARTING_CAPACITY_UNITS = 1
+
+generation_lock_sql = "SELECT pg_advisory_xact_lock(hashtext('shop_generation'))"
+schema_exists_sql = "SELECT COUNT(*) FROM pg_namespace WHERE nspname = :schema"
+foreign_keys_sql = """
+    SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+    WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+"""
+# Views bind to table oids rather than names, so any view over the reset
+# tables is recreated after the swap.
+dependent_views_sql = """
+    SELECT DISTINCT dependent.relname, pg_get_viewdef(dependent.oid) AS definition
+    FROM pg_depend
+    JOIN pg_rewrite ON pg_rewrite.oid = pg_depend.objid
+    JOIN pg_class AS dependent ON dependent.oid = pg_rewrite.ev_class
+    WHERE pg_depend.refobjid = ANY (CAST(CAST(:tables AS regclass[]) AS oid[])) AND dependent.relkind = 'v'
+"""
+relations_sql = """
+    SELECT pg_class.relname FROM pg_class JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+    WHERE pg_namespace.nspname = :schema AND pg_class.relkind IN ('r', 'p')
+"""
+starting_state_sql = [
+    "INSERT INTO processed (order_id, type) VALUES (-1, 'reset')",
+    "INSERT INTO gold_ledger (processed_id, gold) SELECT id, :gold FROM processed",
+    "INSERT INTO global_plan (processed_id, potion_capacity_units, ml_capacity_units) SELECT id, :units, :units FROM processed",
+    "INSERT INTO shop_balance (id, gold, potion_capacity_units, ml_capacity_units) VALUES (1, :gold, :units, :units)",
+]
+
+_builder_lock = threading.Lock()
+
+
+def build_spare(connection):
+    """Create the spare generation if there is none. Expects the generation lock to be held."""
+    if connection.execute(sqlalchemy.text(schema_exists_sql), [{"schema": SPARE_SCHEMA}]).scalar_one() > 0:
+        return
+    foreign_keys = {table: connection.execute(sqlalchemy.text(foreign_keys_sql), [{"table": table}]).fetchall()
+                    for table in RESET_TABLES}
+    connection.exec_driver_sql(f"CREATE SCHEMA {SPARE_SCHEMA}")
+    # Unqualified names below (the foreign key targets, the partitions and
+    # the starting state) resolve to the spare while it is first in the path.
+    connection.exec_driver_sql(f"SET LOCAL search_path = {SPARE_SCHEMA}, public")
+    for table in RESET_TABLES:
+        partitioned = " PARTITION BY RANGE (created_at)" if table in archive.LEDGER_TOTALS else ""
+        connection.exec_driver_sql(f"CREATE TABLE {SPARE_SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL){partitioned}")
+        if partitioned:
+            connection.exec_driver_sql(f"CREATE TABLE {SPARE_SCHEMA}.{table}_default PARTITION OF {SPARE_SCHEMA}.{table} DEFAULT")
+    for table in RESET_TABLES:
+        for name, definition in foreign_keys[table]:
+            connection.exec_driver_sql(f"ALTER TABLE {SPARE_SCHEMA}.{table} ADD CONSTRAINT {name} {definition}")
+    archive.create_partitions(connection, archive.today(),
+                              archive.today() + datetime.timedelta(days=archive.PARTITION_DAYS_AHEAD))
+    for sql in starting_state_sql:
+        connection.execute(sqlalchemy.text(sql), [{"gold": STARTING_GOLD, "units": STARTING_CAPACITY_UNITS}])
+    connection.exec_driver_sql("SET LOCAL search_path = public")
+    logger.info("built spare generation")
+
+
+def swap(connection):
+    """
+    Retire the live game state and put the spare generation in its place,
+    building the spare first if it is missing. Returns the retired schema.
+    """
+    connection.execute(sqlalchemy.text(generation_lock_sql))
+    build_spare(connection)
+    retired = f"{RETIRED_PREFIX}{time.time_ns()}"
+    views = connection.execute(sqlalchemy.text(dependent_views_sql), [{"tables": RESET_TABLES}]).fetchall()
+    live = RESET_TABLES + [partition for table in archive.LEDGER_TOTALS
+                           for partition in archive.partitions(connection, table)]
+    spare = connection.execute(sqlalchemy.text(relations_sql), [{"schema": SPARE_SCHEMA}]).scalars().all()
+    connection.exec_driver_sql(f"SET LOCAL lock_timeout = {RESET_LOCK_TIMEOUT_MS}")
+    # Readers lock a view before the tables under it, so the views go first.
+    locked = [name for name, _ in views] + RESET_TABLES
+    connection.exec_driver_sql(f"LOCK TABLE {', '.join(locked)} IN ACCESS EXCLUSIVE MODE")
+    connection.exec_driver_sql(f"CREATE SCHEMA {retired}")
+    for relation in live:
+        connection.exec_driver_sql(f"ALTER TABLE public.{relation} SET SCHEMA {retired}")
+    for relation in spare:
+        connection.exec_driver_sql(f"ALTER TABLE {SPARE_SCHEMA}.{relation} SET SCHEMA public")
+    connection.exec_driver_sql(f"DROP SCHEMA {SPARE_SCHEMA}")
+    for name, definition in views:
+        connection.exec_driver_sql(f"CREATE OR REPLACE VIEW {name} AS {definition}")
+    archive.create_partitions(connection, archive.today(),
+                              archive.today() + datetime.timedelta(days=archive.PARTITION_DAYS_AHEAD))
+    logger.info("retired game state to %s", retired)
+    return retired
+
+
+def reset(engine):
+    """Swap in a fresh generation, retrying while the live tables are busy."""
+    for attempt in range(RESET_ATTEMPTS):
+        try:
+            with engine.begin() as connection:
+                return swap(connection)
+        except sqlalchemy.exc.OperationalError as e:
+            # 55P03 is lock_not_available, 40P01 deadlock_detected.
+            if getattr(e.orig, "pgcode", None) not in ("55P03", "40P01") or attempt == RESET_ATTEMPTS - 1:
+                raise
+            logger.info("reset: game state tables busy, retrying")
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+
+
+def prepare():
+    """Build the next spare generation and drop old retired ones."""
+    retired_sql = "SELECT nspname FROM pg_namespace WHERE nspname LIKE :prefix ORDER BY nspname DESC"
+    with _builder_lock:
+        with db.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(generation_lock_sql))
+            build_spare(connection)
+        with db.engine.begin() as connection:
+            retired = connection.execute(sqlalchemy.text(retired_sql),
+                                         [{"prefix": RETIRED_PREFIX + "%"}]).scalars().all()
+        for schema in retired[RETIRED_GENERATIONS:]:
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+            logger.info("dropped retired generation %s", schema)
+
+
+def prepare_in_background():
+    threading.Thread(target=prepare, name="generation-builder", daemon=True).start()
@@ -1,9 +1,12 @@
+import logging
 from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
-from src.api import auth
+from src.api import archive, auth, balances, reservations
 from src import database as db
 import sqlalchemy
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/info",
     tags=["info"],
@@ -19,10 +22,15 @@ def post_time(timestamp: Timestamp):
     """
     Share current time.
     """
-    print(f"timestamp: {timestamp}")
-    set_time_sql = "UPDATE global_time SET day = :day, hour = :hour"
+    logger.info("timestamp: %s", timestamp)
+    set_time_sql = "UPDATE global_time SET day = :day, hour = :hour, tick = tick + 1 RETURNING tick"
     with db.engine.begin() as connection:
-        connection.execute(sqlalchemy.text(set_time_sql), 
-                           [{"day": timestamp.day, "hour": timestamp.hour}])
+        tick = connection.execute(sqlalchemy.text(set_time_sql), 
+                                  [{"day": timestamp.day, "hour": timestamp.hour}]).scalar_one()
+        reservations.expire(connection, tick)
+        balances.fold_gold(connection)
+    # Partition DDL runs in its own transaction, so it can never hold up
+    # or fail the tick.
+    archive.ensure_partitions(db.engine)
     return "OK"
 
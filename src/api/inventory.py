@@ -1,10 +1,13 @@
+import logging
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from src.api import auth
+from src.api import auth, balances, processed, planning_cache
 import math
 from src import database as db
 import sqlalchemy
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/inventory",
     tags=["inventory"],
@@ -19,7 +22,7 @@ def get_inventory():
     with db.engine.begin() as connection:
         gold, ml, potions = connection.execute(sqlalchemy.text(get_inventory_sql)).fetchone()
         connection.execute(sqlalchemy.text(inventory_log_sql))
-        print(f"num_potions: {potions} num_ml: {ml} gold: {gold}")   
+        logger.info("num_potions: %s num_ml: %s gold: %s", potions, ml, gold)
 
         return [
                 {
@@ -49,7 +52,7 @@ def get_capacity_plan():
     ml_capacity_purchase, potion_capacity_purchase = calculate_capacity_purchase(disposable_gold // 1000)
     ml_capacity_purchase = min(ml_capacity_purchase, 10)
     potion_capacity_purchase = min(potion_capacity_purchase, 10)
-    print(f"potion_capacity_purchase: {potion_capacity_purchase} ml_capacity_purchase: {ml_capacity_purchase}")
+    logger.info("potion_capacity_purchase: %s ml_capacity_purchase: %s", potion_capacity_purchase, ml_capacity_purchase)
     return {
         "potion_capacity": potion_capacity_purchase,
         "ml_capacity": ml_capacity_purchase,
@@ -66,13 +69,13 @@ def deliver_capacity_plan(capacity_purchase : CapacityPurchase, order_id: int):
     Start with 1 capacity for 50 potions and 1 capacity for 10000 ml of potion. Each additional 
     capacity unit costs 1000 gold.
     """
-    print(f"order_id: {order_id} potion_capacity: {capacity_purchase.potion_capacity} ml_capacity: {capacity_purchase.ml_capacity}")
-    processed_entry_sql = "INSERT INTO processed (order_id, type) VALUES (:order_id, 'capacity') RETURNING id"
+    logger.info("order_id: %s potion_capacity: %s ml_capacity: %s", order_id, capacity_purchase.potion_capacity, capacity_purchase.ml_capacity)
     capacity_insert_sql = "INSERT into global_plan (processed_id, potion_capacity_units, ml_capacity_units) VALUES (:processed_id, :potion_capacity, :ml_capacity)"
     gold_sql = "INSERT INTO gold_ledger (processed_id, gold) VALUES (:processed_id, :gold)"
     with db.engine.begin() as connection:   
-        processed_id = connection.execute(sqlalchemy.text(processed_entry_sql), 
-                                [{"order_id": order_id}]).scalar_one()
+        processed_id = processed.claim(connection, order_id, "capacity")
+        if processed_id is None:
+            return "OK"
         connection.execute(sqlalchemy.text(capacity_insert_sql), 
                            [{"processed_id": processed_id,
                              "potion_capacity": capacity_purchase.potion_capacity, 
@@ -80,4 +83,9 @@ def deliver_capacity_plan(capacity_purchase : CapacityPurchase, order_id: int):
         connection.execute(sqlalchemy.text(gold_sql),
                            [{"processed_id": processed_id, 
                           "gold": -1000 * (capacity_purchase.potion_capacity + capacity_purchase.ml_capacity)}])
+        balances.record_shop(connection,
+                             gold=-1000 * (capacity_purchase.potion_capacity + capacity_purchase.ml_capacity),
+                             potion_capacity_units=capacity_purchase.potion_capacity,
+                             ml_capacity_units=capacity_purchase.ml_capacity)
+    planning_cache.invalidate()
     return "OK"
\ No newline at end of file
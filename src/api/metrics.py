@@ -0,0 +1,155 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+# Per-request DB instrumentation. MetricsMiddleware opens a RequestStats
+# for each request in a context variable; cursor events on the engines add
+# every statement's rows and time to it. Totals are kept per route
+# template (never the raw path, so label values stay bounded) and
+# rendered in Prometheus text format by /admin/metrics.
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0))
+
+logger = logging.getLogger(__name__)
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RequestStats:
+    __slots__ = ("statements", "rows", "db_seconds", "slow_queries", "route")
+
+    def __init__(self, route):
+        self.statements = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        # Returns the request's route template, once routing has matched it.
+        self.route = route
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.request_seconds = defaultdict(float)
+        self.statements = defaultdict(int)
+        self.max_statements = defaultdict(int)
+        self.rows = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.slow_queries = defaultdict(int)
+
+    def record_request(self, method, route, status, seconds, stats):
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            self.request_seconds[(method, route)] += seconds
+            self.statements[(method, route)] += stats.statements
+            self.max_statements[(method, route)] = max(self.max_statements[(method, route)], stats.statements)
+            self.rows[(method, route)] += stats.rows
+            self.db_seconds[(method, route)] += stats.db_seconds
+            if stats.slow_queries > 0:
+                self.slow_queries[(route,)] += stats.slow_queries
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text, values, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.items()):
+                label_text = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(label_names, labels))
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        with self.lock:
+            family("pnw_http_requests_total", "counter", "Requests handled.",
+                   self.requests, ("method", "route", "status"))
+            family("pnw_http_request_seconds_total", "counter", "Time spent handling requests.",
+                   self.request_seconds, ("method", "route"))
+            family("pnw_db_statements_total", "counter", "SQL statements issued.",
+                   self.statements, ("method", "route"))
+            family("pnw_db_statements_per_request_max", "gauge", "Most SQL statements issued by one request.",
+                   self.max_statements, ("method", "route"))
+            family("pnw_db_rows_total", "counter", "Rows returned or affected by SQL statements.",
+                   self.rows, ("method", "route"))
+            family("pnw_db_seconds_total", "counter", "Time spent executing SQL statements.",
+                   self.db_seconds, ("method", "route"))
+            family("pnw_db_slow_queries_total", "counter", f"Statements slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g}).",
+                   self.slow_queries, ("route",))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.rows += max(cursor.rowcount, 0)
+        stats.db_seconds += elapsed
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        # Request statements are counted when the request is recorded,
+        # under the route template; the rest (startup, background work)
+        # go under an empty route.
+        if stats is not None:
+            stats.slow_queries += 1
+            route = stats.route()
+        else:
+            route = ""
+            with registry.lock:
+                registry.slow_queries[(route,)] += 1
+        logger.warning("slow query (%.1f ms) on %s: %s", elapsed * 1000, route, statement)
+
+
+def instrument(engine):
+    """Attach the statement hooks to a sync Engine (use .sync_engine for async engines)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB usage per route."""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self.route_paths = None
+
+    def route_of(self, scope):
+        if self.route_paths is None:
+            self.route_paths = {route.endpoint: route.path for route in self.router.routes if hasattr(route, "endpoint")}
+        return self.route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(lambda: self.route_of(scope))
+        stats_token = _current_request.set(stats)
+        status = []
+
+        async def status_send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, status_send)
+        finally:
+            seconds = time.perf_counter() - start
+            _current_request.reset(stats_token)
+            registry.record_request(scope["method"], self.route_of(scope), status[0] if len(status) > 0 else 500,
+                                    seconds, stats)
@@ -0,0 +1,62 @@
+import threading
+import sqlalchemy
+from src import database as db
+
+# Planner results are only a function of the game tick and of shop state
+# (stock, reservations, visits), so each process caches them tagged with
+# the (tick, version) they were computed at. version is the
+# planning_version sequence: every delivery, checkout, hold, visit batch
+# and reset advances it once its transaction commits. A cached plan is
+# only served while global_time.tick and the sequence still read the same,
+# which is one single-row read per request, so a tick or a stock change
+# handled by any worker retires every worker's cached plans.
+
+version_sql = "SELECT global_time.tick, planning_version.last_value FROM global_time, planning_version"
+advance_sql = "SELECT nextval('planning_version')"
+
+_lock = threading.Lock()
+_version = None
+_entries = {}
+
+
+def version(connection):
+    """The shared (tick, version) plans are cached under. Read it before the planner's inputs."""
+    return tuple(connection.execute(sqlalchemy.text(version_sql)).one())
+
+
+def get(key, version):
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    return None
+
+
+def put(key, value, version):
+    """Store value as computed at version. Entries from older versions are dropped."""
+    global _version
+    with _lock:
+        if _version is not None and version < _version:
+            return
+        if version != _version:
+            _entries.clear()
+            _version = version
+        _entries[key] = (version, value)
+
+
+def invalidate():
+    """Retire every cached plan in every process. Call after the change has committed."""
+    with _lock:
+        _entries.clear()
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text(advance_sql))
+
+
+async def invalidate_async(connection):
+    """
+    invalidate() for the async routes, on their own connection after its
+    transaction has committed, so they never wait on the sync pool.
+    """
+    with _lock:
+        _entries.clear()
+    await connection.execute(sqlalchemy.text(advance_sql))
+    await connection.commit()
@@ -0,0 +1,21 @@
+import sqlalchemy
+
+# class_preference_counts holds one row per (character_class, potion_type)
+# with the number of cart lines bought, kept current by checkout. Planners
+# load the whole matrix in one query and sample from it in memory.
+
+preference_counts_sql = "SELECT character_class, potion_type, amount_bought FROM class_preference_counts WHERE amount_bought > 0"
+
+
+def load_matrix(connection):
+    """
+    Returns {character_class: [{"potion_type": ..., "amount_bought": ...}]}
+    for every class with at least one recorded purchase.
+    """
+    matrix = {}
+    result = connection.execute(sqlalchemy.text(preference_counts_sql))
+    for row in result:
+        matrix.setdefault(row.character_class, []).append(
+            {"potion_type": row.potion_type, "amount_bought": row.amount_bought}
+        )
+    return matrix
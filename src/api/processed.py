@@ -0,0 +1,24 @@
+import logging
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+# Every delivery and checkout is recorded in processed under its
+# (order_id, type). The unique constraint on that pair makes a retried
+# request a no-op: the claim below inserts nothing and the handler
+# answers from what the first request already wrote.
+
+claim_sql = "INSERT INTO processed (order_id, type) VALUES (:order_id, :type) ON CONFLICT (order_id, type) DO NOTHING RETURNING id"
+
+
+def claim(connection, order_id: int, type: str):
+    """
+    Record (order_id, type) as processed and return the new processed id,
+    or None if that order was already applied. A concurrent duplicate
+    blocks on the unique index until the first transaction finishes.
+    """
+    processed_id = connection.execute(sqlalchemy.text(claim_sql),
+                                      [{"order_id": order_id, "type": type}]).scalar_one_or_none()
+    if processed_id is None:
+        logger.info("order_id: %s type: %s already processed, skipping", order_id, type)
+    return processed_id
@@ -0,0 +1,100 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+from src.logs import DeferredQueueHandler
+
+# Request capture for offline replay. When REQUEST_CAPTURE_PATH is set the
+# server appends one JSON line per request with the request, the response
+# and the server-side duration; bench/replay.py plays a capture back.
+# Like application logging (src/logs.py), captured requests are queued by
+# the request path, and decoded, serialized and written to the rotating
+# file by a listener thread, so the event loop never waits on the disk.
+
+MAX_CAPTURED_BODY = 64 * 1024
+
+
+class CaptureFormatter(logging.Formatter):
+    """One JSON line per captured request, from the entry dict logged as the message."""
+
+    def format(self, record):
+        entry = dict(record.msg, body=decode_body(record.msg["body"]), response=decode_body(record.msg["response"]))
+        return json.dumps(entry, default=str)
+
+
+def capture_logger(path: str, max_bytes: int, backup_count: int):
+    logger = logging.getLogger("pnwcauldrons.capture")
+    # Starlette rebuilds the middleware stack whenever middleware or an
+    # exception handler is added, so this can run more than once.
+    if len(logger.handlers) > 0:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    capture_queue = queue.SimpleQueue()
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.setFormatter(CaptureFormatter())
+    listener = logging.handlers.QueueListener(capture_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(DeferredQueueHandler(capture_queue))
+    return logger
+
+
+def decode_body(body: bytes):
+    if len(body) == 0:
+        return None
+    if len(body) > MAX_CAPTURED_BODY:
+        return {"truncated": len(body)}
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode(errors="replace")
+
+
+class RequestRecorder:
+    """ASGI middleware appending every HTTP request/response pair to a rotating JSONL file."""
+
+    def __init__(self, app, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5):
+        self.app = app
+        self.logger = capture_logger(path, max_bytes, backup_count)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_body = bytearray()
+        response_body = bytearray()
+        status = []
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            elif message["type"] == "http.response.body":
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            duration = time.perf_counter() - start
+            self.logger.info({
+                "timestamp": started_at,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode(),
+                "body": bytes(request_body),
+                "status": status[0] if len(status) > 0 else 500,
+                "response": bytes(response_body),
+                "duration_ms": round(duration * 1000, 3),
+            })
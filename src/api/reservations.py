@@ -0,0 +1,138 @@
+import logging
+import os
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+# Adding an item to a cart holds its quantity against the potion type's
+# stock: potion_reservations has one row per (cart_id, item_sku) and
+# potion_balances.reserved is the running total of those rows, so a hold
+# succeeds only while quantity - reserved covers it. Checkout converts a
+# cart's holds into ledger rows, and holds a cart never checks out are
+# released once RESERVATION_TICKS tick changes have passed; a cart that
+# checks out after that is held again first, or refused.
+#
+# Everything that changes a potion type's reservations first takes a
+# transaction-scoped advisory lock on that type, in potion_type order when
+# it needs several. Holds and checkouts on different potion types never
+# wait on each other, and two transactions can never lock the same pair
+# of types in opposite orders.
+
+RESERVATION_TICKS = int(os.environ.get("RESERVATION_TICKS", 2))
+
+lock_sql = """
+    SELECT pg_advisory_xact_lock(hashtextextended(CAST(locked.potion_type AS text), 0))
+    FROM (SELECT DISTINCT potion_type FROM ({types}) AS types ORDER BY potion_type) AS locked
+"""
+
+
+def lock_types(connection, types_sql: str, params: dict):
+    """Advisory-lock every potion type returned by types_sql, in order."""
+    connection.execute(sqlalchemy.text(lock_sql.format(types=types_sql)), [params])
+
+
+def hold(connection, cart_id: int, item_sku: str, quantity: int) -> bool:
+    """
+    Set the cart's hold on item_sku to quantity and write the cart line.
+    A new line is priced from the newest catalog snapshot listing the
+    sku, the catalog the customer was most recently shown it in. Returns
+    False, writing nothing, if the sku is not stocked or its
+    unreserved stock cannot cover the increase.
+    """
+    hold_sql = """
+        WITH previous AS (
+            SELECT COALESCE(SUM(quantity), 0) AS quantity FROM potion_reservations
+            WHERE cart_id = :cart_id AND item_sku = :item_sku
+        ), held AS (
+            UPDATE potion_balances SET reserved = potion_balances.reserved + :quantity - previous.quantity
+            FROM previous, potion_catalog_items
+            WHERE :quantity >= 0 AND potion_catalog_items.sku = :item_sku
+              AND potion_balances.potion_type = potion_catalog_items.potion_type
+              AND potion_balances.quantity - potion_balances.reserved >= :quantity - previous.quantity
+            RETURNING potion_balances.potion_type
+        ), reservation AS (
+            INSERT INTO potion_reservations (cart_id, item_sku, potion_type, quantity, tick)
+            SELECT :cart_id, :item_sku, held.potion_type, :quantity, global_time.tick FROM held, global_time
+            ON CONFLICT (cart_id, item_sku) DO UPDATE SET quantity = EXCLUDED.quantity, tick = EXCLUDED.tick
+        ), line AS (
+            INSERT INTO cart_items (cart_id, item_sku, quantity, price_snapshot_id)
+            SELECT :cart_id, :item_sku, :quantity, (SELECT MAX(snapshot_id) FROM locked_prices WHERE sku = :item_sku)
+            FROM held
+            ON CONFLICT (cart_id, item_sku) DO UPDATE
+            SET quantity = EXCLUDED.quantity,
+                price_snapshot_id = COALESCE(cart_items.price_snapshot_id, EXCLUDED.price_snapshot_id)
+        )
+        SELECT COUNT(*) FROM held
+    """
+    params = {"cart_id": cart_id, "item_sku": item_sku, "quantity": quantity}
+    lock_types(connection, "SELECT potion_type FROM potion_catalog_items WHERE sku = :item_sku", params)
+    held = connection.execute(sqlalchemy.text(hold_sql), [params]).scalar_one()
+    if held == 0:
+        logger.info("cart_id: %s item_sku: %s quantity: %s not enough unreserved stock", cart_id, item_sku, quantity)
+    return held > 0
+
+
+def lock_cart(connection, cart_id: int):
+    """Advisory-lock the potion types a cart holds or lists before checking it out."""
+    cart_types_sql = """
+        SELECT potion_type FROM potion_reservations WHERE cart_id = :cart_id
+        UNION
+        SELECT potion_catalog_items.potion_type FROM cart_items
+        JOIN potion_catalog_items ON potion_catalog_items.sku = cart_items.item_sku
+        WHERE cart_items.cart_id = :cart_id
+    """
+    lock_types(connection, cart_types_sql, {"cart_id": cart_id})
+
+
+def rehold_cart(connection, cart_id: int) -> list:
+    """
+    Hold again every line of a cart not yet checked out whose hold has
+    lapsed (expired, or the line predates holds), and return the skus of
+    lines that still cannot be sold: not enough unreserved stock, or no
+    price in the line's price snapshot. Expects lock_cart to be held.
+    """
+    lapsed_sql = """
+        SELECT cart_items.item_sku, cart_items.quantity,
+               COALESCE(potion_reservations.quantity, 0) < cart_items.quantity AS lapsed,
+               locked_prices.price IS NULL AS unpriced
+        FROM cart_items
+        JOIN carts ON carts.id = cart_items.cart_id
+        LEFT JOIN potion_reservations ON potion_reservations.cart_id = cart_items.cart_id
+                                     AND potion_reservations.item_sku = cart_items.item_sku
+        LEFT JOIN locked_prices ON locked_prices.snapshot_id = COALESCE(cart_items.price_snapshot_id, carts.price_snapshot_id)
+                               AND locked_prices.sku = cart_items.item_sku
+        WHERE cart_items.cart_id = :cart_id AND cart_items.quantity > 0
+          AND (COALESCE(potion_reservations.quantity, 0) < cart_items.quantity OR locked_prices.price IS NULL)
+          AND NOT EXISTS (SELECT 1 FROM processed WHERE processed.order_id = :cart_id AND processed.type = 'checkout')
+        ORDER BY cart_items.item_sku
+    """
+    unsellable = []
+    for line in connection.execute(sqlalchemy.text(lapsed_sql), [{"cart_id": cart_id}]).fetchall():
+        if line.unpriced or not hold(connection, cart_id, line.item_sku, line.quantity):
+            unsellable.append(line.item_sku)
+    if len(unsellable) > 0:
+        logger.info("cart_id: %s cannot sell lines: %s", cart_id, unsellable)
+    return unsellable
+
+
+def expire(connection, tick: int) -> int:
+    """
+    Release every hold placed RESERVATION_TICKS or more ticks before
+    tick. Returns the number of potions released.
+    """
+    expire_sql = """
+        WITH expired AS (
+            DELETE FROM potion_reservations WHERE tick <= :expired_tick
+            RETURNING potion_type, quantity
+        ), released AS (
+            UPDATE potion_balances SET reserved = potion_balances.reserved - totals.quantity
+            FROM (SELECT potion_type, SUM(quantity) AS quantity FROM expired GROUP BY potion_type) AS totals
+            WHERE potion_balances.potion_type = totals.potion_type
+        )
+        SELECT COALESCE(SUM(quantity), 0) FROM expired
+    """
+    params = {"expired_tick": tick - RESERVATION_TICKS}
+    lock_types(connection, "SELECT potion_type FROM potion_reservations WHERE tick <= :expired_tick", params)
+    released = connection.execute(sqlalchemy.text(expire_sql), [params]).scalar_one()
+    logger.info("tick: %s released %s reserved potions", tick, released)
+    return released
@@ -2,11 +2,19 @@ from fastapi import FastAPI, exceptions
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
 from src.api import carts, catalog, bottler, barrels, admin, info, inventory
+from src.api.recorder import RequestRecorder
+from src.api.metrics import MetricsMiddleware
+from src.api import archive, generations, metrics
+from src import database as db
+from src import logs
 import json
 import logging
+import os
 import sys
 from starlette.middleware.cors import CORSMiddleware
 
+logs.configure()
+
 description = """
 PNW Cauldrons is the premier ecommerce site for all your alchemical desires.
 """
@@ -32,6 +40,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def load_schema():
+    db.load_tables()
+    archive.ensure_partitions(db.engine)
+    generations.prepare_in_background()
+
+metrics.instrument(db.engine)
+metrics.instrument(db.async_engine.sync_engine)
+app.add_middleware(MetricsMiddleware, router=app.router)
+
+capture_path = os.environ.get("REQUEST_CAPTURE_PATH")
+if capture_path:
+    app.add_middleware(RequestRecorder, path=capture_path,
+                       max_bytes=int(os.environ.get("REQUEST_CAPTURE_MAX_BYTES", 50 * 1024 * 1024)))
+
 app.include_router(inventory.router)
 app.include_router(carts.router)
 app.include_router(catalog.router)
@@ -1,10 +1,52 @@
 import os
+import threading
 import dotenv
+import sqlalchemy
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 
 def database_connection_url():
     dotenv.load_dotenv()
     
     return os.environ.get("POSTGRES_URI")
 
-engine = create_engine(database_connection_url(), pool_pre_ping=True)
\ No newline at end of file
+def async_database_connection_url():
+    url = sqlalchemy.engine.make_url(database_connection_url())
+    return url.set(drivername="postgresql+asyncpg")
+
+# Each engine keeps its own pool, so one process can open up to
+#   POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW (sync engine)
+#   + POSTGRES_ASYNC_POOL_SIZE + POSTGRES_ASYNC_MAX_OVERFLOW (async engine)
+# connections, 20 with the defaults. That total times the number of worker
+# processes has to fit under the database's (or Supabase pooler's)
+# connection limit. The sync engine only serves the once-a-tick planner
+# and delivery routes, so it gets the smaller pool.
+pool_size = int(os.environ.get("POSTGRES_POOL_SIZE", 2))
+max_overflow = int(os.environ.get("POSTGRES_MAX_OVERFLOW", 3))
+async_pool_size = int(os.environ.get("POSTGRES_ASYNC_POOL_SIZE", 5))
+async_max_overflow = int(os.environ.get("POSTGRES_ASYNC_MAX_OVERFLOW", 10))
+
+engine = create_engine(database_connection_url(), pool_pre_ping=True,
+                       pool_size=pool_size, max_overflow=max_overflow)
+
+# The hot customer-facing routes (catalog, carts, checkout, search) run on
+# the async engine so they do not tie up a threadpool worker per request.
+async_engine = create_async_engine(async_database_connection_url(), pool_pre_ping=True,
+                                   pool_size=async_pool_size, max_overflow=async_max_overflow)
+
+# Shared table registry. The schema is reflected once (at startup, or on
+# first use) and every router reads its tables from here instead of
+# reflecting them per request.
+metadata = sqlalchemy.MetaData()
+_reflect_lock = threading.Lock()
+
+def load_tables():
+    with _reflect_lock:
+        if len(metadata.tables) == 0:
+            metadata.reflect(bind=engine)
+    return metadata.tables
+
+def table(name: str) -> sqlalchemy.Table:
+    if len(metadata.tables) == 0:
+        load_tables()
+    return metadata.tables[name]
@@ -0,0 +1,79 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Application logging. Records are handed to a queue by the request path
+# and formatted and written to stdout by a listener thread, so a handler
+# never blocks on stdout. Messages use %-style arguments and are only
+# formatted if they pass the level check, and then only on the listener
+# thread.
+#
+# LOG_LEVEL sets the root level (default INFO) and LOG_LEVELS overrides
+# individual modules, e.g. LOG_LEVELS="src.api.catalog=DEBUG,src.api.carts=WARNING".
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # Records from DeferredQueueHandler arrive with the traceback
+        # already rendered into exc_text.
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener. The stock handler
+    formats every record before enqueueing it, which puts the cost of large
+    reprs back on the request thread.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str):
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure():
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import pytest
+
+# Tests that need a database run against TEST_POSTGRES_URI, which is
+# rebuilt from schema.sql at the start of the session (bench/bootstrap.py)
+# and reset before every test, so it must be a disposable database. They
+# are skipped when it is not set.
+TEST_POSTGRES_URI = os.environ.get("TEST_POSTGRES_URI")
+TEST_API_KEY = "test-key"
+
+if TEST_POSTGRES_URI:
+    os.environ["POSTGRES_URI"] = TEST_POSTGRES_URI
+    # The bench package would otherwise point POSTGRES_URI at its own database.
+    os.environ.pop("BENCH_POSTGRES_URI", None)
+    os.environ["API_KEY"] = TEST_API_KEY
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_POSTGRES_URI:
+        pytest.skip("TEST_POSTGRES_URI is not set")
+    from bench.bootstrap import bootstrap
+    from src import database as db
+    bootstrap(db.engine)
+    return db.engine
+
+
+@pytest.fixture(scope="session")
+def app_client(engine):
+    from fastapi.testclient import TestClient
+    from src.api.server import app
+    # One client for the session: the async engine's pooled connections
+    # belong to the event loop the client runs.
+    with TestClient(app) as client:
+        client.headers.update({"access_token": TEST_API_KEY})
+        yield client
+
+
+@pytest.fixture
+def client(app_client):
+    """The test client, with the shop reset to its starting state."""
+    app_client.post("/admin/reset").raise_for_status()
+    return app_client
+
+
+class StatementCounter:
+    """
+    Counts SQL statements sent by both engines while active, leaving out
+    the background thread that builds the next game state generation.
+    """
+
+    def __init__(self):
+        self.statements = 0
+
+    def __call__(self, *args):
+        if threading.current_thread().name != "generation-builder":
+            self.statements += 1
+
+
+@pytest.fixture
+def statements(engine):
+    import sqlalchemy
+    from src import database as db
+    counter = StatementCounter()
+    engines = [db.engine, db.async_engine.sync_engine]
+    for counted in engines:
+        sqlalchemy.event.listen(counted, "before_cursor_execute", counter)
+    yield counter
+    for counted in engines:
+        sqlalchemy.event.remove(counted, "before_cursor_execute", counter)
@@ -0,0 +1,27 @@
+import datetime
+
+import sqlalchemy
+
+from src.api import archive
+
+COUNT_SQL = "SELECT COUNT(*) FROM {table} WHERE created_at >= :day AND created_at < CAST(:day AS date) + 1"
+
+
+def test_partition_created_after_rows_reached_the_default(client, engine, monkeypatch):
+    """Rows stranded in the default partition move to the day's partition, and the tick still succeeds."""
+    day = archive.today() + datetime.timedelta(days=archive.PARTITION_DAYS_AHEAD + 30)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("INSERT INTO gold_ledger (created_at, gold) VALUES (:day, 0)"),
+                           [{"day": day}])
+    monkeypatch.setattr(archive, "today", lambda: day)
+    monkeypatch.setattr(archive, "_checked_on", day - datetime.timedelta(days=1))
+
+    client.post("/info/current_time", json={"day": "Edgeday", "hour": 2}).raise_for_status()
+
+    partition = f"gold_ledger_{day:%Y%m%d}"
+    with engine.begin() as connection:
+        counts = [connection.execute(sqlalchemy.text(COUNT_SQL.format(table=table)), [{"day": day}]).scalar_one()
+                  for table in [partition, "gold_ledger_default"]]
+    assert counts == [1, 0]
+    assert archive._checked_on == day
+    assert client.get("/admin/reconcile").json()["consistent"]
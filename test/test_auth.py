@@ -0,0 +1,23 @@
+from src.api import auth
+
+
+def test_db_keys_survive_a_failed_reload(monkeypatch):
+    store = auth.KeyStore(ttl=3600, retry=0)
+    loads = iter([{auth.hash_key("db-key")}, None, {auth.hash_key("new-key")}])
+    monkeypatch.setattr(store, "db_hashes", lambda: next(loads))
+
+    store.refresh()
+    assert store.verify("db-key") is not None
+    assert not store.expired()
+
+    # The TTL runs out and the api_keys table cannot be read.
+    store.refresh_at = 0
+    store.refresh()
+    assert store.verify("db-key") is not None
+    assert store.expired()
+
+    # The retry loads the table again.
+    store.refresh()
+    assert store.verify("db-key") is None
+    assert store.verify("new-key") is not None
+    assert not store.expired()
@@ -0,0 +1,82 @@
+import itertools
+import random
+from collections import namedtuple
+
+from src.api import barrel_optimizer
+
+Barrel = namedtuple("Barrel", ["sku", "ml_per_barrel", "potion_type", "price", "quantity"])
+
+COLORS = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+
+
+def brute_force_ml(barrels, needs, budget):
+    """Most ml any mix of quantities buys within the needs and the budget."""
+    best = 0
+    for quantities in itertools.product(*[range(barrel.quantity + 1) for barrel in barrels]):
+        gold = sum(barrel.price * quantity for barrel, quantity in zip(barrels, quantities))
+        ml = [0, 0, 0, 0]
+        for barrel, quantity in zip(barrels, quantities):
+            ml[barrel.potion_type.index(1)] += barrel.ml_per_barrel * quantity
+        if gold <= budget and all(ml[c] <= needs[c] for c in range(4)):
+            best = max(best, sum(ml))
+    return best
+
+
+def test_plan_purchase_matches_brute_force():
+    rng = random.Random(12)
+    for _ in range(200):
+        barrels = [Barrel(f"BARREL_{i}", rng.choice([100, 200, 500, 1000, 2500]), rng.choice(COLORS),
+                          rng.randint(10, 300), rng.randint(1, 3)) for i in range(rng.randint(1, 5))]
+        needs = [rng.choice([0, 500, 1000, 3000, 6000]) for _ in range(4)]
+        budget = rng.randint(0, 1000)
+
+        quantities = barrel_optimizer.plan_purchase(barrels, needs, budget)
+
+        ml = [0, 0, 0, 0]
+        gold = 0
+        for index, quantity in quantities.items():
+            assert 0 < quantity <= barrels[index].quantity
+            ml[barrels[index].potion_type.index(1)] += barrels[index].ml_per_barrel * quantity
+            gold += barrels[index].price * quantity
+        assert gold <= budget
+        assert all(ml[c] <= needs[c] for c in range(4))
+        assert sum(ml) == brute_force_ml(barrels, needs, budget)
+
+
+def test_plan_purchase_with_odd_barrel_sizes_stays_within_needs():
+    # A gcd of 1 coarsens the ml unit. Sizes are rounded up to it, which
+    # can miss a mix that fills a need exactly, so plans are only close to
+    # the best, but they must still never overshoot a need or the budget.
+    rng = random.Random(7)
+    for _ in range(50):
+        barrels = [Barrel(f"BARREL_{i}", rng.choice([199, 503, 1001, 2503]), rng.choice(COLORS),
+                          rng.randint(10, 300), rng.randint(1, 3)) for i in range(rng.randint(1, 5))]
+        needs = [rng.choice([0, 3001, 6007, 9999]) for _ in range(4)]
+        budget = rng.randint(0, 1000)
+
+        quantities = barrel_optimizer.plan_purchase(barrels, needs, budget)
+
+        ml = [0, 0, 0, 0]
+        gold = 0
+        for index, quantity in quantities.items():
+            ml[barrels[index].potion_type.index(1)] += barrels[index].ml_per_barrel * quantity
+            gold += barrels[index].price * quantity
+        assert gold <= budget
+        assert all(ml[c] <= needs[c] for c in range(4))
+        assert sum(ml) >= 0.8 * brute_force_ml(barrels, needs, budget)
+
+
+def test_color_needs_only_split_capacity_between_offered_colors():
+    # Dark sold, but only red and green are on offer.
+    assert barrel_optimizer.color_needs(10000, 10000, [0, 0, 0, 0], [0, 0, 0, 500], {0, 1}) == [5000, 5000, 0, 0]
+
+
+def test_color_needs_keep_unsold_offered_colors_stocked():
+    needs = barrel_optimizer.color_needs(10000, 10000, [0, 0, 0, 0], [500, 0, 0, 0], {0, 1, 2})
+    assert needs[0] > needs[1] == needs[2] >= 10000 * barrel_optimizer.MIN_COLOR_SHARE
+    assert sum(needs) <= 10000
+
+
+def test_color_needs_buy_nothing_over_capacity():
+    assert barrel_optimizer.color_needs(10000, -500, [6000, 4500, 0, 0], [0, 0, 0, 0], {0, 1}) == [0, 0, 0, 0]
+    assert barrel_optimizer.color_needs(10000, 0, [5000, 5000, 0, 0], [0, 0, 0, 0], {0, 1}) == [0, 0, 0, 0]
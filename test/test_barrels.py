@@ -0,0 +1,61 @@
+import pathlib
+
+import sqlalchemy
+
+LEDGER_SQL = """
+    SELECT barrel_ledger.barrel_type, COUNT(*) AS lines, SUM(barrel_ledger.potion_ml) AS potion_ml
+    FROM barrel_ledger JOIN processed ON processed.id = barrel_ledger.processed_id
+    WHERE processed.type = 'barrels'
+    GROUP BY barrel_ledger.barrel_type
+"""
+
+
+def barrel(sku, ml_per_barrel, potion_type, price, quantity):
+    return {"sku": sku, "ml_per_barrel": ml_per_barrel, "potion_type": potion_type, "price": price,
+            "quantity": quantity}
+
+
+def ledger(engine):
+    with engine.begin() as connection:
+        return {tuple(row.barrel_type): (row.lines, row.potion_ml)
+                for row in connection.execute(sqlalchemy.text(LEDGER_SQL))}
+
+
+def test_delivery_writes_one_row_per_barrel_line(client, engine):
+    delivered = [
+        barrel("MINI_RED_BARREL", 200, [1, 0, 0, 0], 60, 200),
+        barrel("SMALL_RED_BARREL", 500, [1, 0, 0, 0], 100, 3),
+        barrel("LARGE_DARK_BARREL", 10000, [0, 0, 0, 1], 500, 2),
+    ]
+    client.post("/barrels/deliver/1", json=delivered).raise_for_status()
+
+    assert ledger(engine) == {(1, 0, 0, 0): (2, 200 * 200 + 500 * 3), (0, 0, 0, 1): (1, 10000 * 2)}
+    audit = client.get("/inventory/audit").json()[0]
+    assert audit["ml_in_barrels"] == 200 * 200 + 500 * 3 + 10000 * 2
+    assert audit["gold"] == 100 - (60 * 200 + 100 * 3 + 500 * 2)
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+
+def test_compaction_migration_keeps_ml_totals(client, engine):
+    # Per-unit rows as deliveries used to write them: one row per barrel.
+    per_unit_sql = """
+        WITH processed_entry AS (
+            INSERT INTO processed (order_id, type) VALUES (:order_id, 'barrels') RETURNING id
+        )
+        INSERT INTO barrel_ledger (processed_id, barrel_type, potion_ml)
+        SELECT processed_entry.id, CAST(:barrel_type AS integer[]), :potion_ml
+        FROM processed_entry, generate_series(1, :quantity)
+    """
+    schema = (pathlib.Path(__file__).resolve().parent.parent / "schema.sql").read_text()
+    start = schema.index("-- Barrel deliveries used to write")
+    compaction_sql = schema[start:schema.index("\n\n", start)]
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(per_unit_sql),
+                           [{"order_id": 1, "barrel_type": "{1,0,0,0}", "potion_ml": 200, "quantity": 200},
+                            {"order_id": 2, "barrel_type": "{0,1,0,0}", "potion_ml": 2500, "quantity": 7}])
+    before = ledger(engine)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(compaction_sql))
+
+    assert before == {(1, 0, 0, 0): (200, 40000), (0, 1, 0, 0): (7, 17500)}
+    assert ledger(engine) == {(1, 0, 0, 0): (1, 40000), (0, 1, 0, 0): (1, 17500)}
@@ -0,0 +1,29 @@
+from src.api import bottle_optimizer
+
+
+def test_recipes_without_ml_are_never_bottled():
+    quantities = bottle_optimizer.plan_bottling(
+        recipes=[[0, 0, 0, 0], [100, 0, 0, 0], [50, 50, 0, 0]],
+        stock=[0, 0, 0],
+        prices=[50, 50, 60],
+        demand=[10, 1, 1],
+        ml_inventory=[1000, 500, 0, 0],
+        available_potions=50,
+        trained_threshold=20,
+        threshold=10,
+    )
+    assert quantities[0] == 0
+    assert quantities[1] * 100 + quantities[2] * 50 <= 1000 and quantities[2] * 50 <= 500
+    assert quantities.sum() > 0
+
+
+def test_plan_stays_within_ml_capacity_and_thresholds():
+    recipes = [[100, 0, 0, 0], [0, 100, 0, 0], [50, 50, 0, 0], [0, 0, 0, 100]]
+    quantities = bottle_optimizer.plan_bottling(
+        recipes=recipes, stock=[5, 0, 0, 0], prices=[50, 50, 60, 70], demand=[3, 0, 1, 0],
+        ml_inventory=[2000, 700, 0, 300], available_potions=25, trained_threshold=12, threshold=4,
+    )
+    used = [sum(int(quantity) * recipe[c] for quantity, recipe in zip(quantities, recipes)) for c in range(4)]
+    assert all(used[c] <= [2000, 700, 0, 300][c] for c in range(4))
+    assert quantities.sum() <= 25
+    assert quantities[0] <= 12 - 5 and quantities[1] <= 4 and quantities[2] <= 12 and quantities[3] <= 4
@@ -0,0 +1,115 @@
+import sqlalchemy
+
+from src.api import reservations
+
+CUSTOMER = {"customer_name": "late", "character_class": "Bard", "level": 1}
+
+
+def stocked_cart(client, quantity):
+    """A cart holding quantity red potions, priced against the current catalog."""
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5},
+                                            {"potion_type": [0, 100, 0, 0], "quantity": 5}]).raise_for_status()
+    client.get("/catalog/").raise_for_status()
+    cart_id = client.post("/carts/", json=CUSTOMER).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": quantity}).raise_for_status()
+    return cart_id
+
+
+def expire_holds(client):
+    for hour in range(reservations.RESERVATION_TICKS):
+        client.post("/info/current_time", json={"day": "Edgeday", "hour": hour * 2}).raise_for_status()
+
+
+def test_checkout_holds_lapsed_lines_again(client):
+    cart_id = stocked_cart(client, 3)
+    expire_holds(client)
+
+    response = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert response.status_code == 200
+    assert response.json()["total_potions_bought"] == 3
+    assert client.get("/inventory/audit").json()[0]["number_of_potions"] == 7
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+
+def test_checkout_refuses_lines_it_cannot_sell(client, engine):
+    cart_id = stocked_cart(client, 3)
+    expire_holds(client)
+    # Another cart takes the stock the lapsed hold had set aside.
+    other_cart_id = client.post("/carts/", json=CUSTOMER).json()["cart_id"]
+    client.post(f"/carts/{other_cart_id}/items/RED_POTION", json={"quantity": 4}).raise_for_status()
+    # And a line the cart's price snapshot has no price for.
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("INSERT INTO cart_items (cart_id, item_sku, quantity) VALUES (:cart_id, 'GREEN_POTION', 1)"),
+                           [{"cart_id": cart_id}])
+        connection.execute(sqlalchemy.text("DELETE FROM locked_prices WHERE sku = 'GREEN_POTION'"))
+
+    response = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Cannot sell cart lines: GREEN_POTION, RED_POTION"
+    with engine.begin() as connection:
+        assert connection.execute(sqlalchemy.text("SELECT COUNT(*) FROM processed WHERE type = 'checkout'")).scalar_one() == 0
+    assert client.get("/inventory/audit").json()[0]["number_of_potions"] == 10
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+
+def test_lines_are_priced_from_the_catalog_that_listed_them(client, engine):
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    price = client.get("/catalog/").json()[0]["price"]
+    # Another worker builds a newer catalog that does not list red.
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("INSERT INTO price_snapshots DEFAULT VALUES"))
+    cart_id = client.post("/carts/", json=CUSTOMER).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2}).raise_for_status()
+
+    response = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+
+    assert response.status_code == 200
+    assert response.json() == {"total_potions_bought": 2, "total_gold_paid": 2 * price}
+
+
+def test_holds_and_checkouts_advance_the_planning_version_off_the_sync_engine(client, engine):
+    cart_id = stocked_cart(client, 1)
+    version_sql = sqlalchemy.text("SELECT last_value FROM planning_version")
+    sync_statements = []
+
+    def count(*args):
+        sync_statements.append(args[2])
+
+    with engine.begin() as connection:
+        before = connection.execute(version_sql).scalar_one()
+    sqlalchemy.event.listen(engine, "before_cursor_execute", count)
+    try:
+        client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 2}).raise_for_status()
+        client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"}).raise_for_status()
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", count)
+
+    # API key checks may still refresh on the sync engine; planning never does.
+    assert not any("planning_version" in statement for statement in sync_statements)
+    with engine.begin() as connection:
+        assert connection.execute(version_sql).scalar_one() == before + 2
+
+
+def test_checkout_gold_is_folded_into_the_balance_each_tick(client, engine):
+    cart_id = stocked_cart(client, 2)
+    shop_gold_sql = sqlalchemy.text("SELECT gold FROM shop_balance")
+    with engine.begin() as connection:
+        before = connection.execute(shop_gold_sql).scalar_one()
+
+    paid = client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"}).json()["total_gold_paid"]
+
+    # The checkout leaves the shared balance row alone; readers see its gold anyway.
+    with engine.begin() as connection:
+        assert connection.execute(shop_gold_sql).scalar_one() == before
+    assert client.get("/inventory/audit").json()[0]["gold"] == before + paid
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+    client.post("/info/current_time", json={"day": "Edgeday", "hour": 0}).raise_for_status()
+
+    with engine.begin() as connection:
+        assert connection.execute(shop_gold_sql).scalar_one() == before + paid
+        assert connection.execute(sqlalchemy.text("SELECT COUNT(*) FROM gold_deltas")).scalar_one() == 0
+    assert client.get("/inventory/audit").json()[0]["gold"] == before + paid
+    assert client.get("/admin/reconcile").json()["consistent"]
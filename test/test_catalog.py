@@ -0,0 +1,50 @@
+import sqlalchemy
+
+SNAPSHOTS_SQL = "SELECT COUNT(*) FROM price_snapshots"
+
+
+def catalog_builds(client, engine):
+    """Fetch the catalog and return how many price snapshots exist afterwards."""
+    client.get("/catalog/").raise_for_status()
+    with engine.begin() as connection:
+        return connection.execute(sqlalchemy.text(SNAPSHOTS_SQL)).scalar_one()
+
+
+def test_cached_catalog_follows_changes_made_by_other_workers(client, engine):
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    builds = catalog_builds(client, engine)
+    assert catalog_builds(client, engine) == builds
+
+    # Another worker advancing the clock.
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("UPDATE global_time SET tick = tick + 1"))
+    assert catalog_builds(client, engine) == builds + 1
+    assert catalog_builds(client, engine) == builds + 1
+
+    # Another worker selling stock and advancing the planning version.
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("UPDATE potion_balances SET quantity = 2 WHERE potion_type = '{100,0,0,0}'"))
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("SELECT nextval('planning_version')"))
+    assert [item["quantity"] for item in client.get("/catalog/").json()] == [2]
+
+
+def test_visits_refresh_the_catalog(client, engine):
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    builds = catalog_builds(client, engine)
+
+    client.post("/carts/visits/1", json=[{"customer_name": "visitor", "character_class": "Bard",
+                                          "level": 1}]).raise_for_status()
+    assert catalog_builds(client, engine) == builds + 1
+
+
+
+def test_holds_refresh_the_catalog(client):
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    assert [item["quantity"] for item in client.get("/catalog/").json()] == [5]
+
+    cart_id = client.post("/carts/", json={"customer_name": "holder", "character_class": "Bard",
+                                           "level": 1}).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 4}).raise_for_status()
+
+    assert [item["quantity"] for item in client.get("/catalog/").json()] == [1]
@@ -0,0 +1,31 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+
+from src.logs import DeferredQueueHandler, StructuredFormatter
+
+
+def test_queued_exceptions_keep_their_traceback():
+    log_queue = queue.SimpleQueue()
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(StructuredFormatter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    logger = logging.getLogger("test_logs")
+    logger.propagate = False
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener.start()
+    try:
+        try:
+            raise ValueError("bad barrel")
+        except ValueError:
+            logger.exception("delivery %d failed", 7)
+    finally:
+        listener.stop()
+        logger.handlers.clear()
+    entry = json.loads(stream.getvalue())
+    assert entry["level"] == "ERROR"
+    assert entry["message"] == "delivery 7 failed"
+    assert "Traceback" in entry["exception"] and "ValueError: bad barrel" in entry["exception"]
@@ -0,0 +1,21 @@
+from src.api import metrics
+
+
+def test_slow_queries_are_labelled_by_route_template(client, monkeypatch):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 1e-6)
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    cart_id = client.post("/carts/", json={"customer_name": "metrics", "character_class": "Bard",
+                                           "level": 1}).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 1}).raise_for_status()
+
+    slow_queries = [line for line in client.get("/admin/metrics").text.splitlines()
+                    if line.startswith("pnw_db_slow_queries_total{")]
+    assert any(line.startswith('pnw_db_slow_queries_total{route="/carts/{cart_id}/items/{item_sku}"}')
+               for line in slow_queries)
+    assert not any(f"/carts/{cart_id}/" in line for line in slow_queries)
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.slow_queries[('say "hi"\\\n',)] += 1
+    assert 'pnw_db_slow_queries_total{route="say \\"hi\\"\\\\\\n"} 1' in registry.render()
@@ -0,0 +1,51 @@
+import pytest
+import sqlalchemy
+
+# DB round trips per planning call, whatever the stock and catalog size,
+# including the planning cache version check.
+BOTTLE_PLAN_STATEMENTS = 6
+BARREL_PLAN_STATEMENTS = 5
+
+EXTRA_RECIPES = [[25, 25, 25, 25], [50, 0, 0, 50], [0, 50, 0, 50], [0, 0, 50, 50], [34, 33, 33, 0]]
+
+
+def planning_statements(statements, plan, *args):
+    from src.api import planning_cache
+    planning_cache.invalidate()
+    statements.statements = 0
+    plan(*args)
+    return statements.statements
+
+
+@pytest.fixture
+def extra_recipes(engine):
+    insert_sql = "INSERT INTO potion_catalog_items (sku, name, price, potion_type) VALUES (:sku, :sku, 65, :potion_type)"
+    skus = [f"EXTRA_{i}_POTION" for i in range(len(EXTRA_RECIPES))]
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(insert_sql),
+                           [{"sku": sku, "potion_type": potion_type} for sku, potion_type in zip(skus, EXTRA_RECIPES)])
+    yield
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("DELETE FROM potion_catalog_items WHERE sku = ANY (:skus)"), [{"skus": skus}])
+
+
+def test_planners_make_fixed_round_trips(client, statements, extra_recipes):
+    from bench.simulate import WHOLESALE_CATALOG
+    from src.api import barrels, bottler
+    small_catalog = [barrels.Barrel(**barrel) for barrel in WHOLESALE_CATALOG[:2]]
+    large_catalog = [barrels.Barrel(**dict(barrel, sku=f"{barrel['sku']}_{copy}"))
+                     for copy in range(25) for barrel in WHOLESALE_CATALOG]
+
+    assert planning_statements(statements, bottler.get_bottle_plan) == BOTTLE_PLAN_STATEMENTS
+    assert planning_statements(statements, barrels.get_wholesale_purchase_plan, small_catalog) == BARREL_PLAN_STATEMENTS
+
+    # Stock every color, some mixed barrel types and every recipe.
+    delivered = [dict(barrel, quantity=1) for barrel in WHOLESALE_CATALOG if barrel["sku"].startswith("MINI")]
+    delivered += [{"sku": f"MIXED_{i}_BARREL", "ml_per_barrel": 100, "potion_type": potion_type, "price": 1,
+                   "quantity": 1} for i, potion_type in enumerate([[1, 1, 0, 0], [0, 0, 1, 1]])]
+    client.post("/barrels/deliver/1", json=delivered).raise_for_status()
+    client.post("/bottler/deliver/2", json=[{"potion_type": potion_type, "quantity": 1}
+                                            for potion_type in EXTRA_RECIPES]).raise_for_status()
+
+    assert planning_statements(statements, bottler.get_bottle_plan) == BOTTLE_PLAN_STATEMENTS
+    assert planning_statements(statements, barrels.get_wholesale_purchase_plan, large_catalog) == BARREL_PLAN_STATEMENTS
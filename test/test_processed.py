@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy
+
+DUPLICATES = 8
+
+EFFECTS_SQL = """
+    SELECT processed.type, COUNT(DISTINCT processed.id) AS claims,
+           (SELECT COALESCE(SUM(gold), 0) FROM gold_ledger WHERE gold_ledger.processed_id = ANY (ARRAY_AGG(processed.id))) AS gold,
+           (SELECT COALESCE(SUM(potion_ml), 0) FROM barrel_ledger WHERE barrel_ledger.processed_id = ANY (ARRAY_AGG(processed.id))) AS potion_ml,
+           (SELECT COALESCE(SUM(quantity), 0) FROM potion_ledger WHERE potion_ledger.processed_id = ANY (ARRAY_AGG(processed.id))) AS potions,
+           (SELECT COALESCE(SUM(potion_capacity_units), 0) FROM global_plan WHERE global_plan.processed_id = ANY (ARRAY_AGG(processed.id))) AS potion_capacity
+    FROM processed WHERE processed.type <> 'reset'
+    GROUP BY processed.type
+"""
+
+
+def send_concurrently(client, path, body):
+    """Send the same request DUPLICATES times at once and return the (status, body) pairs."""
+    start = threading.Barrier(DUPLICATES)
+
+    def send(_):
+        start.wait()
+        response = client.post(path, json=body)
+        return response.status_code, response.json()
+
+    with ThreadPoolExecutor(max_workers=DUPLICATES) as pool:
+        return list(pool.map(send, range(DUPLICATES)))
+
+
+def effects(engine):
+    with engine.begin() as connection:
+        return {row.type: row._asdict() for row in connection.execute(sqlalchemy.text(EFFECTS_SQL))}
+
+
+def test_concurrent_duplicate_deliveries_apply_once(client, engine):
+    barrels = [{"sku": "SMALL_RED_BARREL", "ml_per_barrel": 500, "potion_type": [1, 0, 0, 0], "price": 100,
+                "quantity": 4}]
+    bottles = [{"potion_type": [100, 0, 0, 0], "quantity": 12}]
+    capacity = {"potion_capacity": 1, "ml_capacity": 2}
+
+    responses = [
+        send_concurrently(client, "/barrels/deliver/11", barrels),
+        send_concurrently(client, "/bottler/deliver/12", bottles),
+        send_concurrently(client, "/inventory/deliver/13", capacity),
+    ]
+
+    for sent in responses:
+        assert sent == [(200, "OK")] * DUPLICATES
+    applied = effects(engine)
+    assert applied["barrels"] == {"type": "barrels", "claims": 1, "gold": -400, "potion_ml": 2000, "potions": 0,
+                                  "potion_capacity": 0}
+    assert applied["bottles"] == {"type": "bottles", "claims": 1, "gold": 0, "potion_ml": -1200, "potions": 12,
+                                  "potion_capacity": 0}
+    assert applied["capacity"] == {"type": "capacity", "claims": 1, "gold": -3000, "potion_ml": 0, "potions": 0,
+                                   "potion_capacity": 1}
+    assert client.get("/inventory/audit").json() == [{"number_of_potions": 12, "ml_in_barrels": 800,
+                                                      "gold": 100 - 400 - 3000}]
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+
+def test_concurrent_duplicate_checkouts_apply_once(client, engine):
+    client.post("/bottler/deliver/21", json=[{"potion_type": [100, 0, 0, 0], "quantity": 10}]).raise_for_status()
+    catalog = client.get("/catalog/").json()
+    assert [(item["sku"], item["quantity"]) for item in catalog] == [("RED_POTION", 10)]
+    cart_id = client.post("/carts/", json={"customer_name": "duplicate", "character_class": "Bard",
+                                           "level": 1}).json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/RED_POTION", json={"quantity": 3}).raise_for_status()
+
+    sent = send_concurrently(client, f"/carts/{cart_id}/checkout", {"payment": "gold"})
+
+    assert sent == [(200, {"total_potions_bought": 3, "total_gold_paid": 3 * catalog[0]["price"]})] * DUPLICATES
+    applied = effects(engine)
+    assert applied["checkout"] == {"type": "checkout", "claims": 1, "gold": 3 * catalog[0]["price"],
+                                   "potion_ml": 0, "potions": -3, "potion_capacity": 0}
+    assert client.get("/inventory/audit").json()[0]["number_of_potions"] == 7
+    assert client.get("/admin/reconcile").json()["consistent"]
+
+
+def test_resent_visit_batches_add_no_rows(client, engine):
+    customers = [{"customer_name": f"visitor_{i}", "character_class": "Bard", "level": 1} for i in range(5)]
+    visits_sql = sqlalchemy.text("SELECT COUNT(*) FROM visits WHERE visit_id = 7")
+    client.post("/carts/visits/7", json=customers).raise_for_status()
+
+    client.post("/carts/visits/7", json=customers).raise_for_status()
+    sent = send_concurrently(client, "/carts/visits/7", customers)
+
+    assert sent == [(200, "OK")] * DUPLICATES
+    with engine.begin() as connection:
+        assert connection.execute(visits_sql).scalar_one() == 5
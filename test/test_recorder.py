@@ -0,0 +1,32 @@
+import json
+import logging.handlers
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.recorder import RequestRecorder
+
+
+def test_requests_are_captured_off_the_request_path(tmp_path):
+    capture = tmp_path / "capture.jsonl"
+    app = FastAPI()
+
+    @app.post("/echo/{item}")
+    def echo(item: str, body: dict):
+        return {"item": item, **body}
+
+    app.add_middleware(RequestRecorder, path=str(capture))
+    with TestClient(app) as client:
+        client.post("/echo/red?x=1", json={"quantity": 2}).raise_for_status()
+    # The request path only enqueues; the file is written by the listener.
+    handlers = logging.getLogger("pnwcauldrons.capture").handlers
+    assert len(handlers) > 0 and all(isinstance(handler, logging.handlers.QueueHandler) for handler in handlers)
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and (not capture.exists() or capture.read_text() == ""):
+        time.sleep(0.01)
+    entry = json.loads(capture.read_text().splitlines()[0])
+    assert (entry["method"], entry["path"], entry["query"], entry["status"]) == ("POST", "/echo/red", "x=1", 200)
+    assert entry["body"] == {"quantity": 2}
+    assert entry["response"] == {"item": "red", "quantity": 2}
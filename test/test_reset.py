@@ -0,0 +1,56 @@
+import threading
+import time
+
+STARTING_AUDIT = [{"number_of_potions": 0, "ml_in_barrels": 0, "gold": 100}]
+
+
+def test_reset_restores_starting_state(client):
+    client.post("/barrels/deliver/1", json=[{"sku": "SMALL_RED_BARREL", "ml_per_barrel": 500,
+                                             "potion_type": [1, 0, 0, 0], "price": 100, "quantity": 1}]).raise_for_status()
+    client.post("/bottler/deliver/2", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    assert client.get("/inventory/audit").json() != STARTING_AUDIT
+
+    client.post("/admin/reset").raise_for_status()
+
+    assert client.get("/inventory/audit").json() == STARTING_AUDIT
+    assert client.get("/catalog/").json() == []
+    assert client.get("/admin/reconcile").json()["consistent"]
+    # Order ids and carts start over with the new generation.
+    client.post("/barrels/deliver/1", json=[{"sku": "SMALL_RED_BARREL", "ml_per_barrel": 500,
+                                             "potion_type": [1, 0, 0, 0], "price": 100, "quantity": 1}]).raise_for_status()
+    assert client.get("/inventory/audit").json()[0]["ml_in_barrels"] == 500
+
+
+def test_shop_serves_traffic_immediately_after_reset(client):
+    """Requests sent while a reset runs all succeed, and the first ones after it see the new state."""
+    client.post("/bottler/deliver/1", json=[{"potion_type": [100, 0, 0, 0], "quantity": 5}]).raise_for_status()
+    stop = threading.Event()
+    statuses = []
+
+    def traffic():
+        while not stop.is_set():
+            statuses.append(client.get("/catalog/").status_code)
+            statuses.append(client.post("/carts/", json={"customer_name": "reset", "character_class": "Bard",
+                                                         "level": 1}).status_code)
+            statuses.append(client.get("/inventory/audit").status_code)
+
+    threads = [threading.Thread(target=traffic) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(0.2)
+        client.post("/admin/reset").raise_for_status()
+        reset_done = time.perf_counter()
+        audit = client.get("/inventory/audit").json()
+        first_response = time.perf_counter() - reset_done
+        cart = client.post("/carts/", json={"customer_name": "after", "character_class": "Bard", "level": 1})
+        time.sleep(0.2)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert audit == STARTING_AUDIT
+    assert first_response < 1
+    assert cart.status_code == 200
+    assert len(statuses) > 0 and set(statuses) == {200}
@@ -0,0 +1,44 @@
+import pytest
+import sqlalchemy
+
+NAMES = ["bram", "ada", "cy", "ada", "bram", "ada", "dee"]
+
+
+@pytest.fixture
+def history(client, engine):
+    """Carts with repeated customer names and one or two lines each. Returns (name, line id) per line."""
+    with engine.begin() as connection:
+        cart_ids = connection.execute(sqlalchemy.text(
+            "INSERT INTO carts (customer_name, character_class, level) "
+            "SELECT name, 'Bard', 1 FROM unnest(CAST(:names AS text[])) WITH ORDINALITY AS names (name, n) "
+            "ORDER BY n RETURNING id"), {"names": NAMES}).scalars().all()
+        lines = []
+        for i, cart_id in enumerate(cart_ids):
+            for sku in ["RED_POTION", "GREEN_POTION"][:1 + i % 2]:
+                line_id = connection.execute(sqlalchemy.text(
+                    "INSERT INTO cart_items (cart_id, item_sku, quantity) VALUES (:cart_id, :sku, 1) RETURNING id"),
+                    {"cart_id": cart_id, "sku": sku}).scalar_one()
+                lines.append((NAMES[i], line_id))
+    return lines
+
+
+def walk(client, sort_order):
+    page, seen = "", []
+    while True:
+        response = client.get("/carts/search/", params={"sort_col": "customer_name", "sort_order": sort_order,
+                                                         "search_page": page}).json()
+        seen += [(row["customer_name"], row["line_item_id"]) for row in response["results"]]
+        if response["next"] == "":
+            return seen, response["previous"]
+        page = response["next"]
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_customer_name_pages_follow_name_then_line(client, history, sort_order):
+    seen, previous = walk(client, sort_order)
+
+    assert seen == sorted(history, reverse=sort_order == "desc")
+    # Ten lines make two pages; walking back from the last returns the first.
+    back = client.get("/carts/search/", params={"sort_col": "customer_name", "sort_order": sort_order,
+                                                "search_page": previous}).json()
+    assert [(row["customer_name"], row["line_item_id"]) for row in back["results"]] == seen[:5]